@@ -0,0 +1,150 @@
+from web3 import Web3
+from web3.eth import AsyncEth
+from web3.providers.async_rpc import AsyncHTTPProvider
+import ccxt.async_support as ccxt_async
+import aiohttp
+import asyncio
+import json
+from requests.exceptions import ConnectionError
+from typing import Optional, Dict, Tuple, Iterable, Any, Awaitable, Union
+from web3.types import ChecksumAddress, Address, ENS
+from dotenv import load_dotenv
+import os
+import time
+from snapshotFetcher import OnChainSnapshotFetcher
+from priceFetcher import PriceFetcher
+from binanceAccountFetcher import BinanceAccountInfo
+from web3Registry import Web3Registry
+from rateLimiter import RateLimiter, throttle_async_exchange, PRIORITY_CRITICAL
+from metrics import async_web3_metrics_middleware, aiohttp_trace_config, instrument_async_exchange, call_site
+from util.binancePairsEnumType import BinancePairsEnumType
+
+load_dotenv()
+
+
+class AsyncBalanceCollector:
+
+    def __init__(self, infura_api_key: Optional[str] = os.getenv('INFURA_API_KEY'),
+                 binance_api_key: Optional[str] = os.getenv('BINANCE_API_KEY'),
+                 binance_secret_key: Optional[str] = os.getenv('BINANCE_SECRET_KEY'),
+                 wallet_adr: Union[ChecksumAddress, ENS, Address, Optional[str]] = os.getenv('WALLET_ADDRESS'),
+                 gmx_index_assets: Tuple[str, ...] = ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI'),
+                 binance_price_tokens: Tuple[str, ...] = ("BTC", "ETH", 'UNI', 'LINK', 'GMX', "DAI", "USDC", "USDT"),
+                 pairs: Iterable[str] = BinancePairsEnumType._member_names_,
+                 max_concurrency: int = 8
+                 ):
+        """
+        Collects every remote input of BalanceProcessor concurrently: one async Multicall to Infura, the Binance
+        account and market data through ccxt.async_support and CoinGecko through aiohttp. At most max_concurrency
+        requests are in flight at any time.
+        The result is passed to BalanceProcessor(collected=...)
+        """
+        self.infura_api_key = infura_api_key
+        self.binance_api_key = binance_api_key
+        self.binance_secret_key = binance_secret_key
+        self.wallet_adr = wallet_adr
+        self.gmx_index_assets = gmx_index_assets
+        self.binance_price_tokens = binance_price_tokens
+        self.pairs = list(pairs)
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # only used to encode / decode the aggregate, the request itself goes through the async provider
+        self.snapshot_fetcher = OnChainSnapshotFetcher(infura_api_key=infura_api_key,
+                                                       wallet_adr=wallet_adr,
+                                                       gmx_index_assets=gmx_index_assets)
+
+    async def _bounded(self, awaitable: Awaitable) -> Any:
+        async with self._semaphore:  # type: ignore
+            return await awaitable
+
+    async def _get_snapshot(self) -> Dict[str, Any]:
+        # the async provider has no pool, it takes the first of several RPC_URLS
+        conn = Web3(AsyncHTTPProvider(Web3Registry.infura_url(self.infura_api_key).split(',')[0]),
+                    modules={'eth': (AsyncEth,)}, middlewares=[async_web3_metrics_middleware])
+        response = await self._bounded(conn.eth.call(self.snapshot_fetcher.get_aggregate_request()))
+
+        return self.snapshot_fetcher.decode_aggregate_response(bytes(response))
+
+    async def _get_price_coingecko(self, session: aiohttp.ClientSession) -> Dict[str, float]:
+        target_tokens: Tuple[str, ...] = ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI', 'GMX')
+        url = PriceFetcher._coingecko_url('arbitrum-one', 'usd', target_tokens)
+
+        # the bucket is shared with the sync fetchers, waiting for it must not block the event loop
+        await asyncio.get_running_loop().run_in_executor(None, RateLimiter.acquire, 'coingecko')
+        async with self._semaphore:  # type: ignore
+            async with session.get(url) as res:
+                text = await res.text()
+        RateLimiter.observe_response('coingecko', res.status, res.headers)
+
+        if res.status != 200:
+            raise ConnectionError(json.loads(text)["status"]['error_message'])
+
+        return PriceFetcher._parse_coingecko(json.loads(text), target_tokens)
+
+    async def _get_price_binance(self, exchange: ccxt_async.binance) -> Dict[str, float]:
+        price_dict: Optional[Dict[str, float]]
+        if PriceFetcher.price_book is not None:
+            price_dict = PriceFetcher.price_book.get_prices(self.binance_price_tokens,
+                                                            max_age=PriceFetcher.price_book_max_age)
+            if price_dict is not None:
+                return price_dict
+
+        tokens = [token for token in self.binance_price_tokens if token != 'USDT']
+        ohlcvs = await asyncio.gather(*[self._bounded(exchange.fetch_ohlcvc(token + 'USDT')) for token in tokens])
+
+        price_dict = {token: ohlcv[-1][-3] for token, ohlcv in zip(tokens, ohlcvs)}
+        if 'USDT' in self.binance_price_tokens:
+            price_dict['USDT'] = 1
+
+        return price_dict
+
+    async def _get_binance_summary(self, account: ccxt_async.binance,
+                                   futures: ccxt_async.binanceusdm) -> Dict[str, Union[Dict, float]]:
+        balance, positions, premium_index = await asyncio.gather(
+            self._bounded(account.fetch_balance()),
+            self._bounded(account.fetch_positions()),
+            self._bounded(futures.fapiPublicGetPremiumIndex()))
+
+        funding_rates: Dict[str, float] = BinanceAccountInfo._parse_premium_index(premium_index, self.pairs)
+
+        return {'hedge': BinanceAccountInfo._parse_hedge_info(positions, self.pairs, funding_rates),
+                'amount': BinanceAccountInfo._parse_balance_amount(balance),
+                'margin_ratio': BinanceAccountInfo._parse_total_margin_ratio(balance)}
+
+    async def collect(self) -> Dict[str, Any]:
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # on the Binance budgets shared with the sync fetchers, the account goes first as in BinanceAccountInfo
+        account = throttle_async_exchange(instrument_async_exchange(ccxt_async.binance({
+            'apiKey': self.binance_api_key,
+            'secret': self.binance_secret_key,
+            'options': {'defaultType': 'future'}})), PRIORITY_CRITICAL)
+        market = throttle_async_exchange(instrument_async_exchange(ccxt_async.binance()))
+        futures = throttle_async_exchange(instrument_async_exchange(ccxt_async.binanceusdm()))
+
+        # every task runs on this thread, the call site labels all of their requests
+        try:
+            with call_site('AsyncBalanceCollector.collect'):
+                async with aiohttp.ClientSession(trace_configs=[aiohttp_trace_config()]) as session:
+                    snapshot, price_coingecko, price_binance, binance_summary = await asyncio.gather(
+                        self._get_snapshot(),
+                        self._get_price_coingecko(session),
+                        self._get_price_binance(market),
+                        self._get_binance_summary(account, futures))
+        finally:
+            await asyncio.gather(account.close(), market.close(), futures.close())
+
+        return {'snapshot': snapshot,
+                'price_dict_binance': price_binance,
+                'price_dict_coingecko': price_coingecko,
+                'binance_summary': binance_summary}
+
+    def collect_sync(self) -> Dict[str, Any]:
+        return asyncio.run(self.collect())
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    test = AsyncBalanceCollector()
+    print(test.collect_sync())
+    print(f'process time is: {time.time() - start_time}')
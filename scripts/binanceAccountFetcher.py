@@ -1,28 +1,56 @@
-import ccxt
-from typing import Dict, Optional, Iterable, List, Union
+from typing import Dict, Optional, Iterable, List, Union, TYPE_CHECKING
 import os
 from dotenv import load_dotenv
 from util.binancePairsEnumType import BinancePairsEnumType
+from cycleCache import cached
+from metrics import instrument_exchange
+from rateLimiter import throttle_exchange, PRIORITY_CRITICAL
 load_dotenv()
 import time
+import threading
+
+if TYPE_CHECKING:
+    import ccxt
 
 
 class BinanceAccountInfo:
+    # public USD-M futures client shared by every instance, created once per process
+    _futures_client: Optional['ccxt.binanceusdm'] = None
+    _futures_lock = threading.Lock()
 
     def __init__(self, binance_api_key: Optional[str] = os.getenv('BINANCE_API_KEY'),
                  binance_secret_key: Optional[str] = os.getenv('BINANCE_SECRET_KEY')):
         self.api_key = binance_api_key
         self.secret_key = binance_secret_key
-        self._conn = ccxt.binance({
+        # ccxt is imported on first use, scripts that never reach Binance do not pay for it
+        import ccxt
+
+        # balances and positions feed the margin ratio, they go ahead of market data on the shared weight budget
+        self._conn = throttle_exchange(instrument_exchange(ccxt.binance({
             'apiKey': self.api_key,
             'secret': self.secret_key,
             'options': {
                 'defaultType': 'future'
             }
-        })
+        })), PRIORITY_CRITICAL)
+        # instances on the same account share cached responses
+        self._cache_key = self.api_key
+
+    @cached('binance_account')
+    def _fetch_balance(self) -> Dict:
+        return self._conn.fetch_balance()
+
+    @cached('binance_account')
+    def _fetch_positions(self) -> List[Dict]:
+        return self._conn.fetch_positions()
 
     def get_balance_amount(self) -> Dict[str, float]:
-        balance = self._conn.fetch_balance()
+        balance = self._fetch_balance()
+
+        return self._parse_balance_amount(balance)
+
+    @staticmethod
+    def _parse_balance_amount(balance: Dict) -> Dict[str, float]:
         amount_balance: Dict = {}
 
         for token in balance['info']['assets']:
@@ -31,14 +59,18 @@ class BinanceAccountInfo:
         return amount_balance
 
     def get_total_margin_ratio(self) -> float:
+        balance = self._fetch_balance()
+
+        return self._parse_total_margin_ratio(balance)
+
+    @staticmethod
+    def _parse_total_margin_ratio(balance: Dict) -> float:
 
         stable_list: List = ['USDT', 'BUSD']
 
         total_maintenance_margin: float = 0
         total_margin: float = 0
 
-        balance = self._conn.fetch_balance()
-
         for token in balance['info']['assets']:
             if token['asset'] in stable_list:
                 total_margin += float(token['marginBalance'])
@@ -47,40 +79,72 @@ class BinanceAccountInfo:
         return total_maintenance_margin / total_margin
 
     def get_hedge_info(self, pairs: Iterable[str] = BinancePairsEnumType._member_names_) -> Dict[str, float]:
-        balance = self._conn.fetch_positions()
+        # read twice below, a generator would be empty the second time
+        pairs = tuple(pairs)
+        balance = self._fetch_positions()
+        funding_rates: Dict[str, float] = self.get_funding_rates(pairs)
+
+        return self._parse_hedge_info(balance, pairs, funding_rates)
+
+    @staticmethod
+    def _parse_hedge_info(balance: List[Dict], pairs: Iterable[str], funding_rates: Dict[str, float]) -> Dict:
         info_dict: Dict = {'notional': {}, 'unrealizedProfit': {}, 'positionAmt':{},
                            'base': {}, 'quote': {}, 'funding_rate': {}, 'leverage': {}}
+        positions: Dict[str, Dict] = {position['info']['symbol']: position for position in balance}
+
         for pair in pairs:
-            for position in balance:
-                if pair == position['info']['symbol']:
-                    info_dict['notional'][pair] = float(position['info']['notional'])
-                    info_dict['unrealizedProfit'][pair] = float(position['info']['unRealizedProfit'])
-                    info_dict['positionAmt'][pair] = float(position['info']['positionAmt'])
-                    info_dict['base'][pair] = position['info']['symbol'][:-4]
-                    info_dict['quote'][pair] = position['info']['symbol'][-4:]
-                    info_dict['funding_rate'][pair] = self.get_funding_rate(pair)
-                    info_dict['leverage'][pair] = 0
-
-                    if float(position['info']['positionAmt']) != 0:
-                        info_dict['leverage'][pair] = float(position['leverage'])
+            position = positions.get(pair)
+            if position is None:
+                continue
+
+            info_dict['notional'][pair] = float(position['info']['notional'])
+            info_dict['unrealizedProfit'][pair] = float(position['info']['unRealizedProfit'])
+            info_dict['positionAmt'][pair] = float(position['info']['positionAmt'])
+            info_dict['base'][pair] = position['info']['symbol'][:-4]
+            info_dict['quote'][pair] = position['info']['symbol'][-4:]
+            # a pair premiumIndex does not list, e.g. a delisted one, has no funding
+            info_dict['funding_rate'][pair] = funding_rates.get(pair, 0.0)
+            info_dict['leverage'][pair] = 0
+
+            if float(position['info']['positionAmt']) != 0:
+                info_dict['leverage'][pair] = float(position['leverage'])
 
         return info_dict
 
     @classmethod
-    def get_funding_rates(cls, pairs: Iterable[str] = BinancePairsEnumType._member_names_) -> Dict[str, float]:
+    def get_futures_client(cls) -> 'ccxt.binanceusdm':
+        with cls._futures_lock:
+            if cls._futures_client is None:
+                import ccxt
 
-        binanceusdm = ccxt.binanceusdm()
-        funding_dict: Dict = {}
+                cls._futures_client = throttle_exchange(instrument_exchange(ccxt.binanceusdm()))
 
-        for pair in pairs:
-            funding_dict[pair] = float(binanceusdm.fetchFundingRate(pair)['info']['lastFundingRate'])
+        return cls._futures_client
+
+    @staticmethod
+    def _parse_premium_index(premium_index: List[Dict], pairs: Iterable[str]) -> Dict[str, float]:
+        """
+        Pairs missing from premiumIndex are left out
+        """
+        rates: Dict[str, float] = {item['symbol']: float(item['lastFundingRate']) for item in premium_index}
+
+        return {pair: rates[pair] for pair in pairs if pair in rates}
+
+    @classmethod
+    @cached('binance_market')
+    def get_funding_rates(cls, pairs: Iterable[str] = BinancePairsEnumType._member_names_) -> Dict[str, float]:
+        """
+        One premiumIndex request returns the last funding rate of every USD-M symbol
+        """
+        premium_index = cls.get_futures_client().fapiPublicGetPremiumIndex()
 
-        return funding_dict
+        return cls._parse_premium_index(premium_index, pairs)
 
     @classmethod
+    @cached('binance_market')
     def get_funding_rate(cls, pair: str) -> float:
-        binanceusdm = ccxt.binanceusdm()
-        return float(binanceusdm.fetchFundingRate(pair)['info']['lastFundingRate'])
+        premium_index = cls.get_futures_client().fapiPublicGetPremiumIndex({'symbol': pair})
+        return float(premium_index['lastFundingRate'])
 
     def get_summary(self) -> Dict[str, Union[Dict, float]]:
         return {'hedge': self.get_hedge_info(),
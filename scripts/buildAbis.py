@@ -0,0 +1,106 @@
+import json
+import pprint
+import time
+from typing import Dict, List, Tuple, Any
+from eth_utils import function_abi_to_4byte_selector, event_abi_to_log_topic
+from util.contractInfoEnumType import ContractAbiEnumType
+from util.tokensInfoEnumType import TokenAbiEnumType
+
+OUTPUT_PATH = 'util/compactAbi.py'
+
+# functions and events the scripts actually use, per ABI enum
+TOKEN_FRAGMENTS: Tuple[str, ...] = ('balanceOf', 'totalSupply', 'decimals', 'Transfer')
+USED_FRAGMENTS: Dict[str, Tuple[str, ...]] = {
+    'ContractAbiEnumType.GLPManager': ('getAum',),
+    'ContractAbiEnumType.vault': ('getMinPrice', 'IncreasePoolAmount', 'DecreasePoolAmount', 'IncreaseReservedAmount',
+                                  'DecreaseReservedAmount'),
+    'ContractAbiEnumType.FeeGlpTracker': ('stakedAmounts', 'depositBalances', 'claimable', 'Transfer'),
+    'ContractAbiEnumType.StakedGmxTracker': ('stakedAmounts', 'depositBalances', 'Transfer'),
+    'ContractAbiEnumType.Reader': ('getVaultTokenInfoV2', 'getTokenBalances', 'getPositions'),
+    'ContractAbiEnumType.RewardReader': ('getStakingInfo', 'getDepositBalances'),
+    'ContractAbiEnumType.Multicall': ('aggregate', 'getBlockNumber', 'getCurrentBlockTimestamp', 'getEthBalance'),
+    **{f'TokenAbiEnumType.{member.name}': TOKEN_FRAGMENTS for member in TokenAbiEnumType},
+}
+
+
+def _canonical_type(param: Dict[str, Any]) -> str:
+    """
+    ABI type string, tuples spelled out as (type,type) the way eth_abi expects them
+    """
+    if param['type'].startswith('tuple'):
+        return '(' + ','.join(_canonical_type(component) for component in param['components']) + ')' + \
+               param['type'][len('tuple'):]
+    return param['type']
+
+
+def compact(abi_key: str, full_abi: List[Dict[str, Any]]) -> Tuple[List[Dict], Dict[str, Tuple]]:
+    """
+    The used fragments of one ABI, stripped of internalType, and the (selector, input types, output types) of each
+    function
+    """
+    names = USED_FRAGMENTS[abi_key]
+    fragments: List[Dict] = []
+    selectors: Dict[str, Tuple] = {}
+
+    for fragment in full_abi:
+        if fragment.get('type') not in ('function', 'event') or fragment.get('name') not in names:
+            continue
+
+        fragment = json.loads(json.dumps(fragment).replace('"internalType"', '"_internalType"'))
+        _strip_internal_types(fragment)
+        fragments.append(fragment)
+
+        if fragment['type'] == 'function':
+            selectors[fragment['name']] = ('0x' + function_abi_to_4byte_selector(fragment).hex(),
+                                           tuple(_canonical_type(param) for param in fragment['inputs']),
+                                           tuple(_canonical_type(param) for param in fragment['outputs']))
+        else:
+            selectors[fragment['name']] = ('0x' + event_abi_to_log_topic(fragment).hex(),
+                                           tuple(_canonical_type(param) for param in fragment['inputs']), ())
+
+    missing = set(names) - {fragment['name'] for fragment in fragments} - set(TOKEN_FRAGMENTS)
+    if missing:
+        raise KeyError(f'{abi_key} has no fragment named {sorted(missing)}')
+
+    return fragments, selectors
+
+
+def _strip_internal_types(value: Any) -> None:
+    if isinstance(value, dict):
+        value.pop('_internalType', None)
+        for item in value.values():
+            _strip_internal_types(item)
+    elif isinstance(value, list):
+        for item in value:
+            _strip_internal_types(item)
+
+
+def build(output_path: str = OUTPUT_PATH) -> Dict[str, int]:
+    abis: Dict[str, List[Dict]] = {}
+    selectors: Dict[str, Dict[str, Tuple]] = {}
+    sizes: Dict[str, int] = {}
+
+    for enum_type in (ContractAbiEnumType, TokenAbiEnumType):
+        for member in enum_type:
+            abi_key = f'{enum_type.__name__}.{member.name}'
+            if abi_key not in USED_FRAGMENTS:
+                continue
+            abis[abi_key], selectors[abi_key] = compact(abi_key, json.loads(member.value))
+            sizes[abi_key] = len(member.value)
+
+    with open(output_path, 'w') as f:
+        f.write('# Generated by buildAbis.py from contractInfoEnumType.py and tokensInfoEnumType.py, do not edit.\n'
+                '# Only the fragments the scripts use are kept, rerun buildAbis.py after calling a new function\n'
+                'from typing import Dict, List, Tuple\n\n'
+                f'ABIS: Dict[str, List[Dict]] = {pprint.pformat(abis, width=120, sort_dicts=False)}\n\n'
+                '# abi key -> function or event name -> (selector or topic, input types, output types)\n'
+                f'SELECTORS: Dict[str, Dict[str, Tuple]] = {pprint.pformat(selectors, width=120)}\n')
+
+    return sizes
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    full_sizes = build()
+    print(f'{len(full_sizes)} ABIs compacted from {sum(full_sizes.values())} bytes of JSON into {OUTPUT_PATH}')
+    print(f'process time is: {time.time() - start_time}')
@@ -0,0 +1,146 @@
+import pandas as pd
+import datetime
+import threading
+import time
+from typing import Dict, List, Tuple, Any, Optional
+
+
+class ChangeFilter:
+    """
+    Differential writes: a row is kept only when its amount moved beyond the tolerance, or its notional beyond the
+    looser price tolerance, since the last written row of the same key, or when that row is older than the
+    heartbeat. Rows that are dropped are reconstructed on read by densify(), which forward-fills the last written
+    value
+    """
+
+    # table -> (index of the key columns, index of the amount columns, index of the notional columns) in
+    # DatabaseInserter row order. The notional moves with every price tick while the amount stays flat, it is watched
+    # at the looser price_tolerance so densify() never forward-fills a badly stale value. The unrealized profit of
+    # an unchanged position moves by exactly as much as its notional and sits around zero, where any relative
+    # tolerance fires every cycle, so it is covered by the notional
+    TABLES: Dict[str, Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]] = {
+        'gmx_account': ((4, 5), (2,), (3,)),
+        'metamask_account': ((4, 5), (2,), (3,)),
+        'binance_hedge_account': ((5, 6, 8), (2,), (3,)),
+    }
+
+    def __init__(self, relative_tolerance: float = 1e-4, absolute_tolerance: float = 1e-9,
+                 heartbeat: float = 21600, price_tolerance: float = 0.01):
+        """
+        relative_tolerance, absolute_tolerance: an amount has moved when |new - old| > max(rel * |old|, abs)
+        price_tolerance: the relative tolerance of the notional, the forward-filled notional and unrealized profit are
+        at most this far off
+        heartbeat: seconds after which a row is written even when nothing moved, with 10 minute cycles it caps the
+        reduction at heartbeat / 600 rows
+        """
+        self.relative_tolerance = relative_tolerance
+        self.absolute_tolerance = absolute_tolerance
+        self.price_tolerance = price_tolerance
+        self.heartbeat = heartbeat
+        # table -> key -> (amounts, notionals, created time of the last written row)
+        self._last: Dict[str, Dict[Tuple, Tuple[Tuple[float, ...], Tuple[float, ...], datetime.datetime]]] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {'kept': 0, 'dropped': 0}
+
+    def _moved(self, old: Tuple[float, ...], new: Tuple[float, ...], relative_tolerance: float) -> bool:
+        return any(abs(n - o) > max(relative_tolerance * abs(o), self.absolute_tolerance)
+                   for o, n in zip(old, new))
+
+    def apply(self, rows: Dict[str, List[List]]) -> Dict[str, List[List]]:
+        """
+        Filtered copy of the snapshot rows, tables without a rule are kept as they are.
+        The state is only advanced by mark_written(), once the rows are safely stored
+        """
+        filtered: Dict[str, List[List]] = {}
+
+        with self._lock:
+            for table, table_rows in rows.items():
+                if table not in self.TABLES:
+                    filtered[table] = table_rows
+                    continue
+
+                key_columns, amount_columns, notional_columns = self.TABLES[table]
+                last = self._last.get(table, {})
+                kept = []
+                for row in table_rows:
+                    previous = last.get(tuple(row[i] for i in key_columns))
+                    # column 0 is created_date
+                    if (previous is None
+                            or self._moved(previous[0], tuple(row[i] for i in amount_columns), self.relative_tolerance)
+                            or self._moved(previous[1], tuple(row[i] for i in notional_columns), self.price_tolerance)
+                            or (row[0] - previous[2]).total_seconds() >= self.heartbeat):
+                        kept.append(row)
+
+                self.stats['kept'] += len(kept)
+                self.stats['dropped'] += len(table_rows) - len(kept)
+                filtered[table] = kept
+
+        return filtered
+
+    def mark_written(self, rows: Dict[str, List[List]]) -> None:
+        with self._lock:
+            for table, table_rows in rows.items():
+                if table not in self.TABLES:
+                    continue
+
+                key_columns, amount_columns, notional_columns = self.TABLES[table]
+                last = self._last.setdefault(table, {})
+                for row in table_rows:
+                    last[tuple(row[i] for i in key_columns)] = (tuple(row[i] for i in amount_columns),
+                                                                tuple(row[i] for i in notional_columns), row[0])
+
+
+def densify(rows: pd.DataFrame, key_columns: List[str], freq: str = '10min',
+            start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None) -> pd.DataFrame:
+    """
+    Rebuilds the dense time series from differential rows: one row per key and freq step between start and end,
+    each carrying the last written values at that time
+    rows: table rows with a created_date column, e.g. pd.read_sql('SELECT * FROM gmx_account', con)
+    """
+    rows = rows.sort_values('created_date')
+    start = start if start is not None else rows['created_date'].min()
+    end = end if end is not None else rows['created_date'].max()
+    grid = pd.date_range(pd.Timestamp(start).floor(freq), end, freq=freq)
+
+    dense = []
+    for key, group in rows.groupby(key_columns):
+        group = group.drop_duplicates('created_date', keep='last').set_index('created_date')
+        # rows written before start still provide the value at start
+        filled = group.reindex(group.index.union(grid)).ffill().loc[grid]
+        filled = filled.dropna(how='all')
+        dense.append(filled.rename_axis('created_date').reset_index())
+
+    if not dense:
+        return rows.iloc[0:0]
+
+    return pd.concat(dense, ignore_index=True)
+
+
+def read_dense(con: Any, table: str, key_columns: List[str], start: datetime.datetime, end: datetime.datetime,
+               freq: str = '10min') -> pd.DataFrame:
+    """
+    Reads a differentially written table between start and end as a dense series. The last row of each key before
+    start is read as well so the series does not begin with a gap
+    """
+    keys = ', '.join(key_columns)
+    before = pd.read_sql(f'SELECT t.* FROM {table} t JOIN (SELECT {keys}, MAX(created_date) AS created_date '
+                         f'FROM {table} WHERE created_date < %s GROUP BY {keys}) last USING ({keys}, created_date)',
+                         con, params=[start])
+    within = pd.read_sql(f'SELECT * FROM {table} WHERE created_date BETWEEN %s AND %s', con, params=[start, end])
+
+    return densify(pd.concat([before, within], ignore_index=True), key_columns, freq, start, end)
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    change_filter = ChangeFilter()
+    now = datetime.datetime.now()
+    for step in range(3):
+        created = now + datetime.timedelta(minutes=10 * step)
+        snapshot_rows = {'metamask_account': [[created, created, 1.0, 1500.0 + step, 'WETH', 'default'],
+                                              [created, created, 0.0, 0.0, 'DAI', 'default']]}
+        kept_rows = change_filter.apply(snapshot_rows)
+        change_filter.mark_written(kept_rows)
+        print(kept_rows)
+    print(change_filter.stats)
+    print(f'process time is: {time.time() - start_time}')
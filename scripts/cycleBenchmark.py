@@ -0,0 +1,412 @@
+import requests
+import argparse
+import base64
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Any, Callable, Tuple
+from urllib.parse import urlsplit, parse_qsl
+from dotenv import load_dotenv
+from dataProcessor import BalanceProcessor
+from dataBaseInserter import DatabaseInserter
+from databaseWriter import DatabaseWriter
+from cycleCache import CycleCache
+
+load_dotenv()
+
+# request parts that change on every call and are left out of the cassette key
+VOLATILE_PARAMS = ('timestamp', 'signature', 'recvWindow')
+REPLAY_URL_HEADER = 'X-Replay-Url'
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+class Cassette:
+    """
+    Recorded HTTP exchanges of one collection cycle: every JSON-RPC, Binance, CoinGecko and CoinMarketCap request
+    goes through requests.Session.send, which is where they are captured and later replayed
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._replayed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.misses: List[str] = []
+
+    @staticmethod
+    def _normalized_body(body: Any) -> Any:
+        if body is None:
+            return None
+        if isinstance(body, bytes):
+            body = body.decode()
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            # signed Binance requests carry a form body with a timestamp and signature
+            form = parse_qsl(body)
+            return sorted((k, v) for k, v in form if k not in VOLATILE_PARAMS) if form else body
+
+        # JSON-RPC ids increase with every request of the process
+        for call in payload if isinstance(payload, list) else [payload]:
+            if isinstance(call, dict):
+                call.pop('id', None)
+        return payload
+
+    @classmethod
+    def key(cls, method: str, url: str, body: Any) -> str:
+        parsed = urlsplit(url)
+        query = sorted((k, v) for k, v in parse_qsl(parsed.query) if k not in VOLATILE_PARAMS)
+
+        return json.dumps([method, parsed.netloc + parsed.path, query, cls._normalized_body(body)], sort_keys=True)
+
+    def record(self, key: str, response: requests.Response) -> None:
+        with self._lock:
+            self.entries.setdefault(key, []).append(
+                {'status': response.status_code,
+                 'headers': {k: v for k, v in response.headers.items() if k.lower() in ('content-type',)},
+                 'content': base64.b64encode(response.content).decode()})
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Recorded responses of a key are replayed in order, the last one is repeated once they run out
+        """
+        with self._lock:
+            responses = self.entries.get(key)
+            if not responses:
+                self.misses.append(key)
+                return None
+            index = self._replayed.get(key, 0)
+            self._replayed[key] = index + 1
+            return responses[min(index, len(responses) - 1)]
+
+    def rewind(self) -> None:
+        with self._lock:
+            self._replayed.clear()
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.entries, f)
+
+    def load(self) -> 'Cassette':
+        with open(self.path) as f:
+            self.entries = json.load(f)
+        return self
+
+
+class ReplayServer:
+    """
+    Local HTTP server answering from a cassette. The JSON-RPC id of each request is copied into the recorded
+    response so web3 accepts it
+    """
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _handler(self) -> type:
+        cassette = self.cassette
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self) -> None:
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else None
+                entry = cassette.lookup(cassette.key(self.command, self.headers[REPLAY_URL_HEADER], body))
+
+                if entry is None:
+                    self.send_response(599)
+                    self.end_headers()
+                    return
+
+                content = base64.b64decode(entry['content'])
+                if body is not None and entry['headers'].get('Content-Type', '').startswith('application/json'):
+                    content = self._with_ids(body, content)
+
+                self.send_response(entry['status'])
+                for name, value in entry['headers'].items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            @staticmethod
+            def _with_ids(body: bytes, content: bytes) -> bytes:
+                try:
+                    request, response = json.loads(body), json.loads(content)
+                except ValueError:
+                    return content
+                if isinstance(request, dict) and isinstance(response, dict) and 'id' in request:
+                    response['id'] = request['id']
+                elif isinstance(request, list) and isinstance(response, list):
+                    for call, result in zip(request, response):
+                        result['id'] = call.get('id')
+                else:
+                    return content
+                return json.dumps(response).encode()
+
+            do_GET = do_POST = do_DELETE = do_PUT = _reply
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> 'ReplayServer':
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, name='replay-server', daemon=True).start()
+        return self
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_address[1]}/'
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class _SqliteCursor:
+
+    def __init__(self, cur: sqlite3.Cursor):
+        self._cur = cur
+
+    @staticmethod
+    def _translate(sql: str) -> str:
+        return sql.replace('%s', '?').replace('INSERT IGNORE', 'INSERT OR IGNORE')
+
+    def execute(self, sql: str, params: Any = ()) -> None:
+        self._cur.execute(self._translate(sql), params)
+
+    def executemany(self, sql: str, params: Any) -> None:
+        self._cur.executemany(self._translate(sql), params)
+
+    def fetchall(self) -> List[Tuple]:
+        return self._cur.fetchall()
+
+    @property
+    def rowcount(self) -> int:
+        return self._cur.rowcount
+
+    @property
+    def description(self) -> Any:
+        return self._cur.description
+
+    def close(self) -> None:
+        self._cur.close()
+
+
+class SqliteConnection:
+    """
+    In-process stand-in for the MySQLdb connection used by DatabaseInserter and DatabaseWriter, with the tables of
+    database_creation.sql
+    """
+
+    def __init__(self, path: str = ':memory:'):
+        # the date columns come back as datetime, as from MySQLdb
+        self._con = sqlite3.connect(path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        for table, columns in DatabaseInserter.TABLE_COLUMNS.items():
+            columns = ', '.join(f'{column} timestamp' if column.endswith('_date') else column
+                                for column in columns.split(', '))
+            self._con.execute(f'CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, {columns})')
+        self._con.execute('CREATE TABLE IF NOT EXISTS snapshot_log (snapshot_key TEXT PRIMARY KEY)')
+
+    def cursor(self) -> _SqliteCursor:
+        return _SqliteCursor(self._con.cursor())
+
+    def commit(self) -> None:
+        self._con.commit()
+
+    def rollback(self) -> None:
+        self._con.rollback()
+
+    def ping(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class CycleBenchmark:
+    STAGES: Tuple[str, ...] = ('balance_processor', 'insert_summary_total_balance', 'insert_binance_hedge_account',
+                               'insert_gmx_account', 'insert_metamask_account', 'insert_gmx_total', 'insert_all')
+
+    def __init__(self, cassette: Cassette):
+        """
+        Runs the collection cycle with every HTTP request answered by the cassette, through a local replay server,
+        and MySQL replaced by SQLite. Reports wall time, remote calls and allocations per stage
+        """
+        self.cassette = cassette
+        self.server = ReplayServer(cassette)
+        self.con = SqliteConnection()
+        self.writer = DatabaseWriter(pool_size=1, connect=lambda: self.con)
+        self._calls = 0
+        self._calls_lock = threading.Lock()
+        self._original_send: Optional[Callable] = None
+
+    def _count_call(self) -> None:
+        with self._calls_lock:
+            self._calls += 1
+
+    def _patch_send(self, replay: bool) -> None:
+        original_send = self._original_send = requests.Session.send
+        benchmark = self
+
+        def send(session: requests.Session, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+            benchmark._count_call()
+            key = benchmark.cassette.key(request.method, request.url, request.body)
+
+            if not replay:
+                response = original_send(session, request, **kwargs)
+                benchmark.cassette.record(key, response)
+                return response
+
+            request.headers[REPLAY_URL_HEADER] = request.url
+            request.url = benchmark.server.url
+            return original_send(session, request, **kwargs)
+
+        requests.Session.send = send
+
+    def _unpatch_send(self) -> None:
+        if self._original_send is not None:
+            requests.Session.send = self._original_send
+            self._original_send = None
+
+    def _stage(self, stats: Dict[str, Dict[str, float]], name: str, run: Callable[[], Any]) -> Any:
+        calls_before = self._calls
+        tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        start_time = time.perf_counter()
+
+        result = run()
+
+        seconds = time.perf_counter() - start_time
+        memory_after, memory_peak = tracemalloc.get_traced_memory()
+        stats[name] = {'seconds': seconds,
+                       'calls': self._calls - calls_before,
+                       'allocated_kb': (memory_after - memory_before) / 1024,
+                       'peak_kb': (memory_peak - memory_before) / 1024}
+        return result
+
+    def run_cycle(self) -> Dict[str, Dict[str, float]]:
+        CycleCache.new_cycle()
+        self.cassette.rewind()
+        stats: Dict[str, Dict[str, float]] = {}
+
+        processor = self._stage(stats, 'balance_processor', BalanceProcessor)
+        inserter = DatabaseInserter(processor=processor, con=self.con)
+        for name in self.STAGES[1:-1]:
+            self._stage(stats, name, getattr(inserter, name))
+        self._stage(stats, 'insert_all', lambda: inserter.insert_all(self.writer))
+
+        return stats
+
+    def record(self) -> Dict[str, Dict[str, float]]:
+        self._patch_send(replay=False)
+        tracemalloc.start()
+        try:
+            stats = self.run_cycle()
+        finally:
+            tracemalloc.stop()
+            self._unpatch_send()
+        self.cassette.save()
+
+        return stats
+
+    def replay(self, repeat: int = 5) -> Dict[str, Dict[str, float]]:
+        """
+        Median of each measure over repeat cycles. Raises CassetteMiss when a request was not in the cassette, the
+        cycle took an error path then and its measures are not comparable to the baseline
+        """
+        self.cassette.misses.clear()
+        self.server.start()
+        self._patch_send(replay=True)
+        tracemalloc.start()
+        try:
+            runs = [self.run_cycle() for _ in range(repeat)]
+        finally:
+            tracemalloc.stop()
+            self._unpatch_send()
+            self.server.stop()
+
+        if self.cassette.misses:
+            raise CassetteMiss(f'{len(self.cassette.misses)} requests missing from the cassette, '
+                               f'first: {self.cassette.misses[0]}, record it again')
+
+        return {stage: {measure: statistics.median(run[stage][measure] for run in runs)
+                        for measure in runs[0][stage]}
+                for stage in runs[0]}
+
+    @staticmethod
+    def compare(stats: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                tolerance: float = 0.25, slack: float = 0.005) -> List[str]:
+        """
+        Regressions against the baseline: any extra remote call, or wall time above baseline * (1 + tolerance)
+        plus slack seconds
+        """
+        regressions = []
+        for stage, expected in baseline.items():
+            measured = stats.get(stage)
+            if measured is None:
+                continue
+            if measured['calls'] > expected['calls']:
+                regressions.append(f'{stage}: {measured["calls"]:.0f} calls, baseline {expected["calls"]:.0f}')
+            if measured['seconds'] > expected['seconds'] * (1 + tolerance) + slack:
+                regressions.append(f'{stage}: {measured["seconds"]:.4f}s, baseline {expected["seconds"]:.4f}s')
+
+        return regressions
+
+
+def _print_stats(stats: Dict[str, Dict[str, float]]) -> None:
+    print(f'{"stage":32} {"seconds":>10} {"calls":>6} {"alloc kB":>10} {"peak kB":>10}')
+    for stage, measures in stats.items():
+        print(f'{stage:32} {measures["seconds"]:10.4f} {measures["calls"]:6.0f} '
+              f'{measures["allocated_kb"]:10.1f} {measures["peak_kb"]:10.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record or replay one collection cycle and benchmark it offline')
+    parser.add_argument('mode', choices=('record', 'replay'))
+    parser.add_argument('--cassette', default='benchmark/cycle_cassette.json')
+    parser.add_argument('--baseline', default='benchmark/cycle_baseline.json')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.mode == 'record':
+        _print_stats(CycleBenchmark(Cassette(args.cassette)).record())
+        print(f'process time is: {time.time() - start_time}')
+        sys.exit(0)
+
+    try:
+        stats = CycleBenchmark(Cassette(args.cassette).load()).replay(repeat=args.repeat)
+    except CassetteMiss as e:
+        print(f'REGRESSION {e}')
+        sys.exit(1)
+    _print_stats(stats)
+    print(f'process time is: {time.time() - start_time}')
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(stats, f, indent=2)
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        regressions = CycleBenchmark.compare(stats, json.load(f), tolerance=args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    sys.exit(1 if regressions else 0)
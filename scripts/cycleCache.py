@@ -0,0 +1,155 @@
+from typing import Dict, Tuple, Any, Callable, Optional
+import functools
+import threading
+import time
+from metrics import call_site
+
+
+class _Flight:
+    """
+    A fetch in progress, concurrent callers of the same key wait for it instead of sending their own request
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class CycleCache:
+    """
+    Process-wide memoization of remote calls. Entries expire after the TTL of their source and are all dropped by
+    new_cycle(), so every remote resource is fetched at most once per collection cycle.
+    Cached results are shared between callers and must not be mutated
+    """
+
+    # seconds
+    TTL: Dict[str, float] = {'binance_account': 5,
+                             'binance_market': 10,
+                             'coingecko': 60,
+                             'coinmarketcap': 60,
+                             'infura': 10}
+
+    _entries: Dict[Tuple, Tuple[float, Any]] = {}
+    # expired entries are swept at most once per sweep_interval seconds, long-running collectors that never call
+    # new_cycle() would otherwise keep every block-keyed entry forever
+    sweep_interval: float = 60
+    _swept: float = 0.0
+    _flights: Dict[Tuple, _Flight] = {}
+    _hits: Dict[str, int] = {}
+    _misses: Dict[str, int] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_or_fetch(cls, source: str, key: Tuple, fetch: Callable[[], Any]) -> Any:
+        full_key = (source,) + key
+
+        with cls._lock:
+            entry = cls._entries.get(full_key)
+            if entry is not None and entry[0] > time.monotonic():
+                cls._hits[source] = cls._hits.get(source, 0) + 1
+                return entry[1]
+
+            flight = cls._flights.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                cls._flights[full_key] = flight
+                cls._misses[source] = cls._misses.get(source, 0) + 1
+            else:
+                cls._hits[source] = cls._hits.get(source, 0) + 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fetch()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with cls._lock:
+                now = time.monotonic()
+                if flight.error is None:
+                    cls._entries[full_key] = (now + cls.TTL.get(source, 0), flight.result)
+                del cls._flights[full_key]
+                if now - cls._swept >= cls.sweep_interval:
+                    cls._evict_expired(now)
+            flight.done.set()
+
+        return flight.result
+
+    @classmethod
+    def _evict_expired(cls, now: float) -> None:
+        """
+        Called with the lock held
+        """
+        for key in [key for key, (expires, _) in cls._entries.items() if expires <= now]:
+            del cls._entries[key]
+        cls._swept = now
+
+    @classmethod
+    def new_cycle(cls) -> None:
+        with cls._lock:
+            cls._entries.clear()
+            cls._hits.clear()
+            cls._misses.clear()
+
+    @classmethod
+    def stats(cls) -> Dict[str, Dict[str, int]]:
+        with cls._lock:
+            return {source: {'hits': cls._hits.get(source, 0), 'misses': cls._misses.get(source, 0)}
+                    for source in set(cls._hits) | set(cls._misses)}
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(value))
+    return value
+
+
+def cached(source: str) -> Callable:
+    """
+    Routes a fetcher method through CycleCache. Instances are told apart by their _cache_key attribute, so two
+    fetchers on the same account share their results; classes and plain arguments are part of the key as they are
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            owner = getattr(args[0], '_cache_key', args[0]) if args else None
+            key = (func.__qualname__, _freeze(owner), _freeze(args[1:]), _freeze(kwargs))
+
+            def fetch():
+                # remote calls made by the fetch are labelled with the fetcher method in the metrics
+                with call_site(func.__qualname__):
+                    return func(*args, **kwargs)
+
+            return CycleCache.get_or_fetch(source, key, fetch)
+
+        return wrapper
+
+    return decorator
+
+
+if __name__ == '__main__':
+    @cached('coingecko')
+    def slow_price(token: str) -> float:
+        time.sleep(1)
+        return 1.0
+
+    start_time = time.time()
+    threads = [threading.Thread(target=slow_price, args=('WETH',)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(CycleCache.stats())
+    print(f'process time is: {time.time() - start_time}')
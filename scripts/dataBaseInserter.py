@@ -1,46 +1,137 @@
-from apscheduler.schedulers.blocking import BlockingScheduler  # type: ignore
-import MySQLdb as mdb  # type: ignore
 from dataProcessor import BalanceProcessor
-from binanceAccountFetcher import BinanceAccountInfo
-from typing import List, Any, Dict
+from databaseWriter import DatabaseWriter
+from snapshotSpool import SnapshotSpool
+from changeFilter import ChangeFilter
+from metricRollup import MetricRollup
+from snapshotServer import SnapshotStore
+from typing import List, Any, Dict, Optional
 import datetime
 from util.binancePairsEnumType import BinancePairsEnumType
 import time
 from dotenv import load_dotenv
 import os
+import uuid
 
 load_dotenv()
 
 
 class DatabaseInserter:
+    # account is the last column of every table
+    TABLE_COLUMNS: Dict[str, str] = {
+        'summary_total_balance': 'created_date, updated_date, exchange_name, notional, wallet_balance, margin_ratio, '
+                                 'account',
+        'binance_hedge_account': 'created_date, updated_date, position_amount, notional, funding_rate, quote, '
+                                 'base, unrealized_profit, account',
+        'gmx_account': 'created_date, updated_date, position_amount, notional, symbol, account',
+        'metamask_account': 'created_date, updated_date, amount, notional, symbol, account',
+        'gmx_total': 'created_date, updated_date, long_positions, short_positions, reward_esgmx_amount, '
+                     'reward_weth_amount, reward_esgmx_notional, reward_weth_notional, '
+                     'reward_esgmx_cumulative_amount, reward_weth_cumulative_amount, '
+                     'reward_esgmx_cumulative_notional, reward_weth_cumulative_notional, account'
+    }
+
     def __init__(self, db_host: Any = os.getenv('DB_HOST'),
                  db_user: Any = os.getenv('DB_USER'),
                  db_pass: Any = os.getenv('DB_PASS'),
-                 db_name: Any = os.getenv('DB_NAME')
+                 db_name: Any = os.getenv('DB_NAME'),
+                 processor: Optional[BalanceProcessor] = None,
+                 con: Any = None,
+                 created_time: Optional[datetime.datetime] = None,
+                 account: str = os.getenv('ACCOUNT_NAME', 'default')
                  ):
+        """
+        con: an open connection to reuse, otherwise one is opened on the first insert
+        created_time: timestamp written to the rows, now by default, the block time when backfilling
+        account: name written to the account column, tells the wallets of a portfolio apart
+        """
         self.db_host = db_host
         self.db_user = db_user
         self.db_pass = db_pass
         self.db_name = db_name
-        self.con = mdb.connect(host=self.db_host, user=self.db_user, password=self.db_pass, db=self.db_name)
-
-        self.processor = BalanceProcessor()
-        self.created_time = datetime.datetime.now()
-        self.updated_time = datetime.datetime.now()
+        self._con = con
+
+        self.processor = processor if processor is not None else BalanceProcessor()
+        self.created_time = created_time if created_time is not None else datetime.datetime.now()
+        self.updated_time = self.created_time
+        self.account = account
+        # idempotency key of this snapshot, written to snapshot_log with its rows
+        self.snapshot_key = uuid.uuid4().hex
+
+    @property
+    def con(self) -> Any:
+        if self._con is None:
+            import MySQLdb as mdb  # type: ignore
+
+            self._con = mdb.connect(host=self.db_host, user=self.db_user, password=self.db_pass, db=self.db_name)
+
+        return self._con
+
+    @classmethod
+    def insert_sql(cls, table: str) -> str:
+        columns_str = cls.TABLE_COLUMNS[table]
+        insert_string = ('%s, ' * len(columns_str.split(',')))[:-2]
+
+        return f'INSERT INTO {table} ({columns_str}) VALUES ({insert_string})'
+
+    def get_snapshot_rows(self) -> Dict[str, List]:
+        return {'summary_total_balance': self._obtain_summary_total_balance_data(),
+                'gmx_account': self._obtain_gmx_account_data(),
+                'binance_hedge_account': self._obtain_binance_hedge_account_data(),
+                'metamask_account': self._obtain_metamask_account_data(),
+                'gmx_total': [self._obtain_gmx_toal_data()]}
+
+    @classmethod
+    def get_statements(cls) -> Dict[str, str]:
+        return {table: cls.insert_sql(table) for table in cls.TABLE_COLUMNS}
+
+    def insert_all(self, writer: DatabaseWriter, spool: Optional[SnapshotSpool] = None,
+                   change_filter: Optional[ChangeFilter] = None, rollup: bool = False) -> Dict[str, float]:
+        """
+        Writes the five tables in a single transaction through the writer's pooled connection. When the write
+        fails and a spool is given, the snapshot is spooled for a later replay instead of being lost.
+        change_filter: drops account rows whose amounts have not moved since they were last written
+        rollup: upserts the hourly, daily and weekly metric_rollup buckets in the same transaction
+        """
+        return self.write_rows(writer, self.get_snapshot_rows(), self.snapshot_key, spool=spool,
+                               change_filter=change_filter, rollup=rollup)
+
+    @classmethod
+    def write_rows(cls, writer: DatabaseWriter, rows: Dict[str, List], snapshot_key: str,
+                   spool: Optional[SnapshotSpool] = None, change_filter: Optional[ChangeFilter] = None,
+                   rollup: bool = False) -> Dict[str, float]:
+        """
+        insert_all for rows already built, e.g. the rows of every account of a portfolio in one transaction
+        """
+        # served by SnapshotServer whether or not the write below succeeds
+        SnapshotStore.publish(rows, cls.TABLE_COLUMNS, snapshot_key)
+        statements = cls.get_statements()
+        if rollup:
+            # from the full snapshot, before the change filter drops unchanged rows
+            statements['metric_rollup'] = MetricRollup.upsert_sql()
+            rows['metric_rollup'] = MetricRollup.rollup_rows(rows)
+        if change_filter is not None:
+            rows = change_filter.apply(rows)
+
+        try:
+            stats = writer.write_snapshot(statements, rows, snapshot_key=snapshot_key)
+        except Exception as e:
+            if spool is None:
+                raise
+            spool.append(snapshot_key, statements, rows)
+            print(f'Database write fails ({e}), snapshot {snapshot_key} spooled')
+
+            stats = {'rows': 0, 'skipped_snapshots': 0, 'seconds': 0, 'rows_per_second': 0, 'commit_latency': 0,
+                     'spooled_rows': sum(len(table_rows) for table_rows in rows.values())}
+
+        if change_filter is not None:
+            change_filter.mark_written(rows)
+
+        return stats
 
     def insert_summary_total_balance(self):
-        table = 'summary_total_balance'
-        # Create the insert string
-        columns_str = (
-            'created_date, updated_date, exchange_name, '
-            'notional, wallet_balance, margin_ratio '
-        )
-
-        insert_string = ('%s, ' * 6)[:-2]
-        final_string = f'INSERT INTO {table} ({columns_str}) VALUES ({insert_string})'
         data = self._obtain_summary_total_balance_data()
         cur = self.con.cursor()
-        cur.executemany(final_string, data)
+        cur.executemany(self.insert_sql('summary_total_balance'), data)
         self.con.commit()
 
     def _obtain_summary_total_balance_data(self):
@@ -55,26 +146,19 @@ class DatabaseInserter:
 
             if exchange == 'Binance':
                 wallet_balance = sum(self.processor.get_binance_wallet_balances()['notional'].values())
-                margin_ratio = BinanceAccountInfo().get_total_margin_ratio()
+                margin_ratio = self.processor.get_margin_ratio()
             else:
                 wallet_balance = 0
                 margin_ratio = 0
-            data_list.append([created_time, updated_time, exchange_name, notional, wallet_balance, margin_ratio])
+            data_list.append([created_time, updated_time, exchange_name, notional, wallet_balance, margin_ratio,
+                              self.account])
 
         return data_list
 
     def insert_binance_hedge_account(self):
-        table = 'binance_hedge_account'
-        columns_str = (
-            'created_date, updated_date, position_amount, '
-            'notional, funding_rate, quote, base, unrealized_profit '
-        )
-
-        insert_string = ('%s, ' * 8)[:-2]
-        final_string = f'INSERT INTO {table} ({columns_str}) VALUES ({insert_string})'
         data = self._obtain_binance_hedge_account_data()
         cur = self.con.cursor()
-        cur.executemany(final_string, data)
+        cur.executemany(self.insert_sql('binance_hedge_account'), data)
         self.con.commit()
 
     def _obtain_binance_hedge_account_data(self):
@@ -82,7 +166,8 @@ class DatabaseInserter:
 
         data_list: List = []
 
-        pairs = BinancePairsEnumType._member_names_
+        # an account without Binance keys, or without some of the pairs, has no rows for them
+        pairs = [pair for pair in BinancePairsEnumType._member_names_ if pair in hedge_dict['notional']]
 
         for pair in pairs:
             created_time = self.created_time
@@ -90,20 +175,13 @@ class DatabaseInserter:
 
             data_list.append([created_time, updated_time, hedge_dict['positionAmt'][pair],
                               hedge_dict['notional'][pair], hedge_dict['funding_rate'][pair], hedge_dict['quote'][pair],
-                              hedge_dict['base'][pair], hedge_dict['unrealizedProfit'][pair]])
+                              hedge_dict['base'][pair], hedge_dict['unrealizedProfit'][pair], self.account])
         return data_list
 
     def insert_gmx_account(self):
-        table = 'gmx_account'
-        columns_str = (
-            'created_date, updated_date, position_amount, '
-            'notional, symbol'
-        )
-        insert_string = ('%s, ' * 5)[:-2]
-        final_string = f'INSERT INTO {table} ({columns_str}) VALUES ({insert_string})'
         data = self._obtain_gmx_account_data()
         cur = self.con.cursor()
-        cur.executemany(final_string, data)
+        cur.executemany(self.insert_sql('gmx_account'), data)
         self.con.commit()
 
     def _obtain_gmx_account_data(self):
@@ -116,21 +194,14 @@ class DatabaseInserter:
             created_time = self.created_time
             updated_time = self.updated_time
             data_list.append([created_time, updated_time, gmx_dict['amount'][token],
-                              gmx_dict['notional'][token], token])
+                              gmx_dict['notional'][token], token, self.account])
 
         return data_list
 
     def insert_metamask_account(self):
-        table = 'metamask_account'
-        columns_str = (
-            'created_date, updated_date, amount, '
-            'notional, symbol'
-        )
-        insert_string = ('%s, ' * 5)[:-2]
-        final_string = f'INSERT INTO {table} ({columns_str}) VALUES ({insert_string})'
         data = self._obtain_metamask_account_data()
         cur = self.con.cursor()
-        cur.executemany(final_string, data)
+        cur.executemany(self.insert_sql('metamask_account'), data)
         self.con.commit()
 
     def _obtain_metamask_account_data(self):
@@ -144,22 +215,13 @@ class DatabaseInserter:
             updated_time = self.updated_time
 
             data_list.append([created_time, updated_time, metamask_dict['amount'][token],
-                              metamask_dict['notional'][token], token])
+                              metamask_dict['notional'][token], token, self.account])
         return data_list
 
     def insert_gmx_total(self):
-        table = 'gmx_total'
-        columns_str = (
-            'created_date, updated_date, long_positions, short_positions, '
-            'reward_esgmx_amount, reward_weth_amount, reward_esgmx_notional, reward_weth_notional,'
-            'reward_esgmx_cumulative_amount, reward_weth_cumulative_amount, reward_esgmx_cumulative_notional, '
-            'reward_weth_cumulative_notional'
-        )
-        insert_string = ('%s, ' * 12)[:-2]
-        final_string = f'INSERT INTO {table} ({columns_str}) VALUES ({insert_string})'
         data = self._obtain_gmx_toal_data()
         cur = self.con.cursor()
-        cur.execute(final_string, data)
+        cur.execute(self.insert_sql('gmx_total'), data)
         self.con.commit()
 
     def _obtain_gmx_toal_data(self):
@@ -182,7 +244,8 @@ class DatabaseInserter:
 
         data_list = [created_time, updated_time, long_positions, short_positions, reward_esgmx_amount,
                      reward_weth_amount, reward_esgmx_notional, reward_weth_notional, reward_esgmx_cumulative_amount,
-                     reward_weth_cumulative_amount, reward_esgmx_cumulative_notional, reward_weth_cumulative_notional]
+                     reward_weth_cumulative_amount, reward_esgmx_cumulative_notional, reward_weth_cumulative_notional,
+                     self.account]
 
         return data_list
 
@@ -1,19 +1,17 @@
-import MySQLdb as mdb  # type: ignore
 from glpFetcher import GLPDataFetcher  # type: ignore
 from priceFetcher import PriceFetcher
 from metamaskInfoFetcher import MetamaskInfoFetcher
 from binanceAccountFetcher import BinanceAccountInfo
+from snapshotFetcher import OnChainSnapshotFetcher
+from priceConsensus import PriceConsensus
 from util.binancePairsEnumType import BinancePairsEnumType
 import datetime
 import time
 from configparser import ConfigParser
 from dotenv import load_dotenv
 import os
-import statistics
 from typing import Dict, Union, Tuple, Optional, Any
-from web3.types import ChecksumAddress, Address, ENS
-from ccxt.base.errors import BadSymbol
-import asyncio
+from web3.types import ChecksumAddress, Address, ENS, BlockIdentifier
 
 
 class BalanceProcessor:
@@ -22,8 +20,19 @@ class BalanceProcessor:
                  binance_api_key: Optional[str] = os.getenv('BINANCE_API_KEY'),
                  binance_secret_key: Optional[str] = os.getenv('BINANCE_SECRET_KEY'),
                  wallet_adr: Union[ChecksumAddress, ENS, Address, Optional[str]] = os.getenv('WALLET_ADDRESS'),
-                 gmx_index_assets: Tuple[str, ...] = ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI')
+                 gmx_index_assets: Tuple[str, ...] = ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI'),
+                 use_multicall: bool = True,
+                 collected: Optional[Dict[str, Any]] = None,
+                 snapshot: Optional[Dict[str, Any]] = None,
+                 price_policies: Optional[Dict[str, Dict[str, Any]]] = None,
+                 block_identifier: BlockIdentifier = 'latest'
                  ):
+        """
+        collected: remote inputs gathered beforehand, e.g. by AsyncBalanceCollector.collect(), with the keys
+        'snapshot', 'price_dict_binance', 'price_dict_coingecko' and 'binance_summary'. Nothing is fetched again
+        snapshot: on-chain snapshot built elsewhere, e.g. by IncrementalChainState.get_snapshot()
+        price_policies: per-token overrides of PriceConsensus.POLICIES, e.g. {'WBTC': {'method': 'median'}}
+        """
 
         config = ConfigParser()
         config.read('config.ini')
@@ -34,22 +43,54 @@ class BalanceProcessor:
         self.binance_api_key = binance_api_key
         self.binance_secret_key = binance_secret_key
 
+        # One Multicall round-trip for every on-chain read of the cycle
+        self.snapshot: Optional[Dict] = None
+        if collected is not None:
+            self.snapshot = collected['snapshot']
+        elif snapshot is not None:
+            self.snapshot = snapshot
+        elif use_multicall:
+            self.snapshot = OnChainSnapshotFetcher(infura_api_key=self.infura_api_key,
+                                                   wallet_adr=self.wallet_adr,
+                                                   gmx_index_assets=self.gmx_index_assets,
+                                                   block_identifier=block_identifier).get_snapshot()
+
         self.gmx_fetcher = GLPDataFetcher(infura_api_key=self.infura_api_key,
                                           wallet_adr=self.wallet_adr,
-                                          gmx_index_assets=self.gmx_index_assets
+                                          gmx_index_assets=self.gmx_index_assets,
+                                          snapshot=self.snapshot,
+                                          block_identifier=block_identifier
                                           )
 
         self.metamask_fetcher = MetamaskInfoFetcher(infura_api_key=self.infura_api_key,
-                                                    wallet_adr=self.wallet_adr)
+                                                    wallet_adr=self.wallet_adr,
+                                                    snapshot=self.snapshot,
+                                                    block_identifier=block_identifier)
 
         self.binance_fetcher = BinanceAccountInfo(binance_api_key=self.binance_api_key,
                                                   binance_secret_key=self.binance_secret_key)
-        self.price_dict_binance = PriceFetcher().get_assets_price_binance(
-            target_tokens=("BTC", "ETH", 'UNI', 'LINK', 'GMX', "DAI", "USDC", "USDT", 'BUSD'))
-        self.price_dict_binance = PriceFetcher().get_assets_price_binance()
-        self.price_dict_coingecko = PriceFetcher().get_assets_price_coingecko()
-        self.price_dict_gmx = PriceFetcher().get_assets_price_gmx(infura_api_key=self.infura_api_key)
-        self.binance_summary = self.get_binance_assets_summary()
+        if collected is not None:
+            self.price_dict_binance = collected['price_dict_binance']
+            self.price_dict_coingecko = collected['price_dict_coingecko']
+        else:
+            self.price_dict_binance = PriceFetcher().get_assets_price_binance()
+            self.price_dict_coingecko = PriceFetcher().get_assets_price_coingecko()
+        if self.snapshot is not None:
+            self.price_dict_gmx = self.snapshot['gmx_price']
+        else:
+            self.price_dict_gmx = PriceFetcher().get_assets_price_gmx(infura_api_key=self.infura_api_key,
+                                                                      block_identifier=block_identifier)
+        # every summary values its tokens with the same consensus prices
+        self.price_consensus = PriceConsensus(policies=price_policies)
+        self.price_consensus.update('binance', self.price_dict_binance)
+        self.price_consensus.update('coingecko', self.price_dict_coingecko)
+        self.price_consensus.update('gmx', self.price_dict_gmx,
+                                    timestamp=self.snapshot['block_timestamp'] if self.snapshot is not None else None)
+        self.consensus_prices: Dict[str, float] = self.price_consensus.resolve()
+        if collected is not None:
+            self.binance_summary = collected['binance_summary']
+        else:
+            self.binance_summary = self.get_binance_assets_summary()
         self.metamask_summary = self.get_metamask_assets_summary()
         self.gmx_summary = self.get_gmx_assets_summary()
 
@@ -66,6 +107,8 @@ class BalanceProcessor:
         for token in amount_dict.keys():
             if token not in ['USDT', 'BUSD']:
                 if amount_dict[token] != 0:
+                    from ccxt.base.errors import BadSymbol
+
                     raise BadSymbol('Binance Futures wallet has non-stable assets')
             else:
                 wallet_dict[token] = 1 * amount_dict[token]
@@ -73,7 +116,7 @@ class BalanceProcessor:
         return {'notional': wallet_dict, 'amount': amount_dict}
 
     def get_margin_ratio(self):
-        return self.binance_fetcher.get_total_margin_ratio()
+        return self.binance_summary['margin_ratio']
 
     def _get_total_pnl(self):
         hedge_dict: Dict[str, float] = self.binance_summary['hedge']
@@ -89,16 +132,17 @@ class BalanceProcessor:
 
     def get_gmx_assets_summary(self):
         amount_dict: Dict = self._get_gmx_assets_amount()
+        price_dict: Dict[str, float] = self.consensus_prices
         notional_dict: Dict = {'GLP': self.gmx_fetcher.get_balance(), 'esGMX': amount_dict['esGMX'] * 0,
-                               'GMX': amount_dict['GMX'] * self.price_dict_binance['GMX'],
-                               'WBTC': amount_dict['WBTC'] * self.price_dict_gmx['WBTC'],
-                               'WETH': amount_dict['WETH'] * self.price_dict_gmx['WETH'],
-                               'LINK': amount_dict['LINK'] * self.price_dict_gmx['LINK'],
-                               'UNI': amount_dict['UNI'] * self.price_dict_gmx['UNI'],
-                               "FRAX": amount_dict['FRAX'] * self.price_dict_gmx['FRAX'],
-                               'DAI': amount_dict['DAI'] * self.price_dict_gmx['DAI'],
-                               'USDT': amount_dict['USDT'] * self.price_dict_gmx['USDT'],
-                               'USDC': amount_dict['USDC'] * self.price_dict_gmx['USDC']}
+                               'GMX': amount_dict['GMX'] * price_dict['GMX'],
+                               'WBTC': amount_dict['WBTC'] * price_dict['WBTC'],
+                               'WETH': amount_dict['WETH'] * price_dict['WETH'],
+                               'LINK': amount_dict['LINK'] * price_dict['LINK'],
+                               'UNI': amount_dict['UNI'] * price_dict['UNI'],
+                               "FRAX": amount_dict['FRAX'] * price_dict['FRAX'],
+                               'DAI': amount_dict['DAI'] * price_dict['DAI'],
+                               'USDT': amount_dict['USDT'] * price_dict['USDT'],
+                               'USDC': amount_dict['USDC'] * price_dict['USDC']}
 
         return {'notional': notional_dict, 'amount': amount_dict}
 
@@ -107,40 +151,19 @@ class BalanceProcessor:
 
     def get_metamask_assets_summary(self):
         amount_dict: Dict = self._get_metamask_assets_amount()
-        price_dict_binance: Dict[str, float] = self.price_dict_binance
-        price_dict_coingecko: Dict[str, float] = self.price_dict_coingecko
-        price_dict_gmx: Dict[str, float] = self.price_dict_gmx
+        # source mix per token (GMX mid, FRAX lower, USDT without Binance, mean otherwise) in PriceConsensus.POLICIES
+        price_dict: Dict[str, float] = self.consensus_prices
         notional_dict: Dict = {}
 
-        # For GMX price, will take the mid from Binance and Coingecko
-        notional_dict['GMX'] = amount_dict['GMX'] * (price_dict_coingecko['GMX'] + price_dict_binance['GMX']) / 2
-
         # For esGMX, since there is no instant liquidity without vesting, so the market value would be considered 0
         notional_dict['esGMX'] = amount_dict['esGMX'] * 0
 
-        # For Frax price, will take the lower one from GMX protocol and Coingecko
-        notional_dict['FRAX'] = amount_dict['FRAX'] * min(price_dict_gmx['FRAX'], price_dict_coingecko['FRAX'])
-
-        # For WBTC, WETH, though these are different from BTC and ETH, but unless there is hack to Arbitrum Cross Chain.
-        # It should be alright to use BTC and ETH as proxies.
-        notional_dict['WBTC'] = statistics.mean([price_dict_binance['BTC'],
-                                                 price_dict_gmx['WBTC'],
-                                                 price_dict_coingecko['WBTC']]) * amount_dict['WBTC']
-
-        notional_dict['ETH'] = statistics.mean([price_dict_binance['ETH'],
-                                                 price_dict_gmx['WETH'],
-                                                 price_dict_coingecko['WETH']]) * amount_dict['ETH']
-        # Since USDT is a quote currency in Binance, use mean price from coingecko and GMX.
+        for symbol in ('GMX', 'FRAX', 'WBTC', 'ETH', 'USDT'):
+            notional_dict[symbol] = amount_dict[symbol] * price_dict[symbol]
 
-        notional_dict['USDT'] = statistics.mean([price_dict_gmx['USDT'],
-                                                 price_dict_coingecko['USDT']]) * amount_dict['USDT']
-        # For the others , will take the middle price from sources
         for symbol in self.gmx_fetcher.gmx_index_assets:
             if symbol not in ['GMX', 'esGMX', 'FRAX', 'WBTC', 'WETH', 'USDT']:
-                notional_dict[symbol] = statistics.mean([price_dict_binance[symbol],
-                                                         price_dict_gmx[symbol],
-                                                         price_dict_coingecko[symbol]
-                                                         ]) * amount_dict[symbol]
+                notional_dict[symbol] = amount_dict[symbol] * price_dict[symbol]
 
         return {'notional': notional_dict, 'amount': amount_dict}
 
@@ -0,0 +1,174 @@
+import queue
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Iterator, Optional, Callable, Tuple
+from dotenv import load_dotenv
+import os
+from metrics import MetricsRegistry
+
+load_dotenv()
+
+
+class DatabaseWriter:
+
+    def __init__(self, db_host: Any = os.getenv('DB_HOST'),
+                 db_user: Any = os.getenv('DB_USER'),
+                 db_pass: Any = os.getenv('DB_PASS'),
+                 db_name: Any = os.getenv('DB_NAME'),
+                 pool_size: int = 2,
+                 health_check_interval: float = 30,
+                 connect: Optional[Callable[[], Any]] = None):
+        """
+        Keeps a small pool of persistent connections, reused across scheduler runs. A connection idle for longer
+        than health_check_interval seconds is pinged before use and replaced when the ping fails.
+        connect: connection factory, MySQLdb.connect with the given credentials by default
+        """
+        self.db_host = db_host
+        self.db_user = db_user
+        self.db_pass = db_pass
+        self.db_name = db_name
+        self.health_check_interval = health_check_interval
+        self._connect = connect if connect is not None else self._connect_mysql
+
+        # (connection, last time it was known healthy), connections are opened on first use
+        self.pool_size = pool_size
+        self._pool: queue.Queue = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put((None, 0.0))
+
+        self.last_stats: Dict[str, float] = {}
+
+    def _connect_mysql(self) -> Any:
+        # mysqlclient is imported on first use, the SQLite benchmark and the tools that never connect run without it
+        import MySQLdb as mdb  # type: ignore
+
+        return mdb.connect(host=self.db_host, user=self.db_user, password=self.db_pass, db=self.db_name)
+
+    def _checked(self, con: Any, last_used: float) -> Any:
+        if con is None:
+            return self._connect()
+
+        if time.monotonic() - last_used > self.health_check_interval:
+            try:
+                con.ping()
+            except Exception:
+                try:
+                    con.close()
+                except Exception:
+                    pass
+                return self._connect()
+
+        return con
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        con, last_used = self._pool.get()
+        healthy = False
+
+        try:
+            con = self._checked(con, last_used)
+            yield con
+            healthy = True
+        finally:
+            # a connection that failed midway is dropped and reopened on the next checkout
+            if not healthy and con is not None:
+                try:
+                    con.close()
+                except Exception:
+                    pass
+                con = None
+            self._pool.put((con, time.monotonic()))
+
+    @staticmethod
+    def multi_row_insert_sql(insert_sql: str, row_count: int) -> str:
+        """
+        Turns 'INSERT ... VALUES (%s, ...)' into one statement with row_count value groups, a trailing
+        ON DUPLICATE KEY UPDATE clause is kept once at the end
+        """
+        head, values = insert_sql.split(' VALUES ', 1)
+        group_end = values.index(')') + 1
+        return f'{head} VALUES ' + ', '.join([values[:group_end]] * row_count) + values[group_end:]
+
+    def write_snapshot(self, statements: Dict[str, str], rows: Dict[str, List[List]],
+                       snapshot_key: Optional[str] = None) -> Dict[str, float]:
+        """
+        Writes the rows of every table in one transaction, one multi-row INSERT per table. Either the whole
+        snapshot is committed or nothing is.
+        statements: table -> single-row INSERT statement, rows: table -> rows
+        snapshot_key: idempotency key recorded in snapshot_log, a snapshot whose key is already there is skipped
+        """
+        return self.write_snapshots(statements, [(snapshot_key, rows)])
+
+    def write_snapshots(self, statements: Dict[str, str],
+                        snapshots: List[Tuple[Optional[str], Dict[str, List[List]]]]) -> Dict[str, float]:
+        """
+        Writes several snapshots in one transaction, the rows of all of them are merged into one multi-row INSERT
+        per table
+        """
+        start_time = time.perf_counter()
+        row_count = 0
+        skipped = 0
+
+        with self.connection() as con:
+            cur = con.cursor()
+            try:
+                merged: Dict[str, List[List]] = {}
+                for snapshot_key, rows in snapshots:
+                    if snapshot_key is not None:
+                        with MetricsRegistry.timed('mysql_statement', table='snapshot_log'):
+                            cur.execute('INSERT IGNORE INTO snapshot_log (snapshot_key) VALUES (%s)',
+                                        [snapshot_key])
+                        if cur.rowcount == 0:
+                            skipped += 1
+                            continue
+                    for table, table_rows in rows.items():
+                        merged.setdefault(table, []).extend(table_rows)
+
+                for table, table_rows in merged.items():
+                    if not table_rows:
+                        continue
+                    params = [value for row in table_rows for value in row]
+                    with MetricsRegistry.timed('mysql_statement', table=table):
+                        cur.execute(self.multi_row_insert_sql(statements[table], len(table_rows)), params)
+                    MetricsRegistry.inc('mysql_rows_total', len(table_rows), table=table)
+                    row_count += len(table_rows)
+
+                commit_start = time.perf_counter()
+                with MetricsRegistry.timed('mysql_commit'):
+                    con.commit()
+                commit_latency = time.perf_counter() - commit_start
+            except BaseException:
+                con.rollback()
+                raise
+            finally:
+                cur.close()
+
+        elapsed = time.perf_counter() - start_time
+        self.last_stats = {'rows': row_count,
+                           'skipped_snapshots': skipped,
+                           'seconds': elapsed,
+                           'rows_per_second': row_count / elapsed if elapsed > 0 else 0,
+                           'commit_latency': commit_latency}
+
+        return self.last_stats
+
+    def close(self) -> None:
+        """
+        Closes every pooled connection, the writer stays usable and reconnects on the next checkout
+        """
+        for _ in range(self.pool_size):
+            con, _ = self._pool.get()
+            if con is not None:
+                con.close()
+            self._pool.put((None, 0.0))
+
+
+if __name__ == '__main__':
+    writer = DatabaseWriter()
+    with writer.connection() as con:
+        start_time = time.time()
+        cur = con.cursor()
+        cur.execute('SELECT 1')
+        print(cur.fetchall())
+        print(f'process time is: {time.time() - start_time}')
+    writer.close()
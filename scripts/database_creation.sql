@@ -7,6 +7,7 @@ exchange_name varchar(32) not null,
 notional decimal(32, 16) not null,
 wallet_balance decimal(32, 16) not null,
 margin_ratio decimal(32, 16) not null,
+account varchar(64) not null default 'default',
 primary key(id) 
 )ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8;
 
@@ -20,6 +21,7 @@ funding_rate decimal(32,16) not null,
 quote varchar(32) not null,
 base varchar(32) not null,
 unrealized_profit decimal(32) not null,
+account varchar(64) not null default 'default',
 primary key(id) 
 )ENGINE=InnoDB AUTO_INCREMENT=1;
 
@@ -33,6 +35,7 @@ notional decimal(32,16) not null,
 symbol varchar(32) not null,
 claimable decimal(32,16) not null,
 cumulative decimal(32,16) not null,
+account varchar(64) not null default 'default',
 primary key(id)
 )ENGINE=InnoDB AUTO_INCREMENT=1;
 
@@ -43,5 +46,77 @@ updated_date datetime not null,
 amount decimal(32,16) not null,
 notional decimal(32,16) not null,
 symbol varchar(32) not null,
+account varchar(64) not null default 'default',
 primary key(id)
-)ENGINE=InnoDB AUTO_INCREMENT=1;
\ No newline at end of file
+)ENGINE=InnoDB AUTO_INCREMENT=1;
+
+create table gmx_total(
+id int not null auto_increment,
+created_date datetime not null,
+updated_date datetime not null,
+long_positions decimal(32,16) not null,
+short_positions decimal(32,16) not null,
+reward_esgmx_amount decimal(32,16) not null,
+reward_weth_amount decimal(32,16) not null,
+reward_esgmx_notional decimal(32,16) not null,
+reward_weth_notional decimal(32,16) not null,
+reward_esgmx_cumulative_amount decimal(32,16) not null,
+reward_weth_cumulative_amount decimal(32,16) not null,
+reward_esgmx_cumulative_notional decimal(32,16) not null,
+reward_weth_cumulative_notional decimal(32,16) not null,
+account varchar(64) not null default 'default',
+primary key(id)
+)ENGINE=InnoDB AUTO_INCREMENT=1;
+
+create table snapshot_log(
+snapshot_key char(32) not null,
+created_date timestamp not null default current_timestamp,
+primary key(snapshot_key)
+)ENGINE=InnoDB;
+
+create table metric_rollup(
+granularity varchar(2) not null,
+bucket_start datetime not null,
+metric varchar(64) not null,
+account varchar(64) not null default 'default',
+series varchar(32) not null,
+open_value decimal(32,16) not null,
+close_value decimal(32,16) not null,
+min_value decimal(32,16) not null,
+max_value decimal(32,16) not null,
+sum_value decimal(40,16) not null,
+sample_count int not null,
+mean_value decimal(32,16) as (sum_value / sample_count),
+open_time datetime not null,
+close_time datetime not null,
+primary key(granularity, metric, account, series, bucket_start)
+)ENGINE=InnoDB;
+
+create table gmx_trader_position(
+id int not null auto_increment,
+created_date datetime not null,
+updated_date datetime not null,
+account char(42) not null,
+collateral_token varchar(32) not null,
+index_token varchar(32) not null,
+is_long boolean not null,
+size decimal(32,16) not null,
+collateral decimal(32,16) not null,
+average_price decimal(32,16) not null,
+leverage decimal(32,16) not null,
+entry_funding_rate decimal(32,16) not null,
+realised_pnl decimal(32,16) not null,
+unrealised_pnl decimal(32,16) not null,
+last_increased_time datetime not null,
+primary key(id),
+key(account, created_date)
+)ENGINE=InnoDB AUTO_INCREMENT=1;
+
+-- databases created before the account column, every insert names it and fails on a table without it:
+-- alter table summary_total_balance add account varchar(64) not null default 'default';
+-- alter table binance_hedge_account add account varchar(64) not null default 'default';
+-- alter table gmx_account add account varchar(64) not null default 'default';
+-- alter table metamask_account add account varchar(64) not null default 'default';
+-- alter table gmx_total add account varchar(64) not null default 'default';
+-- alter table metric_rollup add account varchar(64) not null default 'default' after metric,
+--     drop primary key, add primary key(granularity, metric, account, series, bucket_start);
@@ -1,17 +1,16 @@
 from web3 import HTTPProvider, Web3
 import json
-import requests
-from requests.exceptions import Timeout, TooManyRedirects, ConnectionError
-import ccxt
 from typing import Optional, List, Dict, Iterable, Tuple
 from dotenv import load_dotenv
 import os
 from util.tokensInfoEnumType import TokenAddressEnumType, TokenDecimalsEnumType, TokenAbiEnumType
 from util.contractInfoEnumType import ContractAddressEnumType, ContractAbiEnumType
-from web3.types import Address,ChecksumAddress
+from web3.types import Address, ChecksumAddress, BlockIdentifier
 import time
-import asyncio
 from priceFetcher import PriceFetcher
+from web3Registry import Web3Registry
+from cycleCache import cached
+from vaultState import VaultState
 
 load_dotenv()
 
@@ -21,36 +20,60 @@ class GLPDataFetcher:
     def __init__(self,
                  infura_api_key: Optional[str] =os.getenv('INFURA_API_KEY'),
                  wallet_adr: Optional[str] =os.getenv('WALLET_ADDRESS'),
-                 gmx_index_assets: Tuple[str, ...] =('WBTC','WETH','LINK','UNI','FRAX','USDT','USDC','DAI')
+                 gmx_index_assets: Tuple[str, ...] =('WBTC','WETH','LINK','UNI','FRAX','USDT','USDC','DAI'),
+                 snapshot: Optional[Dict] = None,
+                 block_identifier: BlockIdentifier = 'latest'
                  ):
-
-        infura_api_url = 'https://arbitrum-mainnet.infura.io/v3/'
-        infura_api_url = infura_api_url + infura_api_key
+        """
+        snapshot: result of OnChainSnapshotFetcher.get_snapshot(), when given the fetcher reads from it instead of
+        sending its own eth_calls
+        block_identifier: block every read is pinned to, so one fetcher never mixes several blocks
+        """
 
         self.gmx_index_assets = gmx_index_assets
-        self.conn = Web3(HTTPProvider(infura_api_url))
+        self.conn = Web3Registry.get_connection(Web3Registry.infura_url(infura_api_key))
         self.wallet_adr = wallet_adr
-        self.tokens_info = self._get_tokens_info()
-        self._staked_glp_amount = self.get_staked_glp_amount()
-        self._glp_supply = self._get_glp_supply()
-        self.glp_price_dict = self.get_glp_price()
-
-
+        self.snapshot = snapshot
+        self.block_identifier = block_identifier
+        self._cache_key = (wallet_adr, gmx_index_assets, block_identifier,
+                           None if snapshot is None else snapshot['block_number'])
+
+        if snapshot is not None:
+            self.tokens_info = snapshot['tokens_info']
+            self._staked_glp_amount = snapshot['staked_glp_amount']
+            self._glp_supply = snapshot['glp_supply']
+            self.glp_price_dict = snapshot['glp_price']
+        else:
+            self.tokens_info = self._get_tokens_info()
+            self._staked_glp_amount = self.get_staked_glp_amount()
+            self._glp_supply = self._get_glp_supply()
+            self.glp_price_dict = self.get_glp_price()
+
+
+    @cached('infura')
     def _get_glp_supply(self) -> float:
-        glp_contract = self.conn.eth.contract(address=TokenAddressEnumType.GLP.value,
-                                              abi=TokenAbiEnumType.GLP.value)
-        glp_total_supply = glp_contract.functions.totalSupply().call()
+        glp_contract = Web3Registry.get_contract(self.conn, TokenAddressEnumType.GLP.value, TokenAbiEnumType.GLP)
+        glp_total_supply = glp_contract.functions.totalSupply().call(block_identifier=self.block_identifier)
         return glp_total_supply  / 10 ** TokenDecimalsEnumType.GLP.value
 
+    @cached('infura')
     def get_claimable_info(self) -> Dict[str, float]:
-        reward_reader = self.conn.eth.contract(address=ContractAddressEnumType.RewardReader.value,
-                                                abi=ContractAbiEnumType.RewardReader.value)
+        if self.snapshot is not None:
+            return self.snapshot['claimable_info']
+
+        reward_reader = Web3Registry.get_contract(self.conn, ContractAddressEnumType.RewardReader.value,
+                                                  ContractAbiEnumType.RewardReader)
         address_list = [ContractAddressEnumType.StakedGmxTracker.value,
                         ContractAddressEnumType.FeeGmxTracker.value,
                         ContractAddressEnumType.FeeGlpTracker.value,
                         ContractAddressEnumType.StakedGlpTracker.value
                         ]
-        response = reward_reader.functions.getStakingInfo(self.wallet_adr, address_list).call()
+        response = reward_reader.functions.getStakingInfo(self.wallet_adr, address_list).call(block_identifier=self.block_identifier)
+
+        return self._parse_claimable_info(response)
+
+    @staticmethod
+    def _parse_claimable_info(response: List[int]) -> Dict[str, float]:
         response = [amount / 10**18 for amount in response]
 
         weth_claimable: float = response[5] + response[10]
@@ -61,16 +84,17 @@ class GLPDataFetcher:
         return {'weth_claimable':weth_claimable, 'weth_cumulative':weth_cumalative, 'esgmx_claimable':esgmx_claimable,
                 'esgmx_cumulative':esgmx_cumalative}
 
+    @cached('infura')
     def get_glp_price(self) -> Dict[str, float]:
-        glp_manager = self.conn.eth.contract(address=ContractAddressEnumType.GLPManager.value,
-                                             abi=ContractAbiEnumType.GLPManager.value)
+        glp_manager = Web3Registry.get_contract(self.conn, ContractAddressEnumType.GLPManager.value,
+                                                ContractAbiEnumType.GLPManager)
         glp_supply = self._glp_supply
 
 
         glp_aum_buy = glp_manager.functions.getAum(
-            True).call() / 10**30
+            True).call(block_identifier=self.block_identifier) / 10**30
         glp_aum_sell = glp_manager.functions.getAum(
-            False).call() / 10**30
+            False).call(block_identifier=self.block_identifier) / 10**30
 
 
         return {'buy': glp_aum_buy / glp_supply, 'sell': glp_aum_sell / glp_supply}
@@ -96,7 +120,10 @@ class GLPDataFetcher:
         pool_amount_dict = self._get_pool_amounts()
         exposure_dict = {}
         total_value = 0
-        price_dict = PriceFetcher.get_assets_price_gmx()
+        if self.snapshot is not None:
+            price_dict = self.snapshot['gmx_price']
+        else:
+            price_dict = PriceFetcher.get_assets_price_gmx(block_identifier=self.block_identifier)
 
         for symbol, amount in pool_amount_dict.items():
             total_value += amount * price_dict[symbol]
@@ -124,63 +151,42 @@ class GLPDataFetcher:
         return pool_amount_dict
 
     def _get_tokens_info(self) -> Dict:
+        # the same cached VaultState serves PriceFetcher.get_assets_price_gmx, one eth_call per block
+        return VaultState.fetch(self.conn, self.gmx_index_assets, self.block_identifier).tokens_info()
 
-        vault_adr: ChecksumAddress = ContractAddressEnumType.vault.value
-        weth_adr: ChecksumAddress = TokenAddressEnumType.WETH.value
-        usdg_amount: int = 0 # only used to call vault.getRedemptionAmount(token, _usdgAmount), in unit 10**30
-
-        # GMX index address address
-        token_adr: List[str] = [TokenAddressEnumType[token].value for token in self.gmx_index_assets]
-
-        reader_contract = self.conn.eth.contract(address=ContractAddressEnumType.Reader.value,
-                                                abi=ContractAbiEnumType.Reader.value)
-
-
-        response = reader_contract.functions.getVaultTokenInfoV2(vault_adr, weth_adr, usdg_amount, token_adr).call()
-
-        info_dict: Dict[str, Dict] = {}
-        props_length: int = 14
-
-        for round, symbol in enumerate(self.gmx_index_assets):
-            for counter in range(props_length):
-                if counter % 14 == 0:
-                    pool_amount = response[round*14]/10**TokenDecimalsEnumType[symbol].value
-                elif counter % 14 == 1:
-                    reserved_amount = response[round*14 + 1]/10**TokenDecimalsEnumType[symbol].value
-                elif counter % 14 == 12:
-                    price_not_maximised = response[round * 14 + 12]/10**30
-
-            info_dict[symbol] = {'pool_amount':pool_amount,
-                                 'reserved_amount':reserved_amount,
-                                 'price_not_maximised':price_not_maximised,
-                                 }
-
-        return info_dict
-
+    @cached('infura')
     def get_staked_gmx_amount(self) -> float:
-        staked_gmx_tracker = self.conn.eth.contract(address=ContractAddressEnumType.StakedGmxTracker.value,
-                                                  abi=ContractAbiEnumType.StakedGmxTracker.value)
+        if self.snapshot is not None:
+            return self.snapshot['staked_gmx_amount']
+
+        staked_gmx_tracker = Web3Registry.get_contract(self.conn, ContractAddressEnumType.StakedGmxTracker.value,
+                                                       ContractAbiEnumType.StakedGmxTracker)
 
         staked_gmx = staked_gmx_tracker.functions.depositBalances(self.wallet_adr,
-                                                                  TokenAddressEnumType.GMX.value).call()
+                                                                  TokenAddressEnumType.GMX.value).call(block_identifier=self.block_identifier)
 
         return staked_gmx/10**TokenDecimalsEnumType.GMX.value
 
+    @cached('infura')
     def get_staked_esgmx_amount(self) -> float:
-        staked_gmx_tracker = self.conn.eth.contract(address=ContractAddressEnumType.StakedGmxTracker.value,
-                                                  abi=ContractAbiEnumType.StakedGmxTracker.value)
+        if self.snapshot is not None:
+            return self.snapshot['staked_esgmx_amount']
+
+        staked_gmx_tracker = Web3Registry.get_contract(self.conn, ContractAddressEnumType.StakedGmxTracker.value,
+                                                       ContractAbiEnumType.StakedGmxTracker)
 
         staked_esgmx = staked_gmx_tracker.functions.depositBalances(self.wallet_adr,
-                                                                  TokenAddressEnumType.esGMX.value).call()
+                                                                  TokenAddressEnumType.esGMX.value).call(block_identifier=self.block_identifier)
 
 
         return staked_esgmx/10**TokenDecimalsEnumType.esGMX.value
 
+    @cached('infura')
     def get_staked_glp_amount(self) -> float:
-        fee_glp_tracker = self.conn.eth.contract(address=ContractAddressEnumType.FeeGlpTracker.value,
-                                                     abi=ContractAbiEnumType.FeeGlpTracker.value)
+        fee_glp_tracker = Web3Registry.get_contract(self.conn, ContractAddressEnumType.FeeGlpTracker.value,
+                                                    ContractAbiEnumType.FeeGlpTracker)
 
-        staked_glp = fee_glp_tracker.functions.stakedAmounts(self.wallet_adr).call()
+        staked_glp = fee_glp_tracker.functions.stakedAmounts(self.wallet_adr).call(block_identifier=self.block_identifier)
 
         return staked_glp/10 ** TokenDecimalsEnumType.GLP.value
 
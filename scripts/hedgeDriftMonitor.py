@@ -0,0 +1,292 @@
+import datetime
+import json
+import threading
+import time
+from typing import Dict, Tuple, Any, Optional, List, Iterable
+from dotenv import load_dotenv
+import os
+from glpFetcher import GLPDataFetcher
+from binanceAccountFetcher import BinanceAccountInfo
+from metrics import MetricsRegistry
+
+load_dotenv()
+
+
+class LogAlertSink:
+
+    def emit(self, alert: Dict[str, Any]) -> None:
+        print(f'[{alert["level"]}] {alert["time"]} {alert["message"]}')
+
+
+class JsonlAlertSink:
+
+    def __init__(self, path: str = 'hedge_alerts.jsonl'):
+        """
+        Appends one JSON object per alert, for a local log shipper or a tail -f
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, alert: Dict[str, Any]) -> None:
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(alert) + '\n')
+
+
+class HedgeDriftMonitor:
+    """
+    Keeps the last GLP exposure and Binance account state in memory and recomputes net delta, margin ratio and NAV
+    as soon as any input changes, a price tick included, instead of waiting for the next full snapshot.
+    Between account refreshes the Binance side is marked to the live prices: unrealized profit moves with
+    positionAmt * price change and the maintenance margin with the hedge notional
+    """
+
+    # GLP pool token -> Binance base asset hedging it, the stables need no hedge
+    HEDGED: Dict[str, str] = {'WBTC': 'BTC', 'WETH': 'ETH', 'LINK': 'LINK', 'UNI': 'UNI'}
+    STABLES: Tuple[str, ...] = ('USDT', 'BUSD')
+
+    def __init__(self, sinks: Optional[Iterable[Any]] = None,
+                 drift_threshold: float = 0.05,
+                 min_delta_usd: float = 100,
+                 margin_ratio_threshold: float = 0.5,
+                 realert_interval: float = 300,
+                 min_interval: float = 0.1,
+                 infura_api_key: Optional[str] = os.getenv('INFURA_API_KEY'),
+                 binance_api_key: Optional[str] = os.getenv('BINANCE_API_KEY'),
+                 binance_secret_key: Optional[str] = os.getenv('BINANCE_SECRET_KEY'),
+                 wallet_adr: Optional[str] = os.getenv('WALLET_ADDRESS')):
+        """
+        sinks: objects with emit(alert), LogAlertSink by default
+        drift_threshold: alert when |net delta| / GLP exposure of a token goes above it, and the net delta is above
+        min_delta_usd
+        margin_ratio_threshold: alert when the Binance maintenance margin / margin balance goes above it
+        realert_interval: seconds before an alert still active is emitted again
+        min_interval: shortest time between two recomputes, bursts of ticks are coalesced
+        """
+        self.sinks = list(sinks) if sinks is not None else [LogAlertSink()]
+        self.drift_threshold = drift_threshold
+        self.min_delta_usd = min_delta_usd
+        self.margin_ratio_threshold = margin_ratio_threshold
+        self.realert_interval = realert_interval
+        self.min_interval = min_interval
+        self.infura_api_key = infura_api_key
+        self.binance_api_key = binance_api_key
+        self.binance_secret_key = binance_secret_key
+        self.wallet_adr = wallet_adr
+        # built on the first account refresh and kept, a new ccxt instance would load the markets again
+        self._account_client: Optional[BinanceAccountInfo] = None
+
+        self._exposure: Optional[Dict[str, float]] = None
+        self._exposure_prices: Dict[str, float] = {}
+        self._account: Optional[Dict[str, Any]] = None
+        self._live_prices: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # alert key -> time it was last emitted
+        self._active: Dict[Tuple[str, str], float] = {}
+        self.last_state: Optional[Dict[str, Any]] = None
+
+    def set_exposure(self, exposure: Dict[str, float], prices: Dict[str, float]) -> None:
+        """
+        exposure: GLPDataFetcher.get_exposure_amount(), prices: the GMX prices of the same snapshot, used until a
+        live price arrives and for the stables
+        """
+        with self._lock:
+            self._exposure = dict(exposure)
+            self._exposure_prices = dict(prices)
+        self._changed.set()
+
+    def set_account(self, binance_summary: Dict[str, Any]) -> None:
+        """
+        binance_summary: BinanceAccountInfo.get_summary()
+        """
+        with self._lock:
+            self._account = binance_summary
+        self._changed.set()
+
+    def on_price(self, token: str, price: float) -> None:
+        """
+        BinancePriceBook listener, token is the Binance base asset
+        """
+        with self._lock:
+            self._live_prices[token] = price
+        self._changed.set()
+
+    def _price(self, token: str) -> float:
+        base = self.HEDGED.get(token, token)
+        if base in self._live_prices:
+            return self._live_prices[base]
+        return self._exposure_prices[token]
+
+    def compute(self) -> Optional[Dict[str, Any]]:
+        """
+        Net delta per hedged asset, margin ratio and NAV from the current inputs, None until both the exposure and
+        the account are known
+        """
+        with self._lock:
+            if self._exposure is None or self._account is None:
+                return None
+            exposure, account = self._exposure, self._account
+            prices = {token: self._price(token) for token in exposure}
+            live_prices = dict(self._live_prices)
+
+        hedge = account['hedge']
+        upnl_change = 0.0
+        notional_before = notional_after = 0.0
+        hedge_units: Dict[str, float] = {}
+
+        for pair, position_amount in hedge['positionAmt'].items():
+            base = hedge['base'][pair]
+            hedge_units[base] = hedge_units.get(base, 0.0) + position_amount
+            if position_amount == 0:
+                continue
+            mark_price = hedge['notional'][pair] / position_amount
+            price = live_prices.get(base, mark_price)
+            upnl_change += position_amount * (price - mark_price)
+            notional_before += abs(hedge['notional'][pair])
+            notional_after += abs(position_amount * price)
+
+        tokens: Dict[str, Dict[str, float]] = {}
+        for token, base in self.HEDGED.items():
+            if token not in exposure:
+                continue
+            exposure_usd = exposure[token] * prices[token]
+            net_units = exposure[token] + hedge_units.get(base, 0.0)
+            net_delta_usd = net_units * prices[token]
+            tokens[base] = {'exposure_usd': exposure_usd,
+                            'hedge_units': hedge_units.get(base, 0.0),
+                            'net_delta_usd': net_delta_usd,
+                            'drift': net_delta_usd / exposure_usd if exposure_usd else 0.0}
+
+        margin_balance = sum(amount for asset, amount in account['amount'].items() if asset in self.STABLES) + \
+            sum(hedge['unrealizedProfit'].values())
+        maintenance_margin = account['margin_ratio'] * margin_balance
+        if notional_before:
+            maintenance_margin *= notional_after / notional_before
+        margin_balance += upnl_change
+
+        glp_usd = sum(amount * prices[token] for token, amount in exposure.items())
+
+        return {'time': datetime.datetime.now().isoformat(),
+                'tokens': tokens,
+                'net_delta_usd': sum(token['net_delta_usd'] for token in tokens.values()),
+                'margin_ratio': maintenance_margin / margin_balance if margin_balance else float('inf'),
+                'nav': glp_usd + margin_balance}
+
+    def _alerts(self, state: Dict[str, Any]) -> List[Dict[str, Any]]:
+        breaches: Dict[Tuple[str, str], str] = {}
+        for base, token in state['tokens'].items():
+            if abs(token['drift']) > self.drift_threshold and abs(token['net_delta_usd']) > self.min_delta_usd:
+                breaches[('hedge_drift', base)] = (f'{base} net delta {token["net_delta_usd"]:.2f} USD, '
+                                                   f'drift {token["drift"]:.2%} of the GLP exposure')
+        if state['margin_ratio'] > self.margin_ratio_threshold:
+            breaches[('margin_ratio', 'Binance')] = f'Binance margin ratio {state["margin_ratio"]:.2%}'
+
+        now = time.monotonic()
+        alerts: List[Dict[str, Any]] = []
+        for key, message in breaches.items():
+            last = self._active.get(key)
+            if last is None or now - last >= self.realert_interval:
+                self._active[key] = now
+                alerts.append({'time': state['time'], 'level': 'warning', 'kind': key[0], 'subject': key[1],
+                               'message': message, 'state': state})
+        for key in [key for key in self._active if key not in breaches]:
+            del self._active[key]
+            alerts.append({'time': state['time'], 'level': 'info', 'kind': key[0], 'subject': key[1],
+                           'message': f'{key[0]} of {key[1]} back within threshold', 'state': state})
+
+        return alerts
+
+    def recompute(self) -> Optional[Dict[str, Any]]:
+        state = self.compute()
+        if state is None:
+            return None
+
+        self.last_state = state
+        for base, token in state['tokens'].items():
+            MetricsRegistry.set('hedge_net_delta_usd', token['net_delta_usd'], token=base, call_site='monitor')
+        MetricsRegistry.set('hedge_margin_ratio', state['margin_ratio'], call_site='monitor')
+        MetricsRegistry.set('hedge_nav', state['nav'], call_site='monitor')
+
+        for alert in self._alerts(state):
+            for sink in self.sinks:
+                try:
+                    sink.emit(alert)
+                except Exception as e:
+                    print(f'Alert sink {sink.__class__.__name__} fails: {e}')
+
+        return state
+
+    def refresh_exposure(self) -> None:
+        fetcher = GLPDataFetcher(infura_api_key=self.infura_api_key, wallet_adr=self.wallet_adr)
+        self.set_exposure(fetcher.get_exposure_amount(),
+                          {token: info['price_not_maximised'] for token, info in fetcher.tokens_info.items()})
+
+    def refresh_account(self) -> None:
+        if self._account_client is None:
+            self._account_client = BinanceAccountInfo(binance_api_key=self.binance_api_key,
+                                                      binance_secret_key=self.binance_secret_key)
+        self.set_account(self._account_client.get_summary())
+
+    def _run_recompute(self) -> None:
+        while not self._stopped.is_set():
+            if not self._changed.wait(timeout=1):
+                continue
+            self._changed.clear()
+            try:
+                self.recompute()
+            except Exception as e:
+                print(f'Hedge drift recompute fails: {e}')
+            self._stopped.wait(self.min_interval)
+
+    def _run_refresh(self, refresh: Any, interval: float) -> None:
+        while not self._stopped.is_set():
+            try:
+                refresh()
+            except Exception as e:
+                print(f'{refresh.__name__} fails at {datetime.datetime.now()}: {e}')
+            self._stopped.wait(interval)
+
+    def start(self, exposure_interval: Optional[float] = 600, account_interval: Optional[float] = 30) -> \
+            'HedgeDriftMonitor':
+        """
+        Starts the recompute thread, and the threads refreshing the exposure and the account on their intervals.
+        An interval of None leaves that input to the caller, e.g. a MultiRateCollector already fetching it
+        """
+        targets = [(self._run_recompute, ())]
+        if exposure_interval is not None:
+            targets.append((self._run_refresh, (self.refresh_exposure, exposure_interval)))
+        if account_interval is not None:
+            targets.append((self._run_refresh, (self.refresh_account, account_interval)))
+
+        for target, args in targets:
+            thread = threading.Thread(target=target, args=args, name='hedge-drift-monitor', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        return self
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    monitor = HedgeDriftMonitor(sinks=[LogAlertSink()], drift_threshold=0.01)
+    monitor.set_exposure({'WBTC': 1.0, 'WETH': 10.0, 'USDC': 20000.0},
+                         {'WBTC': 20000.0, 'WETH': 1500.0, 'USDC': 1.0})
+    monitor.set_account({'hedge': {'positionAmt': {'BTCUSDT': -1.0, 'ETHUSDT': -9.0},
+                                   'notional': {'BTCUSDT': -20000.0, 'ETHUSDT': -13500.0},
+                                   'unrealizedProfit': {'BTCUSDT': 0.0, 'ETHUSDT': 0.0},
+                                   'base': {'BTCUSDT': 'BTC', 'ETHUSDT': 'ETH'}},
+                         'amount': {'USDT': 10000.0}, 'margin_ratio': 0.02})
+    print(monitor.recompute())
+    monitor.on_price('BTC', 21000.0)
+    print(monitor.recompute())
+    print(f'process time is: {time.time() - start_time}')
@@ -0,0 +1,183 @@
+import ccxt
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Any, Set, Tuple
+from dotenv import load_dotenv
+from web3 import Web3
+from snapshotFetcher import OnChainSnapshotFetcher
+from dataProcessor import BalanceProcessor
+from dataBaseInserter import DatabaseInserter
+from databaseWriter import DatabaseWriter
+from web3Registry import Web3Registry
+from cycleCache import CycleCache
+from rateLimiter import throttle_exchange, PRIORITY_LOW
+
+load_dotenv()
+
+
+class HistoricalBackfiller:
+    TABLES: Tuple[str, ...] = ('gmx_account', 'metamask_account', 'gmx_total')
+    # every snapshot is one Multicall3 aggregate, Multicall3 exists on Arbitrum One from this block (March 2022)
+    MULTICALL_DEPLOYMENT_BLOCK: int = 7654707
+
+    def __init__(self, start: datetime.datetime, end: datetime.datetime, block_interval: int,
+                 infura_api_key: Optional[str] = os.getenv('INFURA_API_KEY'),
+                 wallet_adr: Optional[str] = os.getenv('WALLET_ADDRESS'),
+                 db_host: Any = os.getenv('DB_HOST'),
+                 db_user: Any = os.getenv('DB_USER'),
+                 db_pass: Any = os.getenv('DB_PASS'),
+                 db_name: Any = os.getenv('DB_NAME'),
+                 checkpoint_path: str = 'backfill_checkpoint.json',
+                 workers: int = 8,
+                 batch_size: int = 100,
+                 writer: Optional[DatabaseWriter] = None):
+        """
+        Replays gmx_account, metamask_account and gmx_total every block_interval blocks between start and end.
+        Each block is one Multicall pinned to that block (archive node required), blocks are read by a thread pool,
+        each batch is written in one transaction with one multi-row INSERT per table. Every block is keyed
+        'backfill:<block>' in snapshot_log, so a block already written is skipped even when the checkpoint lost it,
+        and the completed blocks are checkpointed so a stopped run resumes.
+        Only on-chain prices exist for the past: GMX vault prices stand in for Binance and CoinGecko, and the GMX
+        token is priced with the Binance 1m close at the block time.
+        Blocks before MULTICALL_DEPLOYMENT_BLOCK cannot be read, a start before it is moved up to it
+        """
+        self.start = start
+        self.end = end
+        self.block_interval = block_interval
+        self.infura_api_key = infura_api_key
+        self.wallet_adr = wallet_adr
+        self.db_host = db_host
+        self.db_user = db_user
+        self.db_pass = db_pass
+        self.db_name = db_name
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.batch_size = batch_size
+        self.writer = writer if writer is not None else DatabaseWriter(db_host=db_host, db_user=db_user,
+                                                                       db_pass=db_pass, db_name=db_name, pool_size=1)
+
+        self.conn: Web3 = Web3Registry.get_connection(Web3Registry.infura_url(infura_api_key))
+        self._local = threading.local()
+
+    def _find_block(self, timestamp: int) -> int:
+        """
+        Last block with a timestamp at or before the given one
+        """
+        low, high = 0, self.conn.eth.block_number
+
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.conn.eth.get_block(middle)['timestamp'] <= timestamp:
+                low = middle
+            else:
+                high = middle - 1
+
+        return low
+
+    def _load_checkpoint(self) -> Set[int]:
+        if not os.path.exists(self.checkpoint_path):
+            return set()
+
+        with open(self.checkpoint_path) as f:
+            return set(json.load(f)['done_blocks'])
+
+    def _save_checkpoint(self, done_blocks: Set[int]) -> None:
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'done_blocks': sorted(done_blocks)}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _get_gmx_token_price(self, timestamp: int) -> float:
+        exchange = getattr(self._local, 'exchange', None)
+        if exchange is None:
+            # backfill only takes the weight the live collectors leave
+            exchange = self._local.exchange = throttle_exchange(ccxt.binance(), PRIORITY_LOW)
+
+        ohlcv = exchange.fetch_ohlcv('GMX/USDT', '1m', since=timestamp * 1000, limit=1)
+        # GMX was not listed on Binance yet
+        if not ohlcv:
+            return 0
+
+        return ohlcv[0][4]
+
+    def _get_rows(self, block_number: int) -> Dict[str, List]:
+        snapshot = OnChainSnapshotFetcher(infura_api_key=self.infura_api_key,
+                                          wallet_adr=self.wallet_adr,
+                                          block_identifier=block_number).get_snapshot()
+        gmx_price: Dict[str, float] = snapshot['gmx_price']
+        gmx_token_price = self._get_gmx_token_price(snapshot['block_timestamp'])
+
+        price_dict_binance = {'BTC': gmx_price['WBTC'], 'ETH': gmx_price['WETH'], 'UNI': gmx_price['UNI'],
+                              'LINK': gmx_price['LINK'], 'DAI': gmx_price['DAI'], 'USDC': gmx_price['USDC'],
+                              'USDT': 1, 'GMX': gmx_token_price}
+        price_dict_coingecko = dict(gmx_price, GMX=gmx_token_price)
+        collected = {'snapshot': snapshot,
+                     'price_dict_binance': price_dict_binance,
+                     'price_dict_coingecko': price_dict_coingecko,
+                     'binance_summary': {'hedge': {'notional': {}}, 'amount': {}, 'margin_ratio': 0}}
+
+        inserter = DatabaseInserter(processor=BalanceProcessor(wallet_adr=self.wallet_adr, collected=collected,
+                                                               block_identifier=block_number),
+                                    created_time=datetime.datetime.fromtimestamp(snapshot['block_timestamp']))
+
+        return {'gmx_account': inserter._obtain_gmx_account_data(),
+                'metamask_account': inserter._obtain_metamask_account_data(),
+                'gmx_total': [inserter._obtain_gmx_toal_data()]}
+
+    def _write(self, batch: List[int], batch_rows: List[Dict[str, List]]) -> Dict[str, float]:
+        return self.writer.write_snapshots(DatabaseInserter.get_statements(),
+                                           [(f'backfill:{block}', rows) for block, rows in zip(batch, batch_rows)])
+
+    def run(self) -> None:
+        start_block = self._find_block(int(self.start.timestamp()))
+        end_block = self._find_block(int(self.end.timestamp()))
+        if end_block < self.MULTICALL_DEPLOYMENT_BLOCK:
+            raise ValueError(f'Backfill ends at block {end_block}, before Multicall3 was deployed at block '
+                             f'{self.MULTICALL_DEPLOYMENT_BLOCK}')
+        if start_block < self.MULTICALL_DEPLOYMENT_BLOCK:
+            print(f'Start block {start_block} is before Multicall3 was deployed, starting at block '
+                  f'{self.MULTICALL_DEPLOYMENT_BLOCK} instead')
+            start_block = self.MULTICALL_DEPLOYMENT_BLOCK
+        done_blocks = self._load_checkpoint()
+        blocks = [block for block in range(start_block, end_block + 1, self.block_interval)
+                  if block not in done_blocks]
+        print(f'Backfilling {len(blocks)} blocks from {start_block} to {end_block}, {len(done_blocks)} already done')
+
+        start_time = time.time()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for offset in range(0, len(blocks), self.batch_size):
+                    batch = blocks[offset:offset + self.batch_size]
+                    stats = self._write(batch, list(executor.map(self._get_rows, batch)))
+                    # the snapshots of a replayed block are never read again
+                    CycleCache.new_cycle()
+                    done_blocks.update(batch)
+                    self._save_checkpoint(done_blocks)
+                    print(f'{offset + len(batch)}/{len(blocks)} blocks written, '
+                          f'{stats["skipped_snapshots"]:.0f} already in the database, {time.time() - start_time:.1f}s')
+        finally:
+            self.writer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill on-chain history at a fixed block interval')
+    parser.add_argument('--start', required=True, help='YYYY-MM-DD')
+    parser.add_argument('--end', required=True, help='YYYY-MM-DD')
+    parser.add_argument('--block-interval', type=int, required=True)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--checkpoint', default='backfill_checkpoint.json')
+    args = parser.parse_args()
+
+    HistoricalBackfiller(start=datetime.datetime.strptime(args.start, '%Y-%m-%d'),
+                         end=datetime.datetime.strptime(args.end, '%Y-%m-%d'),
+                         block_interval=args.block_interval,
+                         checkpoint_path=args.checkpoint,
+                         workers=args.workers,
+                         batch_size=args.batch_size).run()
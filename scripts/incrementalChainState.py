@@ -0,0 +1,275 @@
+from web3 import Web3
+from eth_abi import decode_abi
+from typing import Optional, List, Dict, Tuple, Any
+from dotenv import load_dotenv
+import os
+import time
+from util.tokensInfoEnumType import TokenAddressEnumType, TokenDecimalsEnumType, TokenAbiEnumType
+from util.contractInfoEnumType import ContractAddressEnumType, ContractAbiEnumType
+from util.compactAbi import SELECTORS
+from web3.types import ChecksumAddress
+from snapshotFetcher import OnChainSnapshotFetcher
+from glpFetcher import GLPDataFetcher
+from web3Registry import Web3Registry
+
+load_dotenv()
+
+TRANSFER_TOPIC: str = SELECTORS['TokenAbiEnumType.GMX']['Transfer'][0]
+VAULT_EVENTS: Dict[str, str] = {SELECTORS['ContractAbiEnumType.vault'][name][0]: name
+                                for name in ('IncreasePoolAmount', 'DecreasePoolAmount',
+                                             'IncreaseReservedAmount', 'DecreaseReservedAmount')}
+ZERO_ADDRESS: str = '0x' + '0' * 40
+
+
+def _address_topic(address: str) -> str:
+    return '0x' + '0' * 24 + address.lower()[2:]
+
+
+def _topic_address(topic: Any) -> str:
+    topic = topic.hex() if isinstance(topic, bytes) else topic
+    return '0x' + topic[-40:].lower()
+
+
+class IncrementalChainState:
+
+    def __init__(self, infura_api_key: Optional[str] = os.getenv('INFURA_API_KEY'),
+                 wallet_adr: Optional[str] = os.getenv('WALLET_ADDRESS'),
+                 gmx_index_assets: Tuple[str, ...] = ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI'),
+                 metamask_tokens: Tuple[str, ...] = ('WBTC', 'WETH', 'ETH', 'FRAX', 'LINK', 'GMX', 'USDT',
+                                                     'USDC', 'UNI', 'DAI', 'esGMX'),
+                 conn: Optional[Web3] = None,
+                 max_block_range: int = 2000,
+                 reconcile_interval: float = 3600):
+        """
+        Keeps the slow-moving on-chain state in memory and moves it forward with event logs instead of reading it
+        again every cycle:
+        pool and reserved amounts from the Vault IncreasePoolAmount / DecreasePoolAmount / IncreaseReservedAmount /
+        DecreaseReservedAmount events, wallet balances from ERC20 Transfer events to and from the wallet,
+        staked GMX and esGMX from their Transfers into StakedGmxTracker and, for unstakes, out of it alongside a
+        burn of the wallet's sGMX (the tracker pays its esGMX rewards out too, a claim burns nothing), and staked GLP
+        from fGLP mints and burns (the reward trackers emit no Stake / Unstake events).
+        Prices, GLP AUM and supply, claimable rewards and the ETH balance change every block and are still read, in
+        one small Multicall. Every reconcile_interval seconds the whole state is read again with
+        OnChainSnapshotFetcher (whose tokens_info is GLPDataFetcher._get_tokens_info) and the drift is reported
+        """
+        if conn is None:
+            conn = Web3Registry.get_connection(Web3Registry.infura_url(infura_api_key))
+
+        self.conn = conn
+        self.infura_api_key = infura_api_key
+        self.wallet_adr = Web3.toChecksumAddress(wallet_adr)
+        self.gmx_index_assets = gmx_index_assets
+        self.metamask_tokens = metamask_tokens
+        self.max_block_range = max_block_range
+        self.reconcile_interval = reconcile_interval
+
+        self.snapshot_fetcher = OnChainSnapshotFetcher(wallet_adr=self.wallet_adr, gmx_index_assets=gmx_index_assets,
+                                                       metamask_tokens=metamask_tokens, conn=conn)
+        self._symbols: Dict[str, str] = {TokenAddressEnumType[token].value.lower(): token
+                                         for token in set(gmx_index_assets) | set(metamask_tokens) if token != 'ETH'}
+        self._volatile_calls: Optional[List[Tuple[str, ChecksumAddress, bytes, List[str]]]] = None
+
+        self.state: Optional[Dict[str, Any]] = None
+        self.last_block: int = -1
+        self.last_reconcile: float = 0
+        self.last_drift: Dict[str, float] = {}
+
+    def _build_volatile_calls(self) -> List[Tuple[str, ChecksumAddress, bytes, List[str]]]:
+        encode = OnChainSnapshotFetcher._encode
+        vault = (ContractAddressEnumType.vault.value, ContractAbiEnumType.vault)
+        multicall = (self.snapshot_fetcher.multicall.address, ContractAbiEnumType.Multicall)
+
+        calls = [('glp_supply', *encode(TokenAddressEnumType.GLP.value, TokenAbiEnumType.GLP, 'totalSupply', [])),
+                 ('aum_buy', *encode(ContractAddressEnumType.GLPManager.value, ContractAbiEnumType.GLPManager,
+                                     'getAum', [True])),
+                 ('aum_sell', *encode(ContractAddressEnumType.GLPManager.value, ContractAbiEnumType.GLPManager,
+                                      'getAum', [False])),
+                 ('staking_info', *encode(ContractAddressEnumType.RewardReader.value, ContractAbiEnumType.RewardReader,
+                                          'getStakingInfo',
+                                          [self.wallet_adr, [ContractAddressEnumType.StakedGmxTracker.value,
+                                                             ContractAddressEnumType.FeeGmxTracker.value,
+                                                             ContractAddressEnumType.FeeGlpTracker.value,
+                                                             ContractAddressEnumType.StakedGlpTracker.value]])),
+                 ('balance_ETH', *encode(*multicall, 'getEthBalance', [self.wallet_adr])),
+                 ('block_timestamp', *encode(*multicall, 'getCurrentBlockTimestamp', []))]
+        # Vault.getMinPrice stands in for the primary price column of getVaultTokenInfoV2
+        for token in self.gmx_index_assets:
+            calls.append((f'price_{token}', *encode(*vault, 'getMinPrice', [TokenAddressEnumType[token].value])))
+
+        return calls
+
+    def _read_volatile(self, block_number: int) -> Dict[str, Any]:
+        if self._volatile_calls is None:
+            self._volatile_calls = self._build_volatile_calls()
+
+        _, return_data = self.snapshot_fetcher.multicall.functions.aggregate(
+            [(target, call_data) for _, target, call_data, _ in self._volatile_calls]).call(
+            block_identifier=block_number)
+
+        return OnChainSnapshotFetcher._decode(self._volatile_calls, return_data)
+
+    def _get_logs(self, from_block: int, to_block: int) -> List[Dict]:
+        """
+        Vault events, and every Transfer from or to the wallet on the tracked tokens, fGLP and sGMX, in block ranges of
+        at most max_block_range. A range the node refuses (too many results) is split in two
+        """
+        token_adr = [Web3.toChecksumAddress(address) for address in self._symbols] + \
+                    [ContractAddressEnumType.FeeGlpTracker.value, ContractAddressEnumType.StakedGmxTracker.value]
+        wallet_topic = _address_topic(self.wallet_adr)
+        filters = [{'address': ContractAddressEnumType.vault.value, 'topics': [list(VAULT_EVENTS)]},
+                   {'address': token_adr, 'topics': [TRANSFER_TOPIC, wallet_topic]},
+                   {'address': token_adr, 'topics': [TRANSFER_TOPIC, None, wallet_topic]}]
+
+        logs: List[Dict] = []
+        ranges = [(start, min(start + self.max_block_range - 1, to_block))
+                  for start in range(from_block, to_block + 1, self.max_block_range)]
+
+        while ranges:
+            start, end = ranges.pop(0)
+            try:
+                for log_filter in filters:
+                    logs.extend(self.conn.eth.get_logs(dict(log_filter, fromBlock=start, toBlock=end)))
+            except ValueError:
+                if start == end:
+                    raise
+                middle = (start + end) // 2
+                ranges[:0] = [(start, middle), (middle + 1, end)]
+
+        # a self transfer matches both Transfer filters
+        unique = {(log['transactionHash'], log['logIndex']): log for log in logs}
+        return sorted(unique.values(), key=lambda log: (log['blockNumber'], log['logIndex']))
+
+    def _apply(self, logs: List[Dict]) -> None:
+        state = self.state
+        wallet = self.wallet_adr.lower()
+        staked_gmx_tracker = ContractAddressEnumType.StakedGmxTracker.value.lower()
+        # sGMX burned from the wallet per transaction, an unstake burns it before paying the token back
+        sgmx_burns: Dict[Any, List[int]] = {}
+
+        for log in logs:
+            address = log['address'].lower()
+            topic = log['topics'][0].hex() if isinstance(log['topics'][0], bytes) else log['topics'][0]
+            data = bytes.fromhex(log['data'][2:]) if isinstance(log['data'], str) else bytes(log['data'])
+
+            if topic in VAULT_EVENTS:
+                token_adr, amount = decode_abi(['address', 'uint256'], data)
+                token = self._symbols.get(token_adr.lower())
+                if token not in state['tokens_info']:
+                    continue
+                event = VAULT_EVENTS[topic]
+                field = 'pool_amount' if 'Pool' in event else 'reserved_amount'
+                sign = 1 if event.startswith('Increase') else -1
+                state['tokens_info'][token][field] += sign * amount / 10 ** TokenDecimalsEnumType[token].value
+                continue
+
+            sender, receiver = _topic_address(log['topics'][1]), _topic_address(log['topics'][2])
+            amount = decode_abi(['uint256'], data)[0]
+
+            if address == ContractAddressEnumType.FeeGlpTracker.value.lower():
+                # fGLP is minted to the wallet on stake and burned on unstake, moves to StakedGlpTracker do not count
+                if sender == ZERO_ADDRESS:
+                    state['staked_glp_amount'] += amount / 10 ** TokenDecimalsEnumType.GLP.value
+                elif receiver == ZERO_ADDRESS:
+                    state['staked_glp_amount'] -= amount / 10 ** TokenDecimalsEnumType.GLP.value
+                continue
+
+            if address == staked_gmx_tracker:
+                if receiver == ZERO_ADDRESS:
+                    sgmx_burns.setdefault(log['transactionHash'], []).append(amount)
+                continue
+
+            token = self._symbols[address]
+            value = amount / 10 ** TokenDecimalsEnumType[token].value
+            if token in state['metamask_balance']:
+                state['metamask_balance'][token] += value if receiver == wallet else -value
+
+            # GMX and esGMX are staked by transferring them to StakedGmxTracker, esGMX it sends without burning the
+            # same amount of sGMX in the transaction is a claimed or compounded reward, not an unstake
+            staked_key = {'GMX': 'staked_gmx_amount', 'esGMX': 'staked_esgmx_amount'}.get(token)
+            if staked_key is not None:
+                burns = sgmx_burns.get(log['transactionHash'], [])
+                if receiver == staked_gmx_tracker:
+                    state[staked_key] += value
+                elif sender == staked_gmx_tracker and amount in burns:
+                    burns.remove(amount)
+                    state[staked_key] -= value
+
+    def reconcile(self, block_number: int) -> Dict[str, float]:
+        """
+        Replaces the event-derived state with a full read at block_number, returns the largest absolute drift of
+        each field group against the incremental state
+        """
+        snapshot = OnChainSnapshotFetcher(wallet_adr=self.wallet_adr, gmx_index_assets=self.gmx_index_assets,
+                                          metamask_tokens=self.metamask_tokens, conn=self.conn,
+                                          block_identifier=block_number).get_snapshot()
+        drift: Dict[str, float] = {}
+
+        if self.state is not None:
+            drift['tokens_info'] = max(abs(snapshot['tokens_info'][token][field] -
+                                           self.state['tokens_info'][token][field])
+                                       for token in self.gmx_index_assets
+                                       for field in ('pool_amount', 'reserved_amount'))
+            drift['metamask_balance'] = max(abs(snapshot['metamask_balance'][token] -
+                                                self.state['metamask_balance'][token])
+                                            for token in self.metamask_tokens)
+            drift['staked'] = max(abs(snapshot[key] - self.state[key])
+                                  for key in ('staked_glp_amount', 'staked_gmx_amount', 'staked_esgmx_amount'))
+
+        self.state = {'tokens_info': {token: dict(info) for token, info in snapshot['tokens_info'].items()},
+                      'metamask_balance': dict(snapshot['metamask_balance']),
+                      'staked_glp_amount': snapshot['staked_glp_amount'],
+                      'staked_gmx_amount': snapshot['staked_gmx_amount'],
+                      'staked_esgmx_amount': snapshot['staked_esgmx_amount']}
+        self.last_block = block_number
+        self.last_reconcile = time.monotonic()
+        self.last_drift = drift
+
+        return drift
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        """
+        Same shape as OnChainSnapshotFetcher.get_snapshot(), without vault_state, every read pinned to the
+        current head block
+        """
+        head = self.conn.eth.block_number
+
+        if self.state is None or time.monotonic() - self.last_reconcile >= self.reconcile_interval:
+            drift = self.reconcile(head)
+            if drift:
+                print(f'Reconciled at block {head}, drift: {drift}')
+        elif head > self.last_block:
+            self._apply(self._get_logs(self.last_block + 1, head))
+            self.last_block = head
+
+        raw = self._read_volatile(head)
+        state = self.state
+        glp_supply: float = raw['glp_supply'] / 10 ** TokenDecimalsEnumType.GLP.value
+        gmx_price = {token: raw[f'price_{token}'] / 10 ** 30 for token in self.gmx_index_assets}
+        tokens_info = {token: dict(state['tokens_info'][token], price_not_maximised=gmx_price[token])
+                       for token in self.gmx_index_assets}
+        metamask_balance = dict(state['metamask_balance'])
+        if 'ETH' in metamask_balance:
+            metamask_balance['ETH'] = raw['balance_ETH'] / 10 ** TokenDecimalsEnumType.ETH.value
+
+        return {'block_number': head,
+                'block_timestamp': raw['block_timestamp'],
+                'vault_state': None,
+                'tokens_info': tokens_info,
+                'gmx_price': gmx_price,
+                'glp_supply': glp_supply,
+                'glp_price': {'buy': raw['aum_buy'] / 10 ** 30 / glp_supply,
+                              'sell': raw['aum_sell'] / 10 ** 30 / glp_supply},
+                'staked_glp_amount': state['staked_glp_amount'],
+                'staked_gmx_amount': state['staked_gmx_amount'],
+                'staked_esgmx_amount': state['staked_esgmx_amount'],
+                'claimable_info': GLPDataFetcher._parse_claimable_info(raw['staking_info']),
+                'metamask_balance': metamask_balance}
+
+
+if __name__ == '__main__':
+    chain_state = IncrementalChainState()
+    for _ in range(3):
+        start_time = time.time()
+        print(chain_state.get_snapshot())
+        print(f'process time is: {time.time() - start_time}')
+        time.sleep(10)
@@ -1,27 +1,127 @@
-from apscheduler.schedulers.blocking import BlockingScheduler
 from dataBaseInserter import DatabaseInserter
+from databaseWriter import DatabaseWriter
+from snapshotSpool import SnapshotSpool, SpoolReplayer
+from changeFilter import ChangeFilter
+from dataProcessor import BalanceProcessor
+from cycleCache import CycleCache
+from priceFetcher import PriceFetcher
+from priceBook import BinancePriceBook
+from multiRateScheduler import MultiRateCollector
+from incrementalChainState import IncrementalChainState
+from portfolio import Portfolio
+from traderPositions import TraderPositions, TraderPositionFetcher
+from metrics import MetricsRegistry, MetricsServer, call_site
+from hedgeDriftMonitor import HedgeDriftMonitor, LogAlertSink, JsonlAlertSink
+from snapshotServer import SnapshotServer
 import time
 import datetime
+import json
+import os
+
+
+# persistent connection pool shared by every scheduler run
+writer = DatabaseWriter(pool_size=int(os.getenv('DB_POOL_SIZE', 2)))
+# snapshots that fail to reach MySQL wait here until the replayer drains them
+spool = SnapshotSpool(directory=os.getenv('SPOOL_DIR', 'spool'))
+# CHANGE_FILTER=1 only writes account rows whose amounts moved, or whose notional moved by CHANGE_PRICE_TOLERANCE,
+# plus one heartbeat row per CHANGE_HEARTBEAT seconds
+change_filter = ChangeFilter(relative_tolerance=float(os.getenv('CHANGE_TOLERANCE', 1e-4)),
+                             price_tolerance=float(os.getenv('CHANGE_PRICE_TOLERANCE', 0.01)),
+                             heartbeat=float(os.getenv('CHANGE_HEARTBEAT', 21600))) \
+    if os.getenv('CHANGE_FILTER') == '1' else None
+# ROLLUP=1 keeps the hourly, daily and weekly metric_rollup buckets up to date with every snapshot
+rollup = os.getenv('ROLLUP') == '1'
+# CHAIN_MODE=incremental follows the on-chain state with event logs between full reconciliations
+chain_state = IncrementalChainState(max_block_range=int(os.getenv('LOG_BLOCK_RANGE', 2000)),
+                                    reconcile_interval=float(os.getenv('RECONCILE_INTERVAL', 3600))) \
+    if os.getenv('CHAIN_MODE') == 'incremental' else None
+# PORTFOLIO_FILE=<path> tracks every wallet and Binance account listed in the file, sharing the market data
+portfolio = Portfolio.from_file(os.getenv('PORTFOLIO_FILE'),
+                                wallets_per_call=int(os.getenv('PORTFOLIO_WALLETS_PER_CALL', 100))) \
+    if os.getenv('PORTFOLIO_FILE') else None
+# GMX_TRADER_ACCOUNTS=<address,address,...> records the open GMX positions of those accounts every cycle
+trader_accounts = [account for account in os.getenv('GMX_TRADER_ACCOUNTS', '').split(',') if account]
 
 
 def update_database():
     start_time = time.time()
     print(f'Start updating databases at {datetime.datetime.now()}')
+    CycleCache.new_cycle()
     try:
-        updater = DatabaseInserter()
-        updater.insert_summary_total_balance()
-        updater.insert_gmx_account()
-        updater.insert_binance_hedge_account()
-        updater.insert_metamask_account()
-        updater.insert_gmx_total()
+        with call_site('update_database'), MetricsRegistry.timed('cycle'):
+            if portfolio is not None:
+                updater = portfolio
+            # COLLECT_MODE=async fetches all sources concurrently instead of one after another
+            elif os.getenv('COLLECT_MODE') == 'async':
+                from asyncCollector import AsyncBalanceCollector
+
+                collected = AsyncBalanceCollector(
+                    max_concurrency=int(os.getenv('COLLECT_MAX_CONCURRENCY', 8))).collect_sync()
+                updater = DatabaseInserter(processor=BalanceProcessor(collected=collected))
+            elif chain_state is not None:
+                updater = DatabaseInserter(processor=BalanceProcessor(snapshot=chain_state.get_snapshot()))
+            else:
+                updater = DatabaseInserter()
+            write_stats = updater.insert_all(writer, spool=spool, change_filter=change_filter, rollup=rollup)
+            if trader_accounts:
+                positions = TraderPositionFetcher(accounts=trader_accounts).get_positions()
+                writer.write_snapshot({TraderPositions.TABLE: TraderPositions.insert_sql()},
+                                      {TraderPositions.TABLE: positions.rows()})
 
     except Exception as e :
         print(f'Update fails at {datetime.datetime.now()}')
         raise e
     print(f'Update succeeds, It takes {time.time() - start_time}')
+    print(f'Wrote {write_stats["rows"]} rows at {write_stats["rows_per_second"]:.0f} rows/s, '
+          f'commit latency {write_stats["commit_latency"]:.4f}s')
+    print(f'Cache hits / misses: {CycleCache.stats()}')
+    # METRICS_JSON=<path> dumps the per-call metrics after every cycle
+    if os.getenv('METRICS_JSON'):
+        with open(os.getenv('METRICS_JSON'), 'w') as f:
+            json.dump(MetricsRegistry.to_json(), f)
 
 
 if __name__ == '__main__':
-    sched = BlockingScheduler()
-    sched.add_job(update_database, 'cron', minute='*/10', second=0)
-    sched.start()
+    # PRICE_BOOK=1 keeps Binance prices streaming in memory between cycles
+    if os.getenv('PRICE_BOOK') == '1' or os.getenv('HEDGE_MONITOR') == '1':
+        PriceFetcher.price_book = BinancePriceBook().start()
+
+    # HEDGE_MONITOR=1 recomputes net delta, margin ratio and NAV on every price tick and alerts on drift
+    if os.getenv('HEDGE_MONITOR') == '1':
+        alert_sinks = [LogAlertSink()]
+        if os.getenv('HEDGE_ALERTS_JSONL'):
+            alert_sinks.append(JsonlAlertSink(os.getenv('HEDGE_ALERTS_JSONL')))
+        monitor = HedgeDriftMonitor(sinks=alert_sinks,
+                                    drift_threshold=float(os.getenv('HEDGE_DRIFT_THRESHOLD', 0.05)),
+                                    min_delta_usd=float(os.getenv('HEDGE_MIN_DELTA_USD', 100)),
+                                    margin_ratio_threshold=float(os.getenv('HEDGE_MARGIN_RATIO_THRESHOLD', 0.5)))
+        PriceFetcher.price_book.add_listener(monitor.on_price)
+        monitor.start(exposure_interval=float(os.getenv('HEDGE_EXPOSURE_INTERVAL', 600)),
+                      account_interval=float(os.getenv('HEDGE_ACCOUNT_INTERVAL', 30)))
+
+    SpoolReplayer(spool, writer).start()
+
+    # METRICS_PORT=<port> serves /metrics (Prometheus) and /metrics.json on METRICS_HOST, localhost by default
+    if os.getenv('METRICS_PORT'):
+        MetricsServer(port=int(os.getenv('METRICS_PORT')), host=os.getenv('METRICS_HOST', '127.0.0.1')).start()
+
+    # SNAPSHOT_PORT=<port> serves the latest snapshot and the last SNAPSHOT_HISTORY ones as JSON on localhost
+    if os.getenv('SNAPSHOT_PORT'):
+        SnapshotServer(port=int(os.getenv('SNAPSHOT_PORT')), host=os.getenv('SNAPSHOT_HOST', '127.0.0.1'),
+                       history=int(os.getenv('SNAPSHOT_HISTORY', 144))).start()
+
+    # SCHEDULE_MODE=multi_rate refreshes prices, positions and on-chain state on separate cadences
+    if os.getenv('SCHEDULE_MODE') == 'multi_rate':
+        MultiRateCollector(writer, spool=spool, change_filter=change_filter, rollup=rollup,
+                           chain_state=chain_state,
+                           prices_interval=float(os.getenv('PRICES_INTERVAL', 5)),
+                           positions_interval=float(os.getenv('POSITIONS_INTERVAL', 60)),
+                           chain_interval=float(os.getenv('CHAIN_INTERVAL', 600)),
+                           persist_interval=float(os.getenv('PERSIST_INTERVAL', 600)),
+                           max_workers=int(os.getenv('SCHEDULER_WORKERS', 4))).start()
+    else:
+        from apscheduler.schedulers.blocking import BlockingScheduler
+
+        sched = BlockingScheduler(job_defaults={'coalesce': True, 'max_instances': 1})
+        sched.add_job(update_database, 'cron', minute='*/10', second=0)
+        sched.start()
@@ -1,10 +1,11 @@
-from web3 import HTTPProvider, Web3
 from typing import Iterable, Dict, Union, Optional
 from util.tokensInfoEnumType import TokenAddressEnumType, TokenDecimalsEnumType, TokenAbiEnumType
-from web3.types import ChecksumAddress, Address, ENS
+from web3.types import ChecksumAddress, Address, ENS, BlockIdentifier
 import os
 from dotenv import load_dotenv
 import time
+from web3Registry import Web3Registry
+from cycleCache import cached
 
 load_dotenv()
 
@@ -12,27 +13,37 @@ load_dotenv()
 class MetamaskInfoFetcher:
     def __init__(self,
                  infura_api_key: Optional[str] = os.getenv('INFURA_API_KEY'),  # type: ignore
-                 wallet_adr: Union[ChecksumAddress, ENS, Address, Optional[str]] = os.getenv('WALLET_ADDRESS')):
+                 wallet_adr: Union[ChecksumAddress, ENS, Address, Optional[str]] = os.getenv('WALLET_ADDRESS'),
+                 snapshot: Optional[Dict] = None,
+                 block_identifier: BlockIdentifier = 'latest'):
 
-        infura_api_url: str = 'https://arbitrum-mainnet.infura.io/v3/'
-        infura_api_url = infura_api_url + infura_api_key  # type: ignore
-        self.conn = Web3(HTTPProvider(infura_api_url))
+        self.conn = Web3Registry.get_connection(Web3Registry.infura_url(infura_api_key))
         self.wallet_adr = wallet_adr
+        self.snapshot = snapshot
+        self.block_identifier = block_identifier
+        self._cache_key = (wallet_adr, block_identifier, None if snapshot is None else snapshot['block_number'])
 
+    @cached('infura')
     def get_balance_amount(self, token_iterable: Iterable[str] = ('WBTC', 'WETH', 'ETH', 'FRAX', 'LINK', 'GMX', 'USDT',
                                                                   'USDC', 'UNI', 'DAI', 'esGMX')) -> Dict:
         # type: ignore
 
         balance_dict: Dict[str,float] = {}
 
+        # balances already read in the batched snapshot
+        if self.snapshot is not None and all(token in self.snapshot['metamask_balance'] for token in token_iterable):
+            return {token: self.snapshot['metamask_balance'][token] for token in token_iterable}
+
         for token in token_iterable:
             if token != 'ETH':
-                checker = self.conn.eth.contract(address=TokenAddressEnumType[token].value,
-                                                 abi=TokenAbiEnumType[token].value)
-                balance_dict[token] = checker.functions.balanceOf(self.wallet_adr).call()/\
+                checker = Web3Registry.get_contract(self.conn, TokenAddressEnumType[token].value,
+                                                    TokenAbiEnumType[token])
+                balance_dict[token] = checker.functions.balanceOf(self.wallet_adr).call(
+                    block_identifier=self.block_identifier) / \
                                       10 ** TokenDecimalsEnumType[token].value
             else:
-                balance_dict[token] = self.conn.eth.get_balance(self.wallet_adr)/10**TokenDecimalsEnumType[token].value
+                balance_dict[token] = self.conn.eth.get_balance(self.wallet_adr, self.block_identifier) / \
+                                      10 ** TokenDecimalsEnumType[token].value
 
         return balance_dict
 
@@ -0,0 +1,185 @@
+import argparse
+import datetime
+import os
+import time
+from typing import Dict, List, Tuple, Optional
+from dotenv import load_dotenv
+from databaseWriter import DatabaseWriter
+from changeFilter import ChangeFilter
+
+load_dotenv()
+
+
+class MetricRollup:
+    """
+    Hourly, daily and weekly open/close/min/max/mean of the dashboard metrics, kept in metric_rollup.
+    Every snapshot upserts its samples into the buckets it falls in, in the same transaction as its raw rows, so
+    the rollups never need a full recomputation. rebuild() regenerates a range from the raw tables after a backfill,
+    except for the tables a ChangeFilter thins out
+    """
+
+    GRANULARITIES: Tuple[str, ...] = ('1h', '1d', '1w')
+
+    # raw table -> (columns joined into the series name, or None for one series, {metric: column}) in
+    # DatabaseInserter order. Hedge series are pairs, base + quote, BTCUSDT and BTCBUSD are two positions
+    METRICS: Dict[str, Tuple[Optional[Tuple[int, ...]], Dict[str, int]]] = {
+        'summary_total_balance': ((2,), {'notional': 3, 'wallet_balance': 4, 'margin_ratio': 5}),
+        'binance_hedge_account': ((6, 5), {'hedge_notional': 3, 'funding_rate': 4, 'unrealized_profit': 7}),
+        'gmx_total': (None, {'long_positions': 2, 'short_positions': 3, 'reward_esgmx_amount': 4,
+                             'reward_weth_amount': 5, 'reward_weth_notional': 7,
+                             'reward_esgmx_cumulative_amount': 8, 'reward_weth_cumulative_amount': 9}),
+    }
+
+    # raw table -> columns selected by rebuild(), in the same positions as the rows the inserter builds, with the
+    # account last
+    SOURCE_COLUMNS: Dict[str, str] = {
+        'summary_total_balance': 'created_date, updated_date, exchange_name, notional, wallet_balance, margin_ratio, '
+                                 'account',
+        'binance_hedge_account': 'created_date, updated_date, position_amount, notional, funding_rate, quote, base, '
+                                 'unrealized_profit, account',
+        'gmx_total': 'created_date, updated_date, long_positions, short_positions, reward_esgmx_amount, '
+                     'reward_weth_amount, reward_esgmx_notional, reward_weth_notional, '
+                     'reward_esgmx_cumulative_amount, reward_weth_cumulative_amount, account',
+    }
+
+    COLUMNS: str = ('granularity, bucket_start, metric, account, series, open_value, close_value, min_value, '
+                    'max_value, sum_value, sample_count, open_time, close_time')
+
+    @staticmethod
+    def bucket_start(created_time: datetime.datetime, granularity: str) -> datetime.datetime:
+        if granularity == '1h':
+            return created_time.replace(minute=0, second=0, microsecond=0)
+        day = created_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        if granularity == '1d':
+            return day
+        if granularity == '1w':
+            # weeks start on Monday
+            return day - datetime.timedelta(days=day.weekday())
+        raise ValueError(f'Unknown granularity {granularity}')
+
+    @staticmethod
+    def bucket_length(granularity: str) -> datetime.timedelta:
+        return {'1h': datetime.timedelta(hours=1),
+                '1d': datetime.timedelta(days=1),
+                '1w': datetime.timedelta(weeks=1)}[granularity]
+
+    @classmethod
+    def upsert_sql(cls) -> str:
+        """
+        Merges a sample, or a partial bucket, into the stored bucket. MySQL applies the assignments left to right,
+        so open_value and close_value are compared against the times stored before this row
+        """
+        insert_string = ', '.join(['%s'] * len(cls.COLUMNS.split(',')))
+
+        return (f'INSERT INTO metric_rollup ({cls.COLUMNS}) VALUES ({insert_string}) ON DUPLICATE KEY UPDATE '
+                'open_value = IF(VALUES(open_time) < open_time, VALUES(open_value), open_value), '
+                'open_time = LEAST(open_time, VALUES(open_time)), '
+                'close_value = IF(VALUES(close_time) >= close_time, VALUES(close_value), close_value), '
+                'close_time = GREATEST(close_time, VALUES(close_time)), '
+                'min_value = LEAST(min_value, VALUES(min_value)), '
+                'max_value = GREATEST(max_value, VALUES(max_value)), '
+                'sum_value = sum_value + VALUES(sum_value), '
+                'sample_count = sample_count + VALUES(sample_count)')
+
+    @classmethod
+    def _samples(cls, rows: Dict[str, List[List]]) -> List[Tuple[str, str, str, datetime.datetime, float]]:
+        samples = []
+        for table, (series_columns, metrics) in cls.METRICS.items():
+            for row in rows.get(table, []):
+                series = 'total' if series_columns is None else ''.join(str(row[column]) for column in series_columns)
+                for metric, column in metrics.items():
+                    # the account is the last column of every raw table
+                    samples.append((metric, row[-1], series, row[0], float(row[column])))
+
+        return samples
+
+    @classmethod
+    def rollup_rows(cls, rows: Dict[str, List[List]]) -> List[List]:
+        """
+        One rollup row per granularity, metric, account and series, with the samples of the same bucket merged
+        rows: the raw snapshot rows of DatabaseInserter.get_snapshot_rows(), or rows read back by rebuild()
+        """
+        buckets: Dict[Tuple, List] = {}
+
+        for metric, account, series, created_time, value in cls._samples(rows):
+            for granularity in cls.GRANULARITIES:
+                key = (granularity, cls.bucket_start(created_time, granularity), metric, account, series)
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = list(key) + [value, value, value, value, value, 1, created_time, created_time]
+                    continue
+
+                if created_time < bucket[11]:
+                    bucket[5], bucket[11] = value, created_time
+                if created_time >= bucket[12]:
+                    bucket[6], bucket[12] = value, created_time
+                bucket[7] = min(bucket[7], value)
+                bucket[8] = max(bucket[8], value)
+                bucket[9] += value
+                bucket[10] += 1
+
+        return list(buckets.values())
+
+    @classmethod
+    def rebuild(cls, writer: DatabaseWriter, start: datetime.datetime, end: datetime.datetime,
+                chunk_size: int = 1000, change_filtered: bool = os.getenv('CHANGE_FILTER') == '1') -> int:
+        """
+        Recomputes every bucket overlapping [start, end) from the raw tables and replaces the stored ones,
+        in one transaction per granularity.
+        change_filtered: the raw tables of ChangeFilter.TABLES only hold the changed and heartbeat rows, while their
+        buckets were upserted from every snapshot before filtering. Their buckets are then left as they are instead
+        of being replaced with ones built from far fewer samples
+        """
+        tables = {table: columns for table, columns in cls.SOURCE_COLUMNS.items()
+                  if not (change_filtered and table in ChangeFilter.TABLES)}
+        for table in cls.SOURCE_COLUMNS.keys() - tables.keys():
+            print(f'{table} is change filtered, its buckets are not rebuilt')
+        metrics = [metric for table in tables for metric in cls.METRICS[table][1]]
+        written = 0
+
+        for granularity in cls.GRANULARITIES:
+            low = cls.bucket_start(start, granularity)
+            high = cls.bucket_start(end, granularity)
+            if high < end:
+                high += cls.bucket_length(granularity)
+
+            with writer.connection() as con:
+                cur = con.cursor()
+                try:
+                    rows: Dict[str, List[List]] = {}
+                    for table, columns in tables.items():
+                        cur.execute(f'SELECT {columns} FROM {table} WHERE created_date >= %s AND created_date < %s',
+                                    [low, high])
+                        rows[table] = [list(row) for row in cur.fetchall()]
+
+                    rollup_rows = [row for row in cls.rollup_rows(rows) if row[0] == granularity]
+                    cur.execute(f'DELETE FROM metric_rollup WHERE granularity = %s AND bucket_start >= %s '
+                                f'AND bucket_start < %s AND metric IN ({", ".join(["%s"] * len(metrics))})',
+                                [granularity, low, high] + metrics)
+                    for offset in range(0, len(rollup_rows), chunk_size):
+                        chunk = rollup_rows[offset:offset + chunk_size]
+                        cur.execute(DatabaseWriter.multi_row_insert_sql(cls.upsert_sql(), len(chunk)),
+                                    [value for row in chunk for value in row])
+                    con.commit()
+                except BaseException:
+                    con.rollback()
+                    raise
+                finally:
+                    cur.close()
+
+            written += len(rollup_rows)
+            print(f'{granularity}: {len(rollup_rows)} buckets rebuilt between {low} and {high}')
+
+        return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild the metric_rollup buckets of a time range')
+    parser.add_argument('--start', required=True, help='YYYY-MM-DD')
+    parser.add_argument('--end', required=True, help='YYYY-MM-DD')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    MetricRollup.rebuild(DatabaseWriter(), start=datetime.datetime.strptime(args.start, '%Y-%m-%d'),
+                         end=datetime.datetime.strptime(args.end, '%Y-%m-%d'))
+    print(f'process time is: {time.time() - start_time}')
@@ -0,0 +1,318 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple, Any, Callable, Iterator, Optional, List
+
+# seconds
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_local = threading.local()
+
+
+def current_call_site() -> str:
+    return getattr(_local, 'call_site', 'unknown')
+
+
+@contextmanager
+def call_site(name: str) -> Iterator[None]:
+    """
+    Labels every remote call made by this thread inside the block, e.g. with 'GLPDataFetcher._get_glp_supply'
+    """
+    previous = getattr(_local, 'call_site', None)
+    _local.call_site = name
+    try:
+        yield
+    finally:
+        _local.call_site = previous if previous is not None else 'unknown'
+
+
+class _Histogram:
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Process-wide latency histograms and counters of every remote call, labelled by call site (fetcher class and
+    method), exported as Prometheus text or JSON
+    """
+
+    _histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], _Histogram] = {}
+    _counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+    _gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+        labels.setdefault('call_site', current_call_site())
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @classmethod
+    def observe(cls, name: str, seconds: float, **labels: Any) -> None:
+        key = (name, cls._labels(labels))
+        with cls._lock:
+            histogram = cls._histograms.get(key)
+            if histogram is None:
+                histogram = cls._histograms[key] = _Histogram()
+            histogram.observe(seconds)
+
+    @classmethod
+    def inc(cls, name: str, value: float = 1, **labels: Any) -> None:
+        key = (name, cls._labels(labels))
+        with cls._lock:
+            cls._counters[key] = cls._counters.get(key, 0) + value
+
+    @classmethod
+    def set(cls, name: str, value: float, **labels: Any) -> None:
+        key = (name, cls._labels(labels))
+        with cls._lock:
+            cls._gauges[key] = value
+
+    @classmethod
+    @contextmanager
+    def timed(cls, name: str, **labels: Any) -> Iterator[None]:
+        """
+        Observes the duration of the block in {name}_seconds and counts failures in {name}_errors_total
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            cls.inc(f'{name}_errors_total', error=type(e).__name__, **labels)
+            raise
+        finally:
+            cls.observe(f'{name}_seconds', time.perf_counter() - start_time, **labels)
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._lock:
+            cls._histograms.clear()
+            cls._counters.clear()
+            cls._gauges.clear()
+
+    @staticmethod
+    def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = ','.join(f'{k}="{v}"' for k, v in labels + extra)
+        return '{' + pairs + '}' if pairs else ''
+
+    @classmethod
+    def prometheus_text(cls) -> str:
+        lines: List[str] = []
+        with cls._lock:
+            for (name, labels), histogram in sorted(cls._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{cls._format_labels(labels, (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{cls._format_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{cls._format_labels(labels)} {histogram.count}')
+            for (name, labels), value in sorted(cls._counters.items()):
+                lines.append(f'{name}{cls._format_labels(labels)} {value}')
+            for (name, labels), value in sorted(cls._gauges.items()):
+                lines.append(f'{name}{cls._format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def to_json(cls) -> Dict[str, List[Dict[str, Any]]]:
+        with cls._lock:
+            return {'histograms': [{'name': name, 'labels': dict(labels), 'count': histogram.count,
+                                    'sum': histogram.sum, 'buckets': dict(zip(map(str, LATENCY_BUCKETS + ('+Inf',)),
+                                                                              histogram.counts))}
+                                   for (name, labels), histogram in sorted(cls._histograms.items())],
+                    'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                                 for (name, labels), value in sorted(cls._counters.items())],
+                    'gauges': [{'name': name, 'labels': dict(labels), 'value': value}
+                               for (name, labels), value in sorted(cls._gauges.items())]}
+
+
+def web3_metrics_middleware(make_request: Callable, w3: Any) -> Callable:
+    """
+    Web3 middleware timing every JSON-RPC request by method, e.g. eth_call
+    """
+
+    def middleware(method: str, params: Any) -> Any:
+        with MetricsRegistry.timed('rpc_request', method=method):
+            response = make_request(method, params)
+        if 'error' in response:
+            MetricsRegistry.inc('rpc_request_errors_total', method=method, error='rpc_error')
+        return response
+
+    return middleware
+
+
+async def async_web3_metrics_middleware(make_request: Callable, w3: Any) -> Callable:
+    """
+    web3_metrics_middleware for an AsyncHTTPProvider connection
+    """
+
+    async def middleware(method: str, params: Any) -> Any:
+        with MetricsRegistry.timed('rpc_request', method=method):
+            response = await make_request(method, params)
+        if 'error' in response:
+            MetricsRegistry.inc('rpc_request_errors_total', method=method, error='rpc_error')
+        return response
+
+    return middleware
+
+
+def requests_metrics_hook(response: Any, *args: Any, **kwargs: Any) -> Any:
+    """
+    requests response hook recording latency, status and payload size per host
+    """
+    host = response.url.split('/')[2] if '://' in response.url else response.url
+    MetricsRegistry.observe('http_request_seconds', response.elapsed.total_seconds(), host=host)
+    MetricsRegistry.inc('http_response_bytes_total', len(response.content), host=host)
+    if response.status_code >= 400:
+        MetricsRegistry.inc('http_request_errors_total', host=host, error=str(response.status_code))
+    return response
+
+
+def instrument_session(session: Any) -> Any:
+    session.hooks['response'].append(requests_metrics_hook)
+    return session
+
+
+def aiohttp_trace_config() -> Any:
+    """
+    aiohttp.TraceConfig recording what requests_metrics_hook records for a ClientSession, passed as
+    ClientSession(trace_configs=[aiohttp_trace_config()])
+    """
+    # aiohttp is only imported by the async collection mode
+    import aiohttp
+
+    async def on_request_start(session: Any, context: Any, params: Any) -> None:
+        context.start_time = time.perf_counter()
+
+    async def on_request_end(session: Any, context: Any, params: Any) -> None:
+        host = params.url.host
+        MetricsRegistry.observe('http_request_seconds', time.perf_counter() - context.start_time, host=host)
+        if params.response.content_length is not None:
+            MetricsRegistry.inc('http_response_bytes_total', params.response.content_length, host=host)
+        if params.response.status >= 400:
+            MetricsRegistry.inc('http_request_errors_total', host=host, error=str(params.response.status))
+
+    async def on_request_exception(session: Any, context: Any, params: Any) -> None:
+        host = params.url.host
+        MetricsRegistry.observe('http_request_seconds', time.perf_counter() - context.start_time, host=host)
+        MetricsRegistry.inc('http_request_errors_total', host=host, error=type(params.exception).__name__)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+def _record_exchange_response(exchange: Any, exchange_name: str) -> None:
+    response_headers = {k.lower(): v for k, v in (exchange.last_response_headers or {}).items()}
+    for header in ('x-mbx-used-weight-1m', 'x-mbx-used-weight'):
+        if header in response_headers:
+            MetricsRegistry.set('binance_used_weight', float(response_headers[header]), exchange=exchange_name,
+                                call_site='all')
+            break
+    if exchange.last_http_response is not None:
+        MetricsRegistry.inc('ccxt_response_bytes_total', len(exchange.last_http_response), exchange=exchange_name)
+
+
+def instrument_exchange(exchange: Any) -> Any:
+    """
+    Times every request of a sync ccxt exchange instance and records the Binance weight used
+    """
+    fetch = exchange.fetch
+    exchange_name = exchange.id
+
+    def instrumented_fetch(url: str, method: str = 'GET', headers: Any = None, body: Any = None) -> Any:
+        endpoint = url.split('?')[0].split('/', 3)[-1]
+        with MetricsRegistry.timed('ccxt_request', exchange=exchange_name, endpoint=endpoint):
+            response = fetch(url, method, headers, body)
+
+        _record_exchange_response(exchange, exchange_name)
+        return response
+
+    exchange.fetch = instrumented_fetch
+    return exchange
+
+
+def instrument_async_exchange(exchange: Any) -> Any:
+    """
+    instrument_exchange for a ccxt.async_support exchange instance
+    """
+    fetch = exchange.fetch
+    exchange_name = exchange.id
+
+    async def instrumented_fetch(url: str, method: str = 'GET', headers: Any = None, body: Any = None) -> Any:
+        endpoint = url.split('?')[0].split('/', 3)[-1]
+        with MetricsRegistry.timed('ccxt_request', exchange=exchange_name, endpoint=endpoint):
+            response = await fetch(url, method, headers, body)
+
+        _record_exchange_response(exchange, exchange_name)
+        return response
+
+    exchange.fetch = instrumented_fetch
+    return exchange
+
+
+class MetricsServer:
+
+    def __init__(self, port: int = 9100, host: str = '127.0.0.1'):
+        """
+        Serves /metrics in the Prometheus text format and /metrics.json as JSON, on localhost unless host says
+        otherwise, e.g. 0.0.0.0 for a Prometheus on another machine
+        """
+        self.port = port
+        self.host = host
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path == '/metrics':
+                body, content_type = MetricsRegistry.prometheus_text().encode(), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = json.dumps(MetricsRegistry.to_json()).encode(), 'application/json'
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    def start(self) -> 'MetricsServer':
+        self._server = ThreadingHTTPServer((self.host, self.port), self._Handler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    with call_site('Demo.fetch'):
+        for delay in (0.01, 0.02):
+            with MetricsRegistry.timed('demo_request', method='sleep'):
+                time.sleep(delay)
+    print(MetricsRegistry.prometheus_text())
+    print(f'process time is: {time.time() - start_time}')
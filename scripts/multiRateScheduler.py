@@ -0,0 +1,194 @@
+from typing import Optional, Dict, Tuple, Any, Callable, Iterable, Union
+from web3.types import ChecksumAddress, Address, ENS
+from dotenv import load_dotenv
+import datetime
+import threading
+import time
+import os
+from snapshotFetcher import OnChainSnapshotFetcher
+from incrementalChainState import IncrementalChainState
+from priceFetcher import PriceFetcher
+from binanceAccountFetcher import BinanceAccountInfo
+from dataProcessor import BalanceProcessor
+from dataBaseInserter import DatabaseInserter
+from databaseWriter import DatabaseWriter
+from snapshotSpool import SnapshotSpool
+from changeFilter import ChangeFilter
+from util.binancePairsEnumType import BinancePairsEnumType
+
+load_dotenv()
+
+
+class MultiRateCollector:
+
+    def __init__(self, writer: DatabaseWriter,
+                 spool: Optional[SnapshotSpool] = None,
+                 change_filter: Optional[ChangeFilter] = None,
+                 rollup: bool = False,
+                 chain_state: Optional[IncrementalChainState] = None,
+                 infura_api_key: Optional[str] = os.getenv('INFURA_API_KEY'),
+                 binance_api_key: Optional[str] = os.getenv('BINANCE_API_KEY'),
+                 binance_secret_key: Optional[str] = os.getenv('BINANCE_SECRET_KEY'),
+                 wallet_adr: Union[ChecksumAddress, ENS, Address, Optional[str]] = os.getenv('WALLET_ADDRESS'),
+                 gmx_index_assets: Tuple[str, ...] = ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI'),
+                 pairs: Iterable[str] = BinancePairsEnumType._member_names_,
+                 prices_interval: float = 5,
+                 positions_interval: float = 60,
+                 chain_interval: float = 600,
+                 persist_interval: float = 600,
+                 jitter: float = 1,
+                 max_workers: int = 4):
+        """
+        Refreshes every data group on its own cadence instead of rebuilding everything in one cron job:
+        prices: Binance and CoinGecko prices, Binance wallet and margin ratio, every prices_interval seconds
+        positions: Binance hedge positions and funding rates, every positions_interval seconds
+        chain: the on-chain Multicall snapshot (GLP composition, rewards, wallet), every chain_interval seconds
+        Each group replaces its part of the shared state when it finishes, and persist writes the latest state of
+        every group to MySQL. Runs of the same job never overlap, missed runs are coalesced into one and the jobs
+        share a bounded thread pool.
+        change_filter: differential writes, useful once persist_interval is short
+        chain_state: moves the chain group forward with event logs instead of a full snapshot, which makes a short
+        chain_interval affordable
+        """
+        self.writer = writer
+        self.spool = spool
+        self.change_filter = change_filter
+        self.rollup = rollup
+        self.chain_state = chain_state
+        self.infura_api_key = infura_api_key
+        self.binance_api_key = binance_api_key
+        self.binance_secret_key = binance_secret_key
+        self.wallet_adr = wallet_adr
+        self.gmx_index_assets = gmx_index_assets
+        self.pairs = tuple(pairs)
+        self.intervals: Dict[str, float] = {'prices': prices_interval,
+                                            'positions': positions_interval,
+                                            'chain': chain_interval,
+                                            'persist': persist_interval}
+        self.jitter = jitter
+        self.max_workers = max_workers
+
+        # one client for every run, a new ccxt instance would load the markets again on its first request
+        self.account = BinanceAccountInfo(binance_api_key=binance_api_key, binance_secret_key=binance_secret_key)
+
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._updated: Dict[str, datetime.datetime] = {}
+        self._lock = threading.Lock()
+
+    def refresh_prices(self) -> None:
+        account = self.account
+        # CoinGecko is only refetched once its CycleCache TTL has expired
+        self._publish('prices', {'price_dict_binance': PriceFetcher().get_assets_price_binance(),
+                                 'price_dict_coingecko': PriceFetcher().get_assets_price_coingecko(),
+                                 'amount': account.get_balance_amount(),
+                                 'margin_ratio': account.get_total_margin_ratio()})
+
+    def refresh_positions(self) -> None:
+        self._publish('positions', {'hedge': self.account.get_hedge_info(self.pairs)})
+
+    def refresh_chain(self) -> None:
+        if self.chain_state is not None:
+            self._publish('chain', {'snapshot': self.chain_state.get_snapshot()})
+            return
+        snapshot = OnChainSnapshotFetcher(infura_api_key=self.infura_api_key,
+                                          wallet_adr=self.wallet_adr,
+                                          gmx_index_assets=self.gmx_index_assets).get_snapshot()
+        self._publish('chain', {'snapshot': snapshot})
+
+    def _publish(self, group: str, values: Dict[str, Any]) -> None:
+        with self._lock:
+            self._state[group] = values
+            self._updated[group] = datetime.datetime.now()
+
+    def collected(self) -> Optional[Dict[str, Any]]:
+        """
+        Latest state of every group in the shape of AsyncBalanceCollector.collect(), None until each group has
+        finished once
+        """
+        with self._lock:
+            if any(group not in self._state for group in ('prices', 'positions', 'chain')):
+                return None
+            prices, positions, chain = self._state['prices'], self._state['positions'], self._state['chain']
+
+        return {'snapshot': chain['snapshot'],
+                'price_dict_binance': prices['price_dict_binance'],
+                'price_dict_coingecko': prices['price_dict_coingecko'],
+                'binance_summary': {'hedge': positions['hedge'],
+                                    'amount': prices['amount'],
+                                    'margin_ratio': prices['margin_ratio']}}
+
+    def persist(self) -> None:
+        collected = self.collected()
+        if collected is None:
+            print(f'Persist skipped at {datetime.datetime.now()}, waiting for {self._missing_groups()}')
+            return
+
+        updater = DatabaseInserter(processor=BalanceProcessor(infura_api_key=self.infura_api_key,
+                                                              binance_api_key=self.binance_api_key,
+                                                              binance_secret_key=self.binance_secret_key,
+                                                              wallet_adr=self.wallet_adr,
+                                                              gmx_index_assets=self.gmx_index_assets,
+                                                              collected=collected))
+        write_stats = updater.insert_all(self.writer, spool=self.spool, change_filter=self.change_filter,
+                                         rollup=self.rollup)
+        print(f'Persisted {write_stats["rows"]} rows at {datetime.datetime.now()}, group ages: {self.ages()}')
+
+    def _missing_groups(self) -> Tuple[str, ...]:
+        with self._lock:
+            return tuple(group for group in ('prices', 'positions', 'chain') if group not in self._state)
+
+    def ages(self) -> Dict[str, float]:
+        """
+        Seconds since each group was last refreshed
+        """
+        now = datetime.datetime.now()
+        with self._lock:
+            return {group: (now - updated).total_seconds() for group, updated in self._updated.items()}
+
+    @staticmethod
+    def _logged(group: str, job: Callable[[], None]) -> Callable[[], None]:
+        def run() -> None:
+            start_time = time.time()
+            try:
+                job()
+            except Exception as e:
+                print(f'{group} fails at {datetime.datetime.now()}: {e}')
+                return
+            print(f'{group} refreshed in {time.time() - start_time:.2f}s')
+
+        return run
+
+    def build_scheduler(self) -> Any:
+        from apscheduler.schedulers.blocking import BlockingScheduler  # type: ignore
+        from apscheduler.executors.pool import ThreadPoolExecutor  # type: ignore
+
+        sched = BlockingScheduler(executors={'default': ThreadPoolExecutor(self.max_workers)},
+                                  job_defaults={'coalesce': True, 'max_instances': 1})
+        jobs: Dict[str, Callable[[], None]] = {'prices': self.refresh_prices,
+                                               'positions': self.refresh_positions,
+                                               'chain': self.refresh_chain,
+                                               'persist': self.persist}
+        now = datetime.datetime.now()
+
+        for group, job in jobs.items():
+            interval = self.intervals[group]
+            # the data groups start right away, the first persist waits for them
+            first_run = now + datetime.timedelta(seconds=interval if group == 'persist' else 0)
+            sched.add_job(self._logged(group, job), 'interval', seconds=interval, jitter=self.jitter,
+                          next_run_time=first_run, misfire_grace_time=interval, id=group)
+
+        return sched
+
+    def start(self) -> None:
+        self.build_scheduler().start()
+
+
+if __name__ == '__main__':
+    collector = MultiRateCollector(DatabaseWriter(), prices_interval=5, positions_interval=15, chain_interval=30,
+                                   persist_interval=30)
+    start_time = time.time()
+    collector.refresh_prices()
+    collector.refresh_positions()
+    collector.refresh_chain()
+    print(collector.collected())
+    print(f'process time is: {time.time() - start_time}')
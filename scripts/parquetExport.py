@@ -0,0 +1,291 @@
+import argparse
+import datetime
+import decimal
+import json
+import os
+import time
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from databaseWriter import DatabaseWriter
+from dataBaseInserter import DatabaseInserter
+
+load_dotenv()
+
+# hive partition column, one directory per day of created_date
+PARTITION: str = 'date'
+PARTITIONING = ds.partitioning(pa.schema([(PARTITION, pa.date32())]), flavor='hive')
+
+
+class ParquetExporter:
+
+    def __init__(self, writer: DatabaseWriter,
+                 root: str = os.getenv('PARQUET_DIR', 'history'),
+                 tables: Iterable[str] = tuple(DatabaseInserter.TABLE_COLUMNS),
+                 batch_size: int = 50_000,
+                 row_group_size: int = 128_000,
+                 gap_timeout: float = 3600,
+                 gap_window: int = 10_000):
+        """
+        Copies the MySQL history to root/<table>/date=YYYY-MM-DD/part-<first id>-<last id>.parquet, only the rows
+        past the last exported id of each table, read in id order batch_size rows per query. The last id is saved
+        in root/_export_state.json after each batch.
+        The writer pool, the spool replayer and the multi-rate jobs commit concurrently, so an id can commit after
+        a higher one was exported: every id missing below the last exported one is kept as a gap and looked up
+        again on each run, until it shows up or gap_timeout seconds have passed (a rolled back insert never does).
+        Only the gap_window ids below the newest exported one can still be in flight, older holes are not tracked.
+        A run interrupted between a file and the state can export rows twice, compact() and
+        ParquetHistory.read() drop the duplicate ids
+        """
+        self.writer = writer
+        self.root = root
+        self.tables = tuple(tables)
+        self.batch_size = batch_size
+        self.row_group_size = row_group_size
+        self.gap_timeout = gap_timeout
+        self.gap_window = gap_window
+        self.state_path = os.path.join(root, '_export_state.json')
+        self.state: Dict[str, int] = {}
+        # table -> missing id -> time it was first seen missing
+        self.gaps: Dict[str, Dict[str, float]] = {}
+        self._load_state()
+
+    def _load_state(self) -> None:
+        if not os.path.exists(self.state_path):
+            return
+        with open(self.state_path) as f:
+            state = json.load(f)
+        self.state = state['last_ids']
+        self.gaps = state.get('gaps', {})
+
+    def _save_state(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_ids': self.state, 'gaps': self.gaps}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _fetch(self, table: str, last_id: int) -> Tuple[List[str], List[Tuple]]:
+        with self.writer.connection() as con:
+            cur = con.cursor()
+            try:
+                cur.execute(f'SELECT * FROM {table} WHERE id > %s ORDER BY id LIMIT %s', [last_id, self.batch_size])
+                columns = [description[0] for description in cur.description]
+                rows = list(cur.fetchall())
+            finally:
+                cur.close()
+
+        return columns, rows
+
+    def _fetch_ids(self, table: str, ids: List[int]) -> Tuple[List[str], List[Tuple]]:
+        columns: List[str] = []
+        rows: List[Tuple] = []
+        with self.writer.connection() as con:
+            cur = con.cursor()
+            try:
+                for offset in range(0, len(ids), self.batch_size):
+                    chunk = ids[offset:offset + self.batch_size]
+                    cur.execute(f'SELECT * FROM {table} WHERE id IN ({", ".join(["%s"] * len(chunk))})', chunk)
+                    columns = [description[0] for description in cur.description]
+                    rows.extend(cur.fetchall())
+            finally:
+                cur.close()
+
+        return columns, rows
+
+    @staticmethod
+    def to_arrow(columns: List[str], rows: List[Tuple]) -> pa.Table:
+        """
+        DECIMAL columns become float64, the rest keeps the type MySQLdb returned
+        """
+        arrays = {}
+        for i, column in enumerate(columns):
+            values = [row[i] for row in rows]
+            if any(isinstance(value, decimal.Decimal) for value in values):
+                values = [float(value) if value is not None else None for value in values]
+            arrays[column] = values
+
+        return pa.table(arrays)
+
+    def _write(self, table: str, batch: pa.Table) -> int:
+        days = pc.cast(batch.column('created_date'), pa.date32())
+        written = 0
+
+        for day in pc.unique(days).to_pylist():
+            part = batch.filter(pc.equal(days, pa.scalar(day, pa.date32())))
+            part_ids = part.column('id')
+            directory = os.path.join(self.root, table, f'{PARTITION}={day.isoformat()}')
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'part-{pc.min(part_ids).as_py():012d}-{pc.max(part_ids).as_py():012d}'
+                                           f'.parquet')
+            # renamed into place so a reader never sees half a file
+            pq.write_table(part, path + '.tmp', row_group_size=self.row_group_size, compression='zstd')
+            os.replace(path + '.tmp', path)
+            written += part.num_rows
+
+        ids = batch.column('id').to_pylist()
+        last_id = self.state.get(table, 0)
+        new_last_id = max(last_id, max(ids))
+        gaps = self.gaps.setdefault(table, {})
+        for found in ids:
+            gaps.pop(str(found), None)
+        present = set(ids)
+        now = time.time()
+        for missing in range(max(last_id, new_last_id - self.gap_window) + 1, new_last_id + 1):
+            if missing not in present:
+                gaps[str(missing)] = now
+
+        self.state[table] = new_last_id
+        self._save_state()
+
+        return written
+
+    def _recover_gaps(self, table: str) -> int:
+        """
+        Exports the rows of the gaps that have committed since, forgets the gaps older than gap_timeout
+        """
+        gaps = self.gaps.get(table, {})
+        expired = [missing for missing, first_seen in gaps.items() if time.time() - first_seen > self.gap_timeout]
+        for missing in expired:
+            del gaps[missing]
+        if not gaps:
+            if expired:
+                self._save_state()
+            return 0
+
+        columns, rows = self._fetch_ids(table, sorted(int(missing) for missing in gaps))
+        if not rows:
+            if expired:
+                self._save_state()
+            return 0
+
+        return self._write(table, self.to_arrow(columns, rows))
+
+    def export_table(self, table: str) -> int:
+        exported = self._recover_gaps(table)
+        while True:
+            columns, rows = self._fetch(table, self.state.get(table, 0))
+            if not rows:
+                return exported
+            exported += self._write(table, self.to_arrow(columns, rows))
+            if len(rows) < self.batch_size:
+                return exported
+
+    def export(self) -> Dict[str, int]:
+        """
+        table -> rows appended by this run
+        """
+        return {table: self.export_table(table) for table in self.tables}
+
+    @staticmethod
+    def deduplicate(table: pa.Table) -> pa.Table:
+        """
+        Keeps the last row of each id
+        """
+        ids = table.column('id').to_numpy()
+        _, last = np.unique(ids[::-1], return_index=True)
+        if len(last) == len(ids):
+            return table
+        return table.take(np.sort(len(ids) - 1 - last))
+
+    def compact(self, table: str, before: Optional[datetime.date] = None) -> int:
+        """
+        Merges the files of every day partition older than before, today by default, into one file, each
+        incremental run otherwise leaves one small file per day it touched. Returns the partitions rewritten
+        """
+        before = before if before is not None else datetime.date.today()
+        table_root = os.path.join(self.root, table)
+        if not os.path.isdir(table_root):
+            return 0
+
+        compacted = 0
+        for name in sorted(os.listdir(table_root)):
+            directory = os.path.join(table_root, name)
+            if not name.startswith(f'{PARTITION}=') or datetime.date.fromisoformat(name.split('=')[1]) >= before:
+                continue
+            files = sorted(file for file in os.listdir(directory) if file.endswith('.parquet'))
+            if len(files) < 2:
+                continue
+
+            merged = self.deduplicate(pa.concat_tables([pq.read_table(os.path.join(directory, file))
+                                                        for file in files]))
+            first_id, last_id = pc.min(merged.column('id')).as_py(), pc.max(merged.column('id')).as_py()
+            path = os.path.join(directory, f'part-{first_id:012d}-{last_id:012d}.parquet')
+            pq.write_table(merged, path + '.tmp', row_group_size=self.row_group_size, compression='zstd')
+            os.replace(path + '.tmp', path)
+            for file in files:
+                if os.path.join(directory, file) != path:
+                    os.remove(os.path.join(directory, file))
+            compacted += 1
+
+        return compacted
+
+
+class ParquetHistory:
+    """
+    Reads the exported history into pandas. Files are memory-mapped, only the requested columns are decoded, the
+    start / end range skips whole day partitions and, through the row group statistics, the row groups outside it
+    """
+
+    def __init__(self, root: str = os.getenv('PARQUET_DIR', 'history')):
+        self.root = root
+        self._filesystem = pafs.LocalFileSystem(use_mmap=True)
+
+    def dataset(self, table: str) -> ds.Dataset:
+        return ds.dataset(os.path.join(self.root, table), format='parquet', partitioning=PARTITIONING,
+                          filesystem=self._filesystem)
+
+    def read(self, table: str, columns: Optional[List[str]] = None,
+             start: Optional[datetime.datetime] = None,
+             end: Optional[datetime.datetime] = None,
+             accounts: Optional[Iterable[str]] = None,
+             filter: Optional[ds.Expression] = None) -> pd.DataFrame:
+        """
+        Rows with start <= created_date < end, of the given accounts, matching filter, e.g.
+        ds.field('symbol') == 'WETH'. Rows exported twice by an interrupted run are returned once
+        """
+        expressions: List[ds.Expression] = []
+        if start is not None:
+            expressions += [ds.field(PARTITION) >= pa.scalar(start.date(), pa.date32()),
+                            ds.field('created_date') >= pa.scalar(start, pa.timestamp('us'))]
+        if end is not None:
+            expressions += [ds.field(PARTITION) <= pa.scalar(end.date(), pa.date32()),
+                            ds.field('created_date') < pa.scalar(end, pa.timestamp('us'))]
+        if accounts is not None:
+            expressions.append(ds.field('account').isin(list(accounts)))
+        if filter is not None:
+            expressions.append(filter)
+
+        expression: Optional[ds.Expression] = None
+        for item in expressions:
+            expression = item if expression is None else expression & item
+
+        scanned = columns if columns is None or 'id' in columns else list(columns) + ['id']
+        result = ParquetExporter.deduplicate(self.dataset(table).to_table(columns=scanned, filter=expression))
+        if scanned is not columns:
+            result = result.drop(['id'])
+
+        return result.to_pandas()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Append the new MySQL rows to the Parquet history')
+    parser.add_argument('--root', default=os.getenv('PARQUET_DIR', 'history'))
+    parser.add_argument('--tables', default=','.join(DatabaseInserter.TABLE_COLUMNS))
+    parser.add_argument('--batch-size', type=int, default=50_000)
+    parser.add_argument('--compact', action='store_true', help='merge the files of the past days afterwards')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    exporter = ParquetExporter(DatabaseWriter(pool_size=1), root=args.root, tables=args.tables.split(','),
+                               batch_size=args.batch_size)
+    print(exporter.export())
+    if args.compact:
+        print({table: exporter.compact(table) for table in exporter.tables})
+    print(f'process time is: {time.time() - start_time}')
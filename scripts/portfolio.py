@@ -0,0 +1,123 @@
+from web3 import Web3
+from typing import Optional, List, Dict, Tuple, Any
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import datetime
+import json
+import os
+import time
+import uuid
+from portfolioFetcher import PortfolioSnapshotFetcher
+from priceFetcher import PriceFetcher
+from binanceAccountFetcher import BinanceAccountInfo
+from dataProcessor import BalanceProcessor
+from dataBaseInserter import DatabaseInserter
+from databaseWriter import DatabaseWriter
+from snapshotSpool import SnapshotSpool
+from changeFilter import ChangeFilter
+
+load_dotenv()
+
+# summary of an account without Binance keys, it writes no hedge rows
+EMPTY_BINANCE_SUMMARY: Dict[str, Any] = {'hedge': {'notional': {}}, 'amount': {}, 'margin_ratio': 0}
+
+
+class Portfolio:
+
+    def __init__(self, accounts: List[Dict[str, Optional[str]]],
+                 infura_api_key: Optional[str] = os.getenv('INFURA_API_KEY'),
+                 gmx_index_assets: Tuple[str, ...] = ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI'),
+                 wallets_per_call: int = 100,
+                 max_workers: int = 8):
+        """
+        Many wallets and Binance accounts in one cycle. Prices, the vault state and GLP AUM are fetched once for
+        the whole portfolio, wallet balances and staking go through PortfolioSnapshotFetcher in a few Multicalls,
+        and only the Binance accounts, which need their own keys, are read one by one, max_workers at a time.
+        accounts: [{'name': ..., 'wallet': ..., 'binance_api_key': ..., 'binance_secret_key': ...}], the Binance
+        keys are optional
+        """
+        names = [account['name'] for account in accounts]
+        if len(set(names)) != len(names):
+            raise ValueError('Portfolio account names must be unique')
+
+        self.accounts = accounts
+        self.infura_api_key = infura_api_key
+        self.gmx_index_assets = gmx_index_assets
+        self.wallets_per_call = wallets_per_call
+        self.max_workers = max_workers
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs: Any) -> 'Portfolio':
+        """
+        Reads the accounts from a JSON list, a value starting with $ is read from that environment variable so the
+        keys can stay in .env
+        """
+        with open(path) as f:
+            accounts = json.load(f)
+
+        return cls([{key: os.getenv(value[1:]) if isinstance(value, str) and value.startswith('$') else value
+                     for key, value in account.items()} for account in accounts], **kwargs)
+
+    def _binance_summary(self, account: Dict[str, Optional[str]]) -> Dict[str, Any]:
+        if not account.get('binance_api_key'):
+            return EMPTY_BINANCE_SUMMARY
+
+        return BinanceAccountInfo(binance_api_key=account['binance_api_key'],
+                                  binance_secret_key=account.get('binance_secret_key')).get_summary()
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        """
+        account name -> the inputs of BalanceProcessor(collected=...) for that account
+        """
+        snapshots = PortfolioSnapshotFetcher(wallets=dict.fromkeys(account['wallet'] for account in self.accounts),
+                                             infura_api_key=self.infura_api_key,
+                                             gmx_index_assets=self.gmx_index_assets,
+                                             wallets_per_call=self.wallets_per_call).get_snapshots()
+        price_dict_binance = PriceFetcher().get_assets_price_binance()
+        price_dict_coingecko = PriceFetcher().get_assets_price_coingecko()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            binance_summaries = list(executor.map(self._binance_summary, self.accounts))
+
+        return {account['name']: {'snapshot': snapshots[Web3.toChecksumAddress(account['wallet'])],
+                                  'price_dict_binance': price_dict_binance,
+                                  'price_dict_coingecko': price_dict_coingecko,
+                                  'binance_summary': binance_summary}
+                for account, binance_summary in zip(self.accounts, binance_summaries)}
+
+    def get_snapshot_rows(self, created_time: Optional[datetime.datetime] = None) -> Dict[str, List]:
+        """
+        Rows of every account, told apart by the account column, all with the same created time
+        """
+        created_time = created_time if created_time is not None else datetime.datetime.now()
+        collected = self.collect()
+        rows: Dict[str, List] = {table: [] for table in DatabaseInserter.TABLE_COLUMNS}
+
+        for account in self.accounts:
+            processor = BalanceProcessor(infura_api_key=self.infura_api_key,
+                                         binance_api_key=account.get('binance_api_key'),
+                                         binance_secret_key=account.get('binance_secret_key'),
+                                         wallet_adr=account['wallet'],
+                                         gmx_index_assets=self.gmx_index_assets,
+                                         collected=collected[account['name']])
+            inserter = DatabaseInserter(processor=processor, created_time=created_time, account=account['name'])
+            for table, table_rows in inserter.get_snapshot_rows().items():
+                rows[table].extend(table_rows)
+
+        return rows
+
+    def insert_all(self, writer: DatabaseWriter, spool: Optional[SnapshotSpool] = None,
+                   change_filter: Optional[ChangeFilter] = None, rollup: bool = False) -> Dict[str, float]:
+        """
+        DatabaseInserter.insert_all for the whole portfolio, one transaction for every account
+        """
+        return DatabaseInserter.write_rows(writer, self.get_snapshot_rows(), uuid.uuid4().hex, spool=spool,
+                                           change_filter=change_filter, rollup=rollup)
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    portfolio = Portfolio.from_file(os.getenv('PORTFOLIO_FILE', 'portfolio.json'))
+    for table, table_rows in portfolio.get_snapshot_rows().items():
+        print(table, table_rows)
+    print(f'process time is: {time.time() - start_time}')
@@ -0,0 +1,159 @@
+from web3 import Web3
+from typing import Optional, List, Dict, Tuple, Any, Iterable
+from dotenv import load_dotenv
+import os
+import time
+from util.tokensInfoEnumType import TokenAddressEnumType, TokenDecimalsEnumType, TokenAbiEnumType
+from util.contractInfoEnumType import ContractAddressEnumType, ContractAbiEnumType
+from web3.types import ChecksumAddress, BlockIdentifier
+from snapshotFetcher import OnChainSnapshotFetcher
+from glpFetcher import GLPDataFetcher
+from vaultState import VaultState
+from web3Registry import Web3Registry
+from cycleCache import cached
+from enum import Enum
+
+load_dotenv()
+
+# Reader.getTokenBalances returns the native balance for the zero address
+ETH_ADDRESS: ChecksumAddress = Web3.toChecksumAddress('0x' + '0' * 40)
+
+
+class PortfolioSnapshotFetcher:
+
+    def __init__(self, wallets: Iterable[str],
+                 infura_api_key: Optional[str] = os.getenv('INFURA_API_KEY'),
+                 gmx_index_assets: Tuple[str, ...] = ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI'),
+                 metamask_tokens: Tuple[str, ...] = ('WBTC', 'WETH', 'ETH', 'FRAX', 'LINK', 'GMX', 'USDT',
+                                                     'USDC', 'UNI', 'DAI', 'esGMX'),
+                 conn: Optional[Web3] = None,
+                 multicall_adr: ChecksumAddress = ContractAddressEnumType.Multicall.value,
+                 block_identifier: BlockIdentifier = 'latest',
+                 wallets_per_call: int = 100):
+        """
+        OnChainSnapshotFetcher for many wallets: the vault state, GLP supply and AUM are read once, and each wallet
+        only adds Reader.getTokenBalances, RewardReader.getDepositBalances and RewardReader.getStakingInfo, three
+        calls whatever the number of tokens. The wallet calls go into Multicall aggregates of wallets_per_call
+        wallets, all pinned to the block of the shared read, so 300 wallets cost 4 round-trips
+        """
+        if conn is None:
+            conn = Web3Registry.get_connection(Web3Registry.infura_url(infura_api_key))
+
+        self.conn = conn
+        self.wallets: Tuple[ChecksumAddress, ...] = tuple(Web3.toChecksumAddress(wallet) for wallet in wallets)
+        self.gmx_index_assets = gmx_index_assets
+        self.metamask_tokens = metamask_tokens
+        self.block_identifier = block_identifier
+        self.wallets_per_call = wallets_per_call
+        self._cache_key = (self.wallets, gmx_index_assets, metamask_tokens, multicall_adr, id(conn), block_identifier)
+        self.multicall = Web3Registry.get_contract(self.conn, multicall_adr, ContractAbiEnumType.Multicall)
+        self._shared_calls: Optional[List[Tuple[str, ChecksumAddress, bytes, List[str]]]] = None
+        self._wallet_calls: Dict[ChecksumAddress, List[Tuple[str, ChecksumAddress, bytes, List[str]]]] = {}
+
+    def _build_shared_calls(self) -> List[Tuple[str, ChecksumAddress, bytes, List[str]]]:
+        calls: List[Tuple[str, ChecksumAddress, bytes, List[str]]] = []
+
+        def add(key: str, contract: Tuple[ChecksumAddress, Enum], fn_name: str, args: List) -> None:
+            calls.append((key, *OnChainSnapshotFetcher._encode(*contract, fn_name, args)))
+
+        token_adr: List[str] = [TokenAddressEnumType[token].value for token in self.gmx_index_assets]
+        add('vault_token_info', (ContractAddressEnumType.Reader.value, ContractAbiEnumType.Reader),
+            'getVaultTokenInfoV2', [ContractAddressEnumType.vault.value, TokenAddressEnumType.WETH.value, 0, token_adr])
+        add('glp_supply', (TokenAddressEnumType.GLP.value, TokenAbiEnumType.GLP), 'totalSupply', [])
+
+        glp_manager = (ContractAddressEnumType.GLPManager.value, ContractAbiEnumType.GLPManager)
+        add('aum_buy', glp_manager, 'getAum', [True])
+        add('aum_sell', glp_manager, 'getAum', [False])
+
+        multicall = (self.multicall.address, ContractAbiEnumType.Multicall)
+        add('block_timestamp', multicall, 'getCurrentBlockTimestamp', [])
+
+        return calls
+
+    def _build_wallet_calls(self, wallet: ChecksumAddress) -> List[Tuple[str, ChecksumAddress, bytes, List[str]]]:
+        encode = OnChainSnapshotFetcher._encode
+        reward_reader = (ContractAddressEnumType.RewardReader.value, ContractAbiEnumType.RewardReader)
+        balance_adr = [ETH_ADDRESS if token == 'ETH' else TokenAddressEnumType[token].value
+                       for token in self.metamask_tokens]
+
+        return [('token_balances', *encode(ContractAddressEnumType.Reader.value, ContractAbiEnumType.Reader,
+                                           'getTokenBalances', [wallet, balance_adr])),
+                # staked GMX, staked esGMX, staked GLP: FeeGlpTracker only takes GLP deposits
+                ('deposit_balances', *encode(*reward_reader, 'getDepositBalances',
+                                             [wallet,
+                                              [TokenAddressEnumType.GMX.value, TokenAddressEnumType.esGMX.value,
+                                               TokenAddressEnumType.GLP.value],
+                                              [ContractAddressEnumType.StakedGmxTracker.value,
+                                               ContractAddressEnumType.StakedGmxTracker.value,
+                                               ContractAddressEnumType.FeeGlpTracker.value]])),
+                ('staking_info', *encode(*reward_reader, 'getStakingInfo',
+                                         [wallet, [ContractAddressEnumType.StakedGmxTracker.value,
+                                                   ContractAddressEnumType.FeeGmxTracker.value,
+                                                   ContractAddressEnumType.FeeGlpTracker.value,
+                                                   ContractAddressEnumType.StakedGlpTracker.value]]))]
+
+    def _aggregate(self, calls: List[Tuple[str, ChecksumAddress, bytes, List[str]]],
+                   block_identifier: BlockIdentifier) -> Tuple[int, List[bytes]]:
+        block_number, return_data = self.multicall.functions.aggregate(
+            [(target, call_data) for _, target, call_data, _ in calls]).call(block_identifier=block_identifier)
+
+        return block_number, return_data
+
+    def _shared(self, raw: Dict[str, Any], block_number: int) -> Dict[str, Any]:
+        glp_supply: float = raw['glp_supply'] / 10 ** TokenDecimalsEnumType.GLP.value
+        vault_state = VaultState.decode(raw['vault_token_info'], self.gmx_index_assets)
+
+        return {'block_number': block_number,
+                'block_timestamp': raw['block_timestamp'],
+                'vault_state': vault_state,
+                'tokens_info': vault_state.tokens_info(),
+                'gmx_price': vault_state.prices(),
+                'glp_supply': glp_supply,
+                'glp_price': {'buy': raw['aum_buy'] / 10 ** 30 / glp_supply,
+                              'sell': raw['aum_sell'] / 10 ** 30 / glp_supply}}
+
+    def _wallet(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        staked_gmx, staked_esgmx, staked_glp = raw['deposit_balances']
+
+        return {'staked_glp_amount': staked_glp / 10 ** TokenDecimalsEnumType.GLP.value,
+                'staked_gmx_amount': staked_gmx / 10 ** TokenDecimalsEnumType.GMX.value,
+                'staked_esgmx_amount': staked_esgmx / 10 ** TokenDecimalsEnumType.esGMX.value,
+                'claimable_info': GLPDataFetcher._parse_claimable_info(raw['staking_info']),
+                'metamask_balance': {token: balance / 10 ** TokenDecimalsEnumType[token].value
+                                     for token, balance in zip(self.metamask_tokens, raw['token_balances'])}}
+
+    @cached('infura')
+    def get_snapshots(self) -> Dict[ChecksumAddress, Dict[str, Any]]:
+        """
+        wallet -> the dict of OnChainSnapshotFetcher.get_snapshot() for that wallet, the shared fields are the same
+        objects in every snapshot and must not be modified
+        """
+        if self._shared_calls is None:
+            self._shared_calls = self._build_shared_calls()
+        block_number, return_data = self._aggregate(self._shared_calls, self.block_identifier)
+        shared = self._shared(OnChainSnapshotFetcher._decode(self._shared_calls, return_data), block_number)
+
+        snapshots: Dict[ChecksumAddress, Dict[str, Any]] = {}
+        for offset in range(0, len(self.wallets), self.wallets_per_call):
+            chunk = self.wallets[offset:offset + self.wallets_per_call]
+            calls = []
+            for wallet in chunk:
+                if wallet not in self._wallet_calls:
+                    self._wallet_calls[wallet] = self._build_wallet_calls(wallet)
+                calls.extend(self._wallet_calls[wallet])
+
+            _, return_data = self._aggregate(calls, block_number)
+            calls_per_wallet = len(calls) // len(chunk)
+            for index, wallet in enumerate(chunk):
+                wallet_slice = slice(index * calls_per_wallet, (index + 1) * calls_per_wallet)
+                raw = OnChainSnapshotFetcher._decode(calls[wallet_slice], return_data[wallet_slice])
+                snapshots[wallet] = dict(shared, **self._wallet(raw))
+
+        return snapshots
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    test = PortfolioSnapshotFetcher(wallets=[os.getenv('WALLET_ADDRESS')])
+    print(test.get_snapshots())
+    print(f'process time is: {time.time() - start_time}')
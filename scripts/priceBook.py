@@ -0,0 +1,176 @@
+import aiohttp
+import asyncio
+import json
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple, Callable, List
+
+
+class BinancePriceBook:
+
+    def __init__(self,
+                 target_tokens: Iterable[str] = ("BTC", "ETH", 'UNI', 'LINK', 'GMX', "DAI", "USDC"),
+                 quote: str = 'USDT',
+                 stream: str = 'bookTicker',
+                 url: str = 'wss://stream.binance.com:9443/stream',
+                 reconnect_delay: float = 1,
+                 max_reconnect_delay: float = 60):
+        """
+        Long-running price book fed by Binance websocket streams, prices are kept in memory so readers never wait
+        on the network.
+        stream: 'bookTicker' keeps the mid of the best bid / ask, 'ticker' keeps the last price of the 24h ticker
+        url: base of the combined stream endpoint, can point to a local websocket server
+        """
+        if stream not in ('bookTicker', 'ticker'):
+            raise ValueError(f'Unsupported stream {stream}')
+
+        self.target_tokens = tuple(target_tokens)
+        self.quote = quote
+        self.stream = stream
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self._symbol_to_token: Dict[str, str] = {token + quote: token for token in self.target_tokens}
+        self._prices: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[str, float], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    @property
+    def stream_url(self) -> str:
+        streams = '/'.join(f'{symbol.lower()}@{self.stream}' for symbol in self._symbol_to_token)
+        return f'{self.url}?streams={streams}'
+
+    def add_listener(self, listener: Callable[[str, float], None]) -> None:
+        """
+        listener(token, price) is called from the stream thread on every update
+        """
+        self._listeners.append(listener)
+
+    def _on_message(self, message: str) -> None:
+        """
+        A malformed message is logged and dropped, a failing listener is logged and the next one still called, so
+        neither ends the stream
+        """
+        try:
+            data = json.loads(message)
+            data = data.get('data', data)
+            token = self._symbol_to_token.get(data.get('s'))
+            if token is None:
+                return
+
+            if self.stream == 'bookTicker':
+                price = (float(data['b']) + float(data['a'])) / 2
+            else:
+                price = float(data['c'])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f'Price book dropped a malformed message {message[:200]!r}: {e!r}')
+            return
+
+        with self._lock:
+            self._prices[token] = (price, time.time())
+
+        for listener in self._listeners:
+            try:
+                listener(token, price)
+            except Exception as e:
+                print(f'Price book listener {listener!r} failed on {token}: {e!r}')
+
+    async def _run(self) -> None:
+        delay = self.reconnect_delay
+
+        async with aiohttp.ClientSession() as session:
+            while not self._stopped.is_set():
+                try:
+                    async with session.ws_connect(self.stream_url) as ws:
+                        delay = self.reconnect_delay
+                        async for message in ws:
+                            if message.type == aiohttp.WSMsgType.TEXT:
+                                self._on_message(message.data)
+                            elif message.type == aiohttp.WSMsgType.ERROR:
+                                raise ws.exception() or ConnectionError('websocket error')
+                            if self._stopped.is_set():
+                                return
+                    print(f'Price book stream closed, reconnecting in {delay}s')
+                # anything but a cancel from stop() reconnects, the stream thread must not die
+                except Exception as e:
+                    print(f'Price book stream dropped: {e!r}, reconnecting in {delay}s')
+
+                if self._stopped.is_set():
+                    return
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._task)  # type: ignore
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()  # type: ignore
+
+    def start(self) -> 'BinancePriceBook':
+        if self._thread is not None:
+            return self
+
+        self._stopped.clear()
+        self._loop = asyncio.new_event_loop()
+        self._task = self._loop.create_task(self._run())
+        self._thread = threading.Thread(target=self._run_loop, name='binance-price-book', daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stopped.set()
+        if self._loop is not None and self._task is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def wait_ready(self, timeout: float = 10) -> bool:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._lock:
+                if all(token in self._prices for token in self.target_tokens):
+                    return True
+            time.sleep(0.05)
+
+        return False
+
+    def get_prices(self, target_tokens: Iterable[str], max_age: float = 10) -> Optional[Dict[str, float]]:
+        """
+        Latest price of every token, None when one of them is missing or older than max_age seconds.
+        The quote currency is priced at 1 as in PriceFetcher.get_assets_price_binance
+        """
+        now = time.time()
+        price_dict: Dict[str, float] = {}
+
+        with self._lock:
+            for token in target_tokens:
+                if token == self.quote:
+                    price_dict[token] = 1
+                    continue
+
+                entry = self._prices.get(token)
+                if entry is None or now - entry[1] > max_age:
+                    return None
+                price_dict[token] = entry[0]
+
+        return price_dict
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    book = BinancePriceBook().start()
+    print(f'ready: {book.wait_ready()} after {time.time() - start_time}')
+    start_time = time.time()
+    print(book.get_prices(("BTC", "ETH", 'UNI', 'LINK', 'GMX', "DAI", "USDC", "USDT")))
+    print(f'read time is: {time.time() - start_time}')
+    book.stop()
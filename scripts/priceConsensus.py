@@ -0,0 +1,136 @@
+import numpy as np
+import threading
+import time
+import warnings
+from typing import Dict, Tuple, Any, Optional, List
+
+# method names, in the order of the stacked candidates of resolve()
+METHODS: Tuple[str, ...] = ('mean', 'median', 'min', 'max', 'trimmed_mean')
+
+
+class PriceConsensus:
+    """
+    Sources x tokens matrix of the latest prices and their timestamps. resolve() turns it into one price per token
+    in a single vectorized pass, each token following its policy:
+    method: one of METHODS over the sources left
+    sources: the sources the token may be priced from, every source when None
+    max_age: seconds after which a source price is stale and ignored, no cutoff when None
+    outlier_threshold: a price further than this relative distance from the median of the token is rejected
+    trim: share of the prices cut at each end by trimmed_mean
+    """
+
+    SOURCES: Tuple[str, ...] = ('binance', 'coingecko', 'gmx')
+    TOKENS: Tuple[str, ...] = ('WBTC', 'WETH', 'ETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI', 'GMX')
+    # source symbol -> tokens it prices, Binance quotes BTC and ETH, WBTC and WETH follow them unless bridged away
+    ALIASES: Dict[str, Tuple[str, ...]] = {'BTC': ('WBTC',), 'ETH': ('ETH', 'WETH'), 'WETH': ('WETH', 'ETH')}
+
+    DEFAULT_POLICY: Dict[str, Any] = {'method': 'mean', 'sources': None, 'max_age': None, 'outlier_threshold': None,
+                                      'trim': 0.25}
+    POLICIES: Dict[str, Dict[str, Any]] = {
+        # GMX is not in the GLP pool, mid of Binance and CoinGecko
+        'GMX': {'sources': ('binance', 'coingecko')},
+        # FRAX is not on Binance, take the lower of GMX and CoinGecko
+        'FRAX': {'method': 'min', 'sources': ('gmx', 'coingecko')},
+        # USDT is the Binance quote currency, its Binance price is 1 by construction
+        'USDT': {'sources': ('gmx', 'coingecko')},
+    }
+
+    def __init__(self, policies: Optional[Dict[str, Dict[str, Any]]] = None,
+                 default_policy: Optional[Dict[str, Any]] = None,
+                 tokens: Tuple[str, ...] = TOKENS,
+                 sources: Tuple[str, ...] = SOURCES):
+        """
+        policies: per-token overrides of POLICIES, default_policy: overrides of DEFAULT_POLICY for every token
+        """
+        self.tokens = tokens
+        self.sources = sources
+        self._token_index: Dict[str, int] = {token: i for i, token in enumerate(tokens)}
+        self._source_index: Dict[str, int] = {source: i for i, source in enumerate(sources)}
+
+        self.prices = np.full((len(sources), len(tokens)), np.nan)
+        self.timestamps = np.full((len(sources), len(tokens)), np.nan)
+        self._lock = threading.Lock()
+
+        default_policy = dict(self.DEFAULT_POLICY, **(default_policy or {}))
+        merged = {token: {**default_policy, **self.POLICIES.get(token, {}), **(policies or {}).get(token, {})}
+                  for token in tokens}
+        self.policies = merged
+
+        # the policies as vectors, so resolve() never loops over tokens
+        self._allowed = np.array([[policy['sources'] is None or source in policy['sources']
+                                   for policy in merged.values()] for source in sources])
+        self._max_age = np.array([np.inf if policy['max_age'] is None else policy['max_age']
+                                  for policy in merged.values()])
+        self._outlier_threshold = np.array([np.inf if policy['outlier_threshold'] is None
+                                            else policy['outlier_threshold'] for policy in merged.values()])
+        self._trim = np.array([policy['trim'] for policy in merged.values()])
+        self._method = np.array([METHODS.index(policy['method']) for policy in merged.values()])
+
+    def set_price(self, source: str, symbol: str, price: float, timestamp: Optional[float] = None) -> None:
+        timestamp = timestamp if timestamp is not None else time.time()
+        row = self._source_index[source]
+
+        with self._lock:
+            for token in self.ALIASES.get(symbol, (symbol,)):
+                column = self._token_index.get(token)
+                if column is not None:
+                    self.prices[row, column] = price
+                    self.timestamps[row, column] = timestamp
+
+    def update(self, source: str, price_dict: Dict[str, float], timestamp: Optional[float] = None) -> None:
+        """
+        Replaces the prices of a source, e.g. with PriceFetcher.get_assets_price_binance()
+        timestamp: time the prices were observed, the block time for on-chain prices, now by default
+        """
+        timestamp = timestamp if timestamp is not None else time.time()
+        for symbol, price in price_dict.items():
+            self.set_price(source, symbol, price, timestamp)
+
+    def resolve(self, now: Optional[float] = None) -> Dict[str, float]:
+        """
+        Consensus price of every token that has at least one usable source price
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            prices = self.prices.copy()
+            timestamps = self.timestamps.copy()
+
+        with warnings.catch_warnings():
+            # tokens without a usable price are all-NaN columns
+            warnings.simplefilter('ignore', RuntimeWarning)
+
+            usable = self._allowed & ~np.isnan(prices) & (now - timestamps <= self._max_age[None, :])
+            candidates = np.where(usable, prices, np.nan)
+
+            median = np.nanmedian(candidates, axis=0)
+            outlier = np.abs(candidates - median[None, :]) > self._outlier_threshold[None, :] * np.abs(median)[None, :]
+            candidates = np.where(outlier, np.nan, candidates)
+
+            # trimmed mean: NaN sort last, keep the ranks between the cut at each end
+            ordered = np.sort(candidates, axis=0)
+            count = np.sum(~np.isnan(candidates), axis=0)
+            cut = np.floor(count * self._trim).astype(int)
+            ranks = np.arange(len(self.sources))[:, None]
+            trimmed = np.where((ranks >= cut[None, :]) & (ranks < (count - cut)[None, :]), ordered, np.nan)
+
+            stacked = np.stack([np.nanmean(candidates, axis=0), np.nanmedian(candidates, axis=0),
+                                np.nanmin(candidates, axis=0), np.nanmax(candidates, axis=0),
+                                np.nanmean(trimmed, axis=0)])
+            consensus = stacked[self._method, np.arange(len(self.tokens))]
+
+        return {token: price for token, price in zip(self.tokens, consensus.tolist()) if not np.isnan(price)}
+
+    def unpriced(self, now: Optional[float] = None) -> List[str]:
+        resolved = self.resolve(now)
+        return [token for token in self.tokens if token not in resolved]
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    consensus = PriceConsensus(default_policy={'max_age': 60, 'outlier_threshold': 0.05})
+    consensus.update('binance', {'BTC': 20010, 'ETH': 1500, 'GMX': 40, 'USDT': 1})
+    consensus.update('coingecko', {'WBTC': 19990, 'WETH': 1502, 'GMX': 41, 'FRAX': 0.999, 'USDT': 1.001})
+    consensus.update('gmx', {'WBTC': 25000, 'WETH': 1498, 'FRAX': 1.0, 'USDT': 1.0}, timestamp=time.time() - 30)
+    print(consensus.resolve())
+    print(consensus.unpriced())
+    print(f'process time is: {time.time() - start_time}')
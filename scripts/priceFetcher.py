@@ -1,18 +1,21 @@
-from web3 import HTTPProvider, Web3
 from configparser import ConfigParser
 import json
 import requests
 from requests.exceptions import ConnectionError
-import ccxt
-from typing import List, Dict, Iterable, Any, Optional
+from typing import List, Dict, Iterable, Any, Optional, Tuple
 from dotenv import load_dotenv
 import os
 from util.tokensInfoEnumType import TokenAddressEnumType
-from util.contractInfoEnumType import ContractAddressEnumType, ContractAbiEnumType
-from web3.types import ChecksumAddress
+from web3.types import BlockIdentifier
 import time
 from util.binancePairsEnumType import BinancePairsEnumType
-import ccxt
+from web3Registry import Web3Registry
+from binanceAccountFetcher import BinanceAccountInfo
+from cycleCache import cached
+from priceBook import BinancePriceBook
+from vaultState import VaultState
+from metrics import requests_metrics_hook, instrument_session, instrument_exchange
+from rateLimiter import RateLimiter, throttle_exchange
 
 config = ConfigParser()
 config.read('config.ini')
@@ -20,6 +23,10 @@ load_dotenv()
 
 
 class PriceFetcher:
+    # optional BinancePriceBook, set by long-running collectors
+    price_book: Optional[BinancePriceBook] = None
+    price_book_max_age: float = 10
+
     def __init__(self):
         """
         Just a collection of price feed
@@ -28,10 +35,23 @@ class PriceFetcher:
         pass
 
     @classmethod
+    @cached('coingecko')
     def get_assets_price_coingecko(cls, chain_id='arbitrum-one', vs_currency='usd',
                                    target_tokens: Iterable[str] =
                                    ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI', 'GMX')) -> Dict:
 
+        url = cls._coingecko_url(chain_id, vs_currency, target_tokens)
+
+        RateLimiter.acquire('coingecko')
+        res = requests.get(url, hooks={'response': [requests_metrics_hook, RateLimiter.response_hook('coingecko')]})
+
+        if res.status_code != 200:
+            raise ConnectionError(json.loads(res.text)["status"]['error_message'])
+
+        return cls._parse_coingecko(json.loads(res.text), target_tokens)
+
+    @staticmethod
+    def _coingecko_url(chain_id: str, vs_currency: str, target_tokens: Iterable[str]) -> str:
         url_root: str = 'https://api.coingecko.com/api/v3/simple/token_price/'
         target_contract: Any = ''
 
@@ -39,15 +59,11 @@ class PriceFetcher:
             target_contract = target_contract + TokenAddressEnumType[token].value + ','
 
         target_contract = target_contract[:-1]
-        url = url_root + f'{chain_id}?contract_addresses={target_contract}&vs_currencies={vs_currency}'
-
-        res = requests.get(url)
-
-        if res.status_code != 200:
-            raise ConnectionError(json.loads(res.text)["status"]['error_message'])
 
-        price_dict = json.loads(res.text)
+        return url_root + f'{chain_id}?contract_addresses={target_contract}&vs_currencies={vs_currency}'
 
+    @staticmethod
+    def _parse_coingecko(price_dict: Dict, target_tokens: Iterable[str]) -> Dict:
         price_dict_return = {}
         # mapping to readable dictionary
         for token in target_tokens:
@@ -56,6 +72,7 @@ class PriceFetcher:
         return price_dict_return
 
     @classmethod
+    @cached('coinmarketcap')
     def get_asset_price_coinmarket(cls,
                                    api_key: str = os.getenv("COINMARKETCAP_API_KEY"),  # type: ignore
                                    target_tokens: Iterable[str] = ("BTC", "ETH", 'UNI', 'LINK')) -> Dict[str, float]:
@@ -77,11 +94,18 @@ class PriceFetcher:
             'aux': None
         }
 
-        session = requests.session()
+        session = instrument_session(requests.session())
         session.headers.update(headers)
+        session.hooks['response'].append(RateLimiter.response_hook('coinmarketcap'))
 
+        # one credit per 100 symbols, the response reports what was actually charged
+        estimated_credits = 1 + (len(query_string.split(',')) - 1) // 100
+        RateLimiter.acquire('coinmarketcap')
+        RateLimiter.acquire('coinmarketcap_credits', estimated_credits)
         res = session.get(url, params=parameters)
         data = json.loads(res.text)
+        RateLimiter.bucket('coinmarketcap_credits').charge(
+            data.get('status', {}).get('credit_count', estimated_credits) - estimated_credits)
 
         dict_return: Dict = {}
 
@@ -96,10 +120,28 @@ class PriceFetcher:
                                  ("BTC", "ETH", 'UNI', 'LINK', 'GMX', "DAI", "USDC", "USDT")) \
             -> Dict[str, float]:
         """
+        Read from the streaming price book when one is running and fresh, otherwise poll the REST API
+        """
+        if cls.price_book is not None:
+            price_dict = cls.price_book.get_prices(target_tokens, max_age=cls.price_book_max_age)
+            if price_dict is not None:
+                return price_dict
+
+        return cls._get_assets_price_binance_rest(target_tokens)
+
+    @classmethod
+    @cached('binance_market')
+    def _get_assets_price_binance_rest(cls,
+                                       target_tokens: Iterable[str] =
+                                       ("BTC", "ETH", 'UNI', 'LINK', 'GMX', "DAI", "USDC", "USDT")) \
+            -> Dict[str, float]:
+        """
         Use the close price of 1m, FRAX pairs is not available on Binance, account unit is USDT
         """
 
-        binanceusdm = ccxt.binance()
+        import ccxt  # imported on first use, one-off runs without Binance never load it
+
+        binanceusdm = throttle_exchange(instrument_exchange(ccxt.binance()))
         price_dict: Dict[str, float] = {}
 
         # Fetch the last close price from 1m OHLCV
@@ -113,42 +155,16 @@ class PriceFetcher:
         return price_dict
 
     @classmethod
-    def get_assets_price_gmx(cls, infura_api_key: Optional[str] = os.getenv('INFURA_API_KEY')) -> Dict[str, float]:
-        infura_api_url: str = f"https://arbitrum-mainnet.infura.io/v3/{infura_api_key}"
-        gmx_index_assets: Iterable[str] = ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI')
-        vault_adr: ChecksumAddress = ContractAddressEnumType.vault.value
-        weth_adr: ChecksumAddress = TokenAddressEnumType.WETH.value
-        usdg_amount: int = 0  # only used to call vault.getRedemptionAmount(token, _usdgAmount), in unit 10**30
-
-        # GMX index address address
-        token_adr: List = [TokenAddressEnumType[token].value for token in gmx_index_assets]
-        conn = Web3(HTTPProvider(infura_api_url))
-        reader_contract = conn.eth.contract(address=ContractAddressEnumType.Reader.value,
-                                            abi=ContractAbiEnumType.Reader.value)
-        response = reader_contract.functions.getVaultTokenInfoV2(vault_adr, weth_adr, usdg_amount, token_adr).call()
-        info_dict: Dict[str, float] = {}
-        props_length: int = 14
-
-        for prop, symbol in enumerate(gmx_index_assets):
-            price_not_maximised = -1
-            for counter in range(props_length):
-                if counter % 14 == 12:
-                    price_not_maximised = response[prop * 14 + 12]/10**30
-
-            info_dict[symbol] = price_not_maximised
-
-        return info_dict
+    def get_assets_price_gmx(cls, infura_api_key: Optional[str] = os.getenv('INFURA_API_KEY'),
+                             block_identifier: BlockIdentifier = 'latest') -> Dict[str, float]:
+        gmx_index_assets: Tuple[str, ...] = ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI')
+        conn = Web3Registry.get_connection(Web3Registry.infura_url(infura_api_key))
+
+        return VaultState.fetch(conn, gmx_index_assets, block_identifier).prices()
 
     @classmethod
     def get_funding_rate_binance(cls, pairs: Iterable[str] = BinancePairsEnumType._member_names_) -> Dict[str, float]:
-
-        binanceusdm = ccxt.binanceusdm()
-        funding_dict: Dict = {}
-
-        for pair in pairs:
-            funding_dict[pair] = float(binanceusdm.fetchFundingRate(pair)['info']['lastFundingRate'])
-
-        return funding_dict
+        return BinanceAccountInfo.get_funding_rates(tuple(pairs))
 
 
 
@@ -0,0 +1,333 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+import os
+from contextlib import contextmanager
+from typing import Dict, Tuple, Any, Optional, List, Iterator, Mapping
+from dotenv import load_dotenv
+from metrics import MetricsRegistry
+
+load_dotenv()
+
+# lower goes first
+PRIORITY_CRITICAL: int = 0
+PRIORITY_NORMAL: int = 1
+PRIORITY_LOW: int = 2
+
+_local = threading.local()
+
+
+def current_priority(default: int = PRIORITY_NORMAL) -> int:
+    return getattr(_local, 'priority', default)
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """
+    Sets the priority of every rate-limited request made by this thread inside the block, e.g. PRIORITY_CRITICAL
+    around the margin ratio refresh
+    """
+    previous = getattr(_local, 'priority', None)
+    _local.priority = level
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _local.priority
+        else:
+            _local.priority = previous
+
+
+class TokenBucket:
+
+    def __init__(self, limit: float, period: float, safety: float = 0.9, backoff: float = 0.5,
+                 recovery: float = 0.02):
+        """
+        limit cost units per period seconds, of which only safety is spent so other clients on the same IP or key
+        keep some room. A 429 multiplies the refill rate by backoff, each success adds recovery of the nominal rate
+        back, and the server counters, when the API reports them, replace the local estimate
+        """
+        self.limit = limit
+        self.period = period
+        self.capacity = limit * safety
+        self.nominal_rate = self.capacity / period
+        self.rate = self.nominal_rate
+        self.backoff = backoff
+        self.recovery = recovery
+        self.tokens = self.capacity
+        self.blocked_until = 0.0
+        self.updated = time.monotonic()
+
+        self._waiters: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, cost: float = 1, priority: int = PRIORITY_NORMAL) -> float:
+        """
+        Blocks until cost tokens are available and no request of a higher priority is waiting, returns the seconds
+        waited. A cost above the capacity is let through on a full bucket and leaves it in debt
+        """
+        start_time = time.monotonic()
+        entry = (priority, next(self._sequence))
+
+        with self._condition:
+            heapq.heappush(self._waiters, entry)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                needed = min(cost, self.capacity)
+                if self._waiters[0] == entry and now >= self.blocked_until and self.tokens >= needed:
+                    heapq.heappop(self._waiters)
+                    self.tokens -= cost
+                    # the next waiter in line re-checks the bucket
+                    self._condition.notify_all()
+                    return now - start_time
+
+                if self._waiters[0] != entry:
+                    timeout = None
+                elif now < self.blocked_until:
+                    timeout = self.blocked_until - now
+                else:
+                    timeout = (needed - self.tokens) / self.rate
+                self._condition.wait(timeout)
+
+    def charge(self, cost: float) -> None:
+        """
+        Takes cost tokens after the fact, e.g. the CoinMarketCap credits a response reports beyond its estimate
+        """
+        with self._condition:
+            self._refill(time.monotonic())
+            self.tokens -= cost
+
+    def sync(self, used: float) -> None:
+        """
+        The server has counted used units in its current window, the bucket holds what is left of the safe share
+        """
+        with self._condition:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.capacity - used)
+            self._condition.notify_all()
+
+    def throttled(self, retry_after: Optional[float] = None) -> None:
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.nominal_rate * 0.1, self.rate * self.backoff)
+            self.tokens = min(self.tokens, 0.0)
+            self.blocked_until = max(self.blocked_until, now + (retry_after if retry_after is not None else 1.0))
+
+    def succeeded(self) -> None:
+        with self._condition:
+            if self.rate < self.nominal_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.nominal_rate, self.rate + self.nominal_rate * self.recovery)
+
+
+class RateLimiter:
+    """
+    Process-wide request budget of every external API, one token bucket per API shared by all the threads and all
+    the clients of that API. Costs are the API's own units: Binance request weights, CoinGecko calls and
+    CoinMarketCap credits. Budgets are limit/period, e.g. RATE_LIMIT_COINGECKO=30/60 for the paid CoinGecko plan
+    """
+
+    # cost units per period seconds
+    BUDGETS: Dict[str, Tuple[float, float]] = {
+        'binance': (6000, 60),
+        'binance_futures': (2400, 60),
+        'coingecko': (10, 60),
+        'coinmarketcap': (30, 60),
+        'coinmarketcap_credits': (333, 86400),
+    }
+    # request weight headers, the 1m variant is the one the ban is applied on
+    WEIGHT_HEADERS: Tuple[str, ...] = ('x-mbx-used-weight-1m', 'x-mbx-used-weight')
+
+    _buckets: Dict[str, TokenBucket] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def budget(cls, api: str) -> Tuple[float, float]:
+        override = os.getenv(f'RATE_LIMIT_{api.upper()}')
+        if override:
+            limit, period = override.split('/')
+            return float(limit), float(period)
+        return cls.BUDGETS[api]
+
+    @classmethod
+    def bucket(cls, api: str) -> TokenBucket:
+        bucket = cls._buckets.get(api)
+        if bucket is None:
+            with cls._lock:
+                if api not in cls._buckets:
+                    cls._buckets[api] = TokenBucket(*cls.budget(api))
+                bucket = cls._buckets[api]
+
+        return bucket
+
+    @classmethod
+    def acquire(cls, api: str, cost: float = 1, priority: Optional[int] = None) -> float:
+        """
+        priority: the thread's priority() when None
+        """
+        waited = cls.bucket(api).acquire(cost, priority if priority is not None else current_priority())
+        if waited > 0:
+            MetricsRegistry.observe('rate_limit_wait_seconds', waited, api=api)
+
+        return waited
+
+    @classmethod
+    def observe_response(cls, api: str, status: int, headers: Optional[Mapping[str, str]]) -> None:
+        """
+        Adapts the bucket of api to a response: the weight the server counted, or a 429 / 418 with its Retry-After
+        """
+        bucket = cls.bucket(api)
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+
+        if status in (418, 429):
+            retry_after = headers.get('retry-after')
+            bucket.throttled(float(retry_after) if retry_after else None)
+            MetricsRegistry.inc('rate_limit_throttled_total', api=api, status=str(status))
+            return
+
+        for header in cls.WEIGHT_HEADERS:
+            if header in headers:
+                bucket.sync(float(headers[header]))
+                break
+        if status < 400:
+            bucket.succeeded()
+
+    @classmethod
+    def response_hook(cls, api: str) -> Any:
+        """
+        requests response hook feeding observe_response
+        """
+
+        def hook(response: Any, *args: Any, **kwargs: Any) -> Any:
+            cls.observe_response(api, response.status_code, response.headers)
+            return response
+
+        return hook
+
+    @classmethod
+    def stats(cls) -> Dict[str, Dict[str, float]]:
+        with cls._lock:
+            buckets = dict(cls._buckets)
+
+        return {api: {'tokens': bucket.tokens, 'capacity': bucket.capacity, 'rate': bucket.rate,
+                      'nominal_rate': bucket.nominal_rate, 'waiting': len(bucket._waiters)}
+                for api, bucket in buckets.items()}
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._lock:
+            cls._buckets.clear()
+
+
+def _binance_api(url: str) -> str:
+    host = url.split('/')[2] if '://' in url else url
+    return 'binance_futures' if host.startswith(('fapi', 'dapi')) else 'binance'
+
+
+def _failed_status(exchange: Any, error: Exception) -> int:
+    # ccxt raises DDoSProtection / RateLimitExceeded on 418 and 429, the headers are still set
+    return getattr(exchange, 'last_http_status', None) or (429 if error.__class__.__name__ in (
+        'DDoSProtection', 'RateLimitExceeded') else 500)
+
+
+def throttle_exchange(exchange: Any, default_priority: int = PRIORITY_NORMAL) -> Any:
+    """
+    Puts a sync ccxt exchange instance on the shared Binance budgets instead of its own per-instance throttle.
+    ccxt calls throttle(cost) with the endpoint weight before each request, the cost is held until fetch, where the
+    host tells the spot budget from the futures one, and the response headers then correct the bucket
+    """
+    local = threading.local()
+    fetch = exchange.fetch
+
+    def throttle(cost: Optional[float] = None) -> None:
+        local.cost = cost if cost is not None else 1
+
+    def throttled_fetch(url: str, method: str = 'GET', headers: Any = None, body: Any = None) -> Any:
+        api = _binance_api(url)
+        cost = getattr(local, 'cost', 1)
+        local.cost = 1
+        RateLimiter.acquire(api, cost, current_priority(default_priority))
+
+        try:
+            response = fetch(url, method, headers, body)
+        except Exception as e:
+            RateLimiter.observe_response(api, _failed_status(exchange, e), exchange.last_response_headers)
+            raise
+
+        RateLimiter.observe_response(api, 200, exchange.last_response_headers)
+        return response
+
+    exchange.enableRateLimit = True
+    exchange.throttle = throttle
+    exchange.fetch = throttled_fetch
+    return exchange
+
+
+def throttle_async_exchange(exchange: Any, priority: int = PRIORITY_NORMAL) -> Any:
+    """
+    throttle_exchange for a ccxt.async_support exchange instance. The cost is carried from throttle to fetch in a
+    context variable, which both see as they run in the same task, and the bucket is waited for in an executor
+    thread so the event loop keeps running
+    """
+    cost_var: contextvars.ContextVar = contextvars.ContextVar('cost', default=1)
+    fetch = exchange.fetch
+
+    async def throttle(cost: Optional[float] = None) -> None:
+        cost_var.set(cost if cost is not None else 1)
+
+    async def throttled_fetch(url: str, method: str = 'GET', headers: Any = None, body: Any = None) -> Any:
+        api = _binance_api(url)
+        cost = cost_var.get()
+        cost_var.set(1)
+        await asyncio.get_running_loop().run_in_executor(None, RateLimiter.acquire, api, cost, priority)
+
+        try:
+            response = await fetch(url, method, headers, body)
+        except Exception as e:
+            RateLimiter.observe_response(api, _failed_status(exchange, e), exchange.last_response_headers)
+            raise
+
+        RateLimiter.observe_response(api, 200, exchange.last_response_headers)
+        return response
+
+    exchange.enableRateLimit = True
+    exchange.throttle = throttle
+    exchange.fetch = throttled_fetch
+    return exchange
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    RateLimiter.BUDGETS['demo'] = (10, 1)
+    order: List[str] = []
+
+    def request(name: str, level: int) -> None:
+        RateLimiter.acquire('demo', 3, level)
+        order.append(name)
+
+    # drain the bucket, then queue low priority calls ahead of a critical one
+    RateLimiter.acquire('demo', 9)
+    threads = [threading.Thread(target=request, args=(f'low-{i}', PRIORITY_LOW)) for i in range(3)]
+    threads.append(threading.Thread(target=request, args=('critical', PRIORITY_CRITICAL)))
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    print(order)
+
+    RateLimiter.observe_response('demo', 200, {'X-MBX-USED-WEIGHT-1M': '8'})
+    print(RateLimiter.stats())
+    RateLimiter.observe_response('demo', 429, {'Retry-After': '0.5'})
+    print(RateLimiter.stats())
+    print(f'process time is: {time.time() - start_time}')
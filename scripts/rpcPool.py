@@ -0,0 +1,242 @@
+from web3 import HTTPProvider, Web3
+from web3.providers import BaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from collections import deque
+from typing import Dict, List, Tuple, Any, Optional, Deque
+from dotenv import load_dotenv
+import requests
+import threading
+import time
+import os
+from metrics import MetricsRegistry, instrument_session
+
+load_dotenv()
+
+# JSON-RPC error messages of a throttled endpoint, -32005 alone is also 'query returned more than 10000 results'
+RATE_LIMIT_MESSAGES: Tuple[str, ...] = ('rate limit', 'too many requests', 'request limit', 'exceeded the limit',
+                                        'daily request count exceeded', 'capacity exceeded')
+# never sent twice
+NON_IDEMPOTENT_METHODS: Tuple[str, ...] = ('eth_sendRawTransaction', 'eth_sendTransaction')
+
+
+def pooled_session(pool_maxsize: int = 16) -> requests.Session:
+    """
+    Keep-alive HTTP session with up to pool_maxsize connections to its host, instrumented for the metrics
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return instrument_session(session)
+
+
+class EndpointUnavailable(Exception):
+
+    def __init__(self, message: str, response: Optional[RPCResponse] = None):
+        """
+        The endpoint, not the call, failed: a transport error, HTTP 429 / 5xx or a rate limit. response: the
+        JSON-RPC error response of a rate limit, handed to web3 unchanged when every endpoint is throttled
+        """
+        super().__init__(message)
+        self.response = response
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return status is None or status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def is_rate_limited(response: RPCResponse) -> bool:
+    error = response.get('error')
+    if not isinstance(error, dict):
+        return False
+    message = str(error.get('message', '')).lower()
+    return error.get('code') == 429 or any(text in message for text in RATE_LIMIT_MESSAGES)
+
+
+class _Endpoint:
+
+    def __init__(self, uri: str, label: str, pool_maxsize: int, request_timeout: float, window: int):
+        self.uri = uri
+        self.label = label
+        self.provider = HTTPProvider(uri, request_kwargs={'timeout': request_timeout},
+                                     session=pooled_session(pool_maxsize))
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+
+class RpcEndpointPool(BaseProvider):
+    """
+    Web3 provider spreading calls over several RPC endpoints. Each endpoint keeps an EWMA of its latency and error
+    rate, calls go to the endpoint with the lowest latency * (1 + error_penalty * error rate), an endpoint failing
+    max_failures times in a row sits out cooldown seconds, and a failed call moves on to the next endpoint.
+    With hedge_percentile set, a call still unanswered after that percentile of the chosen endpoint's recent
+    latencies is sent to the next endpoint as well and the first answer wins, which bounds the tail latency
+    """
+
+    def __init__(self, endpoint_uris: List[str],
+                 hedge_percentile: Optional[float] = float(os.getenv('RPC_HEDGE_PERCENTILE')) if os.getenv(
+                     'RPC_HEDGE_PERCENTILE') else None,
+                 min_hedge_delay: float = 0.05,
+                 alpha: float = 0.2,
+                 error_penalty: float = 10,
+                 max_failures: int = 3,
+                 cooldown: float = 30,
+                 request_timeout: float = 10,
+                 pool_maxsize: int = 16,
+                 window: int = 200,
+                 max_workers: int = 16):
+        """
+        endpoint_uris: e.g. the RPC_URLS environment variable split on commas
+        hedge_percentile: e.g. 0.9, hedging is off when None
+        alpha: weight of the newest sample in the latency and error rate EWMAs
+        """
+        super().__init__()
+        if not endpoint_uris:
+            raise ValueError('RpcEndpointPool needs at least one endpoint')
+
+        # endpoint URLs carry API keys, metrics and logs only show the host
+        self.endpoints: List[_Endpoint] = [
+            _Endpoint(uri, f'{i}:{uri.split("/")[2] if "://" in uri else uri}', pool_maxsize, request_timeout, window)
+            for i, uri in enumerate(endpoint_uris)]
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rpc-pool')
+        self._lock = threading.Lock()
+
+    def _score(self, endpoint: _Endpoint) -> float:
+        # endpoints never used yet go first so every endpoint gets measured
+        latency = endpoint.latency if endpoint.latency is not None else 0.0
+        return latency * (1 + self.error_penalty * endpoint.error_rate)
+
+    def ranked(self) -> List[_Endpoint]:
+        """
+        Healthy endpoints best first, then the ones cooling down, which are only tried when every other fails
+        """
+        now = time.monotonic()
+        with self._lock:
+            return sorted(self.endpoints, key=lambda endpoint: (endpoint.cooldown_until > now, self._score(endpoint)))
+
+    def _record(self, endpoint: _Endpoint, seconds: float, ok: bool) -> None:
+        with self._lock:
+            endpoint.error_rate += self.alpha * ((0.0 if ok else 1.0) - endpoint.error_rate)
+            if ok:
+                endpoint.latency = seconds if endpoint.latency is None else \
+                    endpoint.latency + self.alpha * (seconds - endpoint.latency)
+                endpoint.latencies.append(seconds)
+                endpoint.failures = 0
+            else:
+                endpoint.failures += 1
+                if endpoint.failures >= self.max_failures:
+                    endpoint.cooldown_until = time.monotonic() + self.cooldown
+
+        MetricsRegistry.observe('rpc_endpoint_seconds', seconds, endpoint=endpoint.label)
+        if not ok:
+            MetricsRegistry.inc('rpc_endpoint_errors_total', endpoint=endpoint.label)
+
+    def _hedge_delay(self, endpoint: _Endpoint) -> float:
+        with self._lock:
+            latencies = sorted(endpoint.latencies)
+        if not latencies:
+            return self.min_hedge_delay
+        return max(self.min_hedge_delay, latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile))])
+
+    def _call(self, endpoint: _Endpoint, method: RPCEndpoint, params: Any) -> RPCResponse:
+        """
+        One request to one endpoint. Raises EndpointUnavailable when the endpoint failed, any other JSON-RPC error,
+        e.g. execution reverted, is returned as it is for web3 to raise ValueError
+        """
+        start_time = time.perf_counter()
+        try:
+            response = endpoint.provider.make_request(method, params)
+        except Exception as e:
+            if not is_endpoint_failure(e):
+                raise
+            self._record(endpoint, time.perf_counter() - start_time, ok=False)
+            raise EndpointUnavailable(f'{endpoint.label}: {e}') from e
+
+        if is_rate_limited(response):
+            self._record(endpoint, time.perf_counter() - start_time, ok=False)
+            raise EndpointUnavailable(f'{endpoint.label}: {response["error"].get("message")}', response)
+
+        self._record(endpoint, time.perf_counter() - start_time, ok=True)
+        return response
+
+    def _hedged(self, primary: _Endpoint, backup: _Endpoint, method: RPCEndpoint, params: Any) -> RPCResponse:
+        futures: List[Future] = [self._executor.submit(self._call, primary, method, params)]
+        done, _ = wait(futures, timeout=self._hedge_delay(primary))
+        if not done or isinstance(futures[0].exception(), EndpointUnavailable):
+            MetricsRegistry.inc('rpc_hedged_requests_total', method=method)
+            futures.append(self._executor.submit(self._call, backup, method, params))
+
+        pending = set(futures)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # the slower request keeps running and still feeds the endpoint statistics
+                    return future.result()
+                if not isinstance(future.exception(), EndpointUnavailable):
+                    raise future.exception()  # type: ignore
+                error = future.exception()
+
+        raise error  # type: ignore
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        ranked = self.ranked()
+        hedge = self.hedge_percentile is not None and method not in NON_IDEMPOTENT_METHODS and len(ranked) > 1
+        error: Optional[EndpointUnavailable] = None
+
+        if hedge:
+            try:
+                return self._hedged(ranked[0], ranked[1], method, params)
+            except EndpointUnavailable as e:
+                error = e
+            ranked = ranked[2:]
+        elif method in NON_IDEMPOTENT_METHODS:
+            ranked = ranked[:1]
+
+        for endpoint in ranked:
+            try:
+                return self._call(endpoint, method, params)
+            except EndpointUnavailable as e:
+                error = e
+
+        # every endpoint throttled: the last rate limit response goes to web3 like any JSON-RPC error
+        if error.response is not None:  # type: ignore
+            return error.response  # type: ignore
+        raise error.__cause__ or error  # type: ignore
+
+    def isConnected(self) -> bool:
+        return any(endpoint.provider.isConnected() for endpoint in self.endpoints)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [{'endpoint': endpoint.label, 'latency': endpoint.latency, 'error_rate': endpoint.error_rate,
+                     'cooling_down': endpoint.cooldown_until > now} for endpoint in self.endpoints]
+
+
+if __name__ == '__main__':
+    # e.g. RPC_URLS=https://arb1.arbitrum.io/rpc,https://arbitrum-mainnet.infura.io/v3/<key>
+    pool = RpcEndpointPool(os.getenv('RPC_URLS', 'https://arb1.arbitrum.io/rpc').split(','), hedge_percentile=0.9)
+    conn = Web3(pool)
+
+    start_time = time.time()
+    for _ in range(20):
+        conn.eth.block_number
+    print(pool.stats())
+    print(f'process time is: {time.time() - start_time}')
@@ -0,0 +1,180 @@
+from web3 import Web3
+from eth_abi import decode_abi, encode_abi
+from typing import Optional, List, Dict, Iterable, Tuple, Any
+from dotenv import load_dotenv
+import os
+from util.tokensInfoEnumType import TokenAddressEnumType, TokenDecimalsEnumType, TokenAbiEnumType
+from util.contractInfoEnumType import ContractAddressEnumType, ContractAbiEnumType
+from web3.types import ChecksumAddress, BlockIdentifier
+import time
+from glpFetcher import GLPDataFetcher
+from vaultState import VaultState
+from web3Registry import Web3Registry
+from cycleCache import cached
+from util.compactAbi import SELECTORS
+from enum import Enum
+
+load_dotenv()
+
+
+class OnChainSnapshotFetcher:
+
+    def __init__(self,
+                 infura_api_key: Optional[str] = os.getenv('INFURA_API_KEY'),
+                 wallet_adr: Optional[str] = os.getenv('WALLET_ADDRESS'),
+                 gmx_index_assets: Tuple[str, ...] = ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI'),
+                 metamask_tokens: Tuple[str, ...] = ('WBTC', 'WETH', 'ETH', 'FRAX', 'LINK', 'GMX', 'USDT',
+                                                     'USDC', 'UNI', 'DAI', 'esGMX'),
+                 conn: Optional[Web3] = None,
+                 multicall_adr: ChecksumAddress = ContractAddressEnumType.Multicall.value,
+                 block_identifier: BlockIdentifier = 'latest'
+                 ):
+        """
+        Collects every eth_call of GLPDataFetcher, MetamaskInfoFetcher and PriceFetcher.get_assets_price_gmx into a
+        single Multicall aggregate, so one snapshot costs one round-trip.
+        conn and multicall_adr can point to a local EVM (eth-tester / py-evm) with Multicall3 deployed
+        block_identifier: block the whole snapshot is read at, needs an archive node for old blocks
+        """
+
+        if conn is None:
+            conn = Web3Registry.get_connection(Web3Registry.infura_url(infura_api_key))
+
+        self.conn = conn
+        self.wallet_adr = wallet_adr
+        self.gmx_index_assets = gmx_index_assets
+        self.metamask_tokens = metamask_tokens
+        self.block_identifier = block_identifier
+        self._cache_key = (wallet_adr, gmx_index_assets, metamask_tokens, multicall_adr, id(conn), block_identifier)
+        self.multicall = Web3Registry.get_contract(self.conn, multicall_adr, ContractAbiEnumType.Multicall)
+        # call data only depends on the wallet and assets, so it is encoded once per fetcher
+        self._calls: Optional[List[Tuple[str, ChecksumAddress, bytes, List[str]]]] = None
+
+    @staticmethod
+    def _encode(address: ChecksumAddress, abi: Enum, fn_name: str, args: List) -> Tuple[ChecksumAddress, bytes,
+                                                                                          List[str]]:
+        """
+        Call data from the precompiled selectors of util/compactAbi.py, no contract object is built
+        """
+        selector, input_types, output_types = SELECTORS[f'{abi.__class__.__name__}.{abi.name}'][fn_name]
+
+        return address, bytes.fromhex(selector[2:]) + encode_abi(input_types, args), list(output_types)
+
+    def _build_calls(self) -> List[Tuple[str, ChecksumAddress, bytes, List[str]]]:
+        """
+        Every call of the snapshot as (key, target, call data, output types)
+        """
+        calls: List[Tuple[str, ChecksumAddress, bytes, List[str]]] = []
+        multicall = (self.multicall.address, ContractAbiEnumType.Multicall)
+
+        def add(key: str, contract: Tuple[ChecksumAddress, Enum], fn_name: str, args: List) -> None:
+            calls.append((key, *self._encode(*contract, fn_name, args)))
+
+        reader = (ContractAddressEnumType.Reader.value, ContractAbiEnumType.Reader)
+        token_adr: List[str] = [TokenAddressEnumType[token].value for token in self.gmx_index_assets]
+        # getVaultTokenInfoV2 is shared by GLPDataFetcher._get_tokens_info and PriceFetcher.get_assets_price_gmx
+        add('vault_token_info', reader, 'getVaultTokenInfoV2',
+            [ContractAddressEnumType.vault.value, TokenAddressEnumType.WETH.value, 0, token_adr])
+
+        glp = (TokenAddressEnumType.GLP.value, TokenAbiEnumType.GLP)
+        add('glp_supply', glp, 'totalSupply', [])
+
+        glp_manager = (ContractAddressEnumType.GLPManager.value, ContractAbiEnumType.GLPManager)
+        add('aum_buy', glp_manager, 'getAum', [True])
+        add('aum_sell', glp_manager, 'getAum', [False])
+
+        fee_glp_tracker = (ContractAddressEnumType.FeeGlpTracker.value, ContractAbiEnumType.FeeGlpTracker)
+        add('staked_glp', fee_glp_tracker, 'stakedAmounts', [self.wallet_adr])
+
+        staked_gmx_tracker = (ContractAddressEnumType.StakedGmxTracker.value, ContractAbiEnumType.StakedGmxTracker)
+        add('staked_gmx', staked_gmx_tracker, 'depositBalances', [self.wallet_adr, TokenAddressEnumType.GMX.value])
+        add('staked_esgmx', staked_gmx_tracker, 'depositBalances',
+            [self.wallet_adr, TokenAddressEnumType.esGMX.value])
+
+        reward_reader = (ContractAddressEnumType.RewardReader.value, ContractAbiEnumType.RewardReader)
+        add('staking_info', reward_reader, 'getStakingInfo',
+            [self.wallet_adr, [ContractAddressEnumType.StakedGmxTracker.value,
+                               ContractAddressEnumType.FeeGmxTracker.value,
+                               ContractAddressEnumType.FeeGlpTracker.value,
+                               ContractAddressEnumType.StakedGlpTracker.value]])
+
+        for token in self.metamask_tokens:
+            if token != 'ETH':
+                add(f'balance_{token}', (TokenAddressEnumType[token].value, TokenAbiEnumType[token]),
+                    'balanceOf', [self.wallet_adr])
+            else:
+                add(f'balance_{token}', multicall, 'getEthBalance', [self.wallet_adr])
+
+        add('block_timestamp', multicall, 'getCurrentBlockTimestamp', [])
+
+        return calls
+
+    @staticmethod
+    def _decode(calls: List[Tuple[str, ChecksumAddress, bytes, List[str]]],
+                return_data: List[bytes]) -> Dict[str, Any]:
+        raw: Dict[str, Any] = {}
+
+        for (key, _, _, output_types), data in zip(calls, return_data):
+            decoded = decode_abi(output_types, data)
+            raw[key] = decoded[0] if len(decoded) == 1 else decoded
+
+        return raw
+
+    def _to_snapshot(self, raw: Dict[str, Any], block_number: int) -> Dict[str, Any]:
+        """
+        Maps the raw call results onto the dicts the individual fetchers return
+        """
+        glp_supply: float = raw['glp_supply'] / 10 ** TokenDecimalsEnumType.GLP.value
+        metamask_balance: Dict[str, float] = {
+            token: raw[f'balance_{token}'] / 10 ** TokenDecimalsEnumType[token].value for token in self.metamask_tokens}
+
+        vault_state = VaultState.decode(raw['vault_token_info'], self.gmx_index_assets)
+
+        return {'block_number': block_number,
+                'block_timestamp': raw['block_timestamp'],
+                'vault_state': vault_state,
+                'tokens_info': vault_state.tokens_info(),
+                'gmx_price': vault_state.prices(),
+                'glp_supply': glp_supply,
+                'glp_price': {'buy': raw['aum_buy'] / 10 ** 30 / glp_supply,
+                              'sell': raw['aum_sell'] / 10 ** 30 / glp_supply},
+                'staked_glp_amount': raw['staked_glp'] / 10 ** TokenDecimalsEnumType.GLP.value,
+                'staked_gmx_amount': raw['staked_gmx'] / 10 ** TokenDecimalsEnumType.GMX.value,
+                'staked_esgmx_amount': raw['staked_esgmx'] / 10 ** TokenDecimalsEnumType.esGMX.value,
+                'claimable_info': GLPDataFetcher._parse_claimable_info(raw['staking_info']),
+                'metamask_balance': metamask_balance}
+
+    def _get_calls(self) -> List[Tuple[str, ChecksumAddress, bytes, List[str]]]:
+        if self._calls is None:
+            self._calls = self._build_calls()
+
+        return self._calls
+
+    def get_aggregate_request(self) -> Dict[str, Any]:
+        """
+        Raw eth_call transaction of the aggregate, for callers running their own (e.g. async) provider
+        """
+        calls = self._get_calls()
+        call_data: str = self.multicall.encodeABI(fn_name='aggregate',
+                                                  args=[[(target, data) for _, target, data, _ in calls]])
+
+        return {'to': self.multicall.address, 'data': call_data}
+
+    def decode_aggregate_response(self, response: bytes) -> Dict[str, Any]:
+        block_number, return_data = decode_abi(['uint256', 'bytes[]'], response)
+
+        return self._to_snapshot(self._decode(self._get_calls(), return_data), block_number)
+
+    @cached('infura')
+    def get_snapshot(self) -> Dict[str, Any]:
+        calls = self._get_calls()
+        block_number, return_data = self.multicall.functions.aggregate(
+            [(target, call_data) for _, target, call_data, _ in calls]).call(block_identifier=self.block_identifier)
+
+        return self._to_snapshot(self._decode(calls, return_data), block_number)
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    test = OnChainSnapshotFetcher()
+    print(test.get_snapshot())
+    print(f'process time is: {time.time() - start_time}')
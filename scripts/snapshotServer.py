@@ -0,0 +1,199 @@
+import datetime
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple, Any, Optional, Deque
+
+
+class SnapshotStore:
+    """
+    Latest snapshot rows of the collector and a short history of them, kept as ready-to-send JSON bodies with
+    their ETags. publish() does all the work once per cycle, a request is a dict lookup. Nothing is published until
+    enabled is set, SnapshotServer.start() does it
+    """
+
+    enabled: bool = False
+    history: int = 144
+
+    # path -> (body, etag)
+    _bodies: Dict[str, Tuple[bytes, str]] = {}
+    _history: Deque[bytes] = deque(maxlen=history)
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _json_value(value: Any) -> Any:
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        return float(value)
+
+    @staticmethod
+    def summarize(tables: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        NAV, margin ratio and hedge per pair of one account from its rows: GMX and Metamask notional plus the
+        Binance wallet balance and unrealized profit
+        """
+        notional = {row['exchange_name']: row['notional'] for row in tables.get('summary_total_balance', [])}
+        binance = next((row for row in tables.get('summary_total_balance', []) if row['exchange_name'] == 'Binance'),
+                       None)
+        # one entry per pair, BTCUSDT and BTCBUSD are two positions
+        hedge = {row['base'] + row['quote']: {'base': row['base'], 'quote': row['quote'],
+                                              'position_amount': row['position_amount'], 'notional': row['notional'],
+                                              'unrealized_profit': row['unrealized_profit'],
+                                              'funding_rate': row['funding_rate']}
+                 for row in tables.get('binance_hedge_account', [])}
+        margin_balance = (binance['wallet_balance'] if binance else 0) + \
+            sum(item['unrealized_profit'] for item in hedge.values())
+
+        return {'nav': notional.get('GMX', 0) + notional.get('Metamask', 0) + margin_balance,
+                'margin_ratio': binance['margin_ratio'] if binance else None,
+                'notional': notional,
+                'hedge': hedge}
+
+    @classmethod
+    def build(cls, rows: Dict[str, List], table_columns: Dict[str, str],
+              snapshot_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        account -> summary and rows, the rows as column -> value dicts
+        """
+        accounts: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        created_date = None
+        for table, table_rows in rows.items():
+            columns = [column.strip() for column in table_columns[table].split(',')]
+            for row in table_rows:
+                item = dict(zip(columns, row))
+                created_date = created_date or item['created_date']
+                accounts.setdefault(item['account'], {}).setdefault(table, []).append(item)
+
+        return {'snapshot_key': snapshot_key,
+                'created_date': created_date,
+                'published': datetime.datetime.now(),
+                'accounts': {account: {'summary': cls.summarize(tables), 'tables': tables}
+                             for account, tables in accounts.items()}}
+
+    @staticmethod
+    def _entry(body: bytes) -> Tuple[bytes, str]:
+        return body, f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+    @classmethod
+    def publish(cls, rows: Dict[str, List], table_columns: Dict[str, str],
+                snapshot_key: Optional[str] = None) -> None:
+        """
+        rows: DatabaseInserter.get_snapshot_rows(), or the merged rows of a portfolio, table_columns:
+        DatabaseInserter.TABLE_COLUMNS, tables without columns there are left out
+        """
+        if not cls.enabled:
+            return
+
+        snapshot = cls.build({table: table_rows for table, table_rows in rows.items() if table in table_columns},
+                             table_columns, snapshot_key)
+        body = json.dumps(snapshot, default=cls._json_value).encode()
+        bodies = {'/snapshot': cls._entry(body)}
+        for account, item in snapshot['accounts'].items():
+            bodies[f'/snapshot/{account}'] = cls._entry(json.dumps(
+                dict(item, snapshot_key=snapshot_key, created_date=snapshot['created_date']),
+                default=cls._json_value).encode())
+
+        with cls._lock:
+            if cls._history.maxlen != cls.history:
+                cls._history = deque(cls._history, maxlen=cls.history)
+            cls._history.append(body)
+            bodies['/snapshot/history'] = cls._entry(b'[' + b','.join(cls._history) + b']')
+            cls._bodies = bodies
+
+    @classmethod
+    def get(cls, path: str) -> Optional[Tuple[bytes, str]]:
+        return cls._bodies.get(path)
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._lock:
+            cls._bodies = {}
+            cls._history.clear()
+
+
+class SnapshotServer:
+
+    def __init__(self, port: int = 9200, host: str = '127.0.0.1', history: int = 144):
+        """
+        Serves the SnapshotStore: /snapshot, /snapshot/<account> and /snapshot/history, the last history
+        snapshots. 404 until the first cycle has published, 304 when If-None-Match carries the current ETag
+        """
+        self.port = port
+        self.host = host
+        self.history = history
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    class _Handler(BaseHTTPRequestHandler):
+        # keep-alive, dashboards polling every few seconds reuse their connection
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self) -> None:
+            entry = SnapshotStore.get(self.path.split('?')[0].rstrip('/'))
+            if entry is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            body, etag = entry
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    def start(self) -> 'SnapshotServer':
+        SnapshotStore.history = self.history
+        SnapshotStore.enabled = True
+        self._server = ThreadingHTTPServer((self.host, self.port), self._Handler)
+        threading.Thread(target=self._server.serve_forever, name='snapshot-server', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        SnapshotStore.enabled = False
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+if __name__ == '__main__':
+    import urllib.request
+
+    server = SnapshotServer(port=0).start()
+    url = f'http://127.0.0.1:{server._server.server_address[1]}/snapshot'  # type: ignore
+    now = datetime.datetime.now()
+    SnapshotStore.publish({'summary_total_balance': [[now, now, 'Binance', -30000.0, 10000.0, 0.02, 'default'],
+                                                     [now, now, 'GMX', 35000.0, 0, 0, 'default']],
+                           'binance_hedge_account': [[now, now, -1.0, -20000.0, 0.0001, 'USDT', 'BTC', 150.0,
+                                                      'default']]},
+                          {'summary_total_balance': 'created_date, updated_date, exchange_name, notional, '
+                                                    'wallet_balance, margin_ratio, account',
+                           'binance_hedge_account': 'created_date, updated_date, position_amount, notional, '
+                                                    'funding_rate, quote, base, unrealized_profit, account'}, 'demo')
+
+    start_time = time.time()
+    with urllib.request.urlopen(url) as res:
+        etag = res.headers['ETag']
+        print(json.loads(res.read())['accounts']['default']['summary'])
+    try:
+        urllib.request.urlopen(urllib.request.Request(url, headers={'If-None-Match': etag}))
+    except urllib.error.HTTPError as e:
+        print(f'revalidated: {e.code}')
+    print(f'process time is: {time.time() - start_time}')
+    server.stop()
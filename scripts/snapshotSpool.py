@@ -0,0 +1,164 @@
+import datetime
+import glob
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from databaseWriter import DatabaseWriter
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f'{type(value)} is not JSON serializable')
+
+
+def _decode(value: Dict) -> Any:
+    if '__datetime__' in value:
+        return datetime.datetime.fromisoformat(value['__datetime__'])
+    return value
+
+
+class SnapshotSpool:
+
+    def __init__(self, directory: str = 'spool', segment_max_bytes: int = 16 * 1024 * 1024):
+        """
+        Append-only local spool of snapshots that could not be written to MySQL. Every snapshot is one JSON line
+        in a segment file, synced to disk before append returns. Segments are sealed when they reach
+        segment_max_bytes or when the replayer takes them
+        """
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self._lock = threading.Lock()
+        self._file: Optional[Any] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_paths(self, suffix: str) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, f'segment-*.{suffix}')))
+
+    def _next_sequence(self) -> int:
+        paths = self._segment_paths('open') + self._segment_paths('sealed')
+        if not paths:
+            return 0
+        return max(int(os.path.basename(path).split('-')[1].split('.')[0]) for path in paths) + 1
+
+    def _seal(self) -> None:
+        if self._file is None:
+            return
+
+        path = self._file.name
+        self._file.close()
+        self._file = None
+        os.replace(path, path[:-len('.open')] + '.sealed')
+
+    def append(self, snapshot_key: str, statements: Dict[str, str], rows: Dict[str, List[List]]) -> None:
+        line = json.dumps({'key': snapshot_key, 'statements': statements, 'rows': rows}, default=_encode) + '\n'
+
+        with self._lock:
+            if self._file is None:
+                path = os.path.join(self.directory, f'segment-{self._next_sequence():08d}.open')
+                self._file = open(path, 'a')
+
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            if self._file.tell() >= self.segment_max_bytes:
+                self._seal()
+
+    def take_sealed(self) -> List[str]:
+        """
+        Seals the active segment and returns every sealed segment, oldest first.
+        Segments left open by a crashed process are sealed as well
+        """
+        with self._lock:
+            self._seal()
+            for path in self._segment_paths('open'):
+                os.replace(path, path[:-len('.open')] + '.sealed')
+
+            return self._segment_paths('sealed')
+
+    @staticmethod
+    def read_segment(path: str) -> List[Tuple[str, Dict[str, str], Dict[str, List[List]]]]:
+        entries = []
+        with open(path) as f:
+            for line in f:
+                # a crash midway through a write leaves a truncated last line, it was never acknowledged
+                try:
+                    entry = json.loads(line, object_hook=_decode)
+                except json.JSONDecodeError:
+                    continue
+                entries.append((entry['key'], entry['statements'], entry['rows']))
+
+        return entries
+
+    def pending(self) -> int:
+        with self._lock:
+            paths = self._segment_paths('open') + self._segment_paths('sealed')
+        return sum(len(self.read_segment(path)) for path in paths)
+
+
+class SpoolReplayer:
+
+    def __init__(self, spool: SnapshotSpool, writer: DatabaseWriter, batch_size: int = 500,
+                 interval: float = 30):
+        """
+        Background thread draining the spool into MySQL once it is reachable again. Up to batch_size snapshots
+        are written per transaction, and their keys in snapshot_log keep a replayed snapshot from being inserted
+        twice. A segment is deleted only after all of its snapshots are committed
+        """
+        self.spool = spool
+        self.writer = writer
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def replay_once(self) -> int:
+        replayed = 0
+
+        for path in self.spool.take_sealed():
+            entries = self.spool.read_segment(path)
+
+            for offset in range(0, len(entries), self.batch_size):
+                batch = entries[offset:offset + self.batch_size]
+                statements: Dict[str, str] = {}
+                for _, entry_statements, _ in batch:
+                    statements.update(entry_statements)
+
+                stats = self.writer.write_snapshots(statements, [(key, rows) for key, _, rows in batch])
+                replayed += len(batch) - int(stats['skipped_snapshots'])
+
+            os.remove(path)
+
+        return replayed
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                replayed = self.replay_once()
+                if replayed:
+                    print(f'Replayed {replayed} spooled snapshots at {datetime.datetime.now()}')
+            except Exception as e:
+                print(f'Spool replay fails at {datetime.datetime.now()}: {e}')
+
+    def start(self) -> 'SpoolReplayer':
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='spool-replayer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == '__main__':
+    spool = SnapshotSpool()
+    print(f'{spool.pending()} snapshots pending')
+    start_time = time.time()
+    print(f'{SpoolReplayer(spool, DatabaseWriter()).replay_once()} snapshots replayed')
+    print(f'process time is: {time.time() - start_time}')
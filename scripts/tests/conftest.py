@@ -0,0 +1,79 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+# the scripts import each other by module name, as when run from scripts/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubRpcServer:
+
+    def __init__(self, delay=0, fail=False, block_number=1, port=0, error=None):
+        """
+        Local JSON-RPC endpoint answering eth_blockNumber and eth_chainId after delay seconds, with HTTP 503 when
+        fail is set, or with the JSON-RPC error, e.g. {'code': -32000, 'message': 'execution reverted'}, to exercise
+        RpcEndpointPool without a node
+        """
+        self.delay = delay
+        self.fail = fail
+        self.error = error
+        self.block_number = block_number
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.requests += 1
+                time.sleep(stub.delay)
+                if stub.fail:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                response = {'jsonrpc': '2.0', 'id': request['id']}
+                if stub.error is not None:
+                    response['error'] = stub.error
+                else:
+                    response['result'] = {'eth_blockNumber': hex(stub.block_number),
+                                          'eth_chainId': hex(42161)}.get(request['method'])
+                body = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name='stub-rpc', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def rpc_stubs():
+    """
+    Starts a StubRpcServer per call, every one is stopped after the test
+    """
+    started = []
+
+    def start(**kwargs):
+        stub = StubRpcServer(**kwargs).start()
+        started.append(stub)
+        return stub
+
+    yield start
+    for stub in started:
+        stub.stop()
@@ -0,0 +1,24 @@
+from binanceAccountFetcher import BinanceAccountInfo
+
+PREMIUM_INDEX = [{'symbol': 'BTCUSDT', 'lastFundingRate': '0.0001'},
+                 {'symbol': 'ETHUSDT', 'lastFundingRate': '-0.0002'}]
+
+
+def position(symbol: str, amount: str) -> dict:
+    return {'leverage': 5, 'info': {'symbol': symbol, 'notional': '-1000', 'unRealizedProfit': '10',
+                                    'positionAmt': amount}}
+
+
+def test_premium_index_skips_unknown_pairs():
+    rates = BinanceAccountInfo._parse_premium_index(PREMIUM_INDEX, (pair for pair in ('BTCUSDT', 'GMXUSDT')))
+
+    assert rates == {'BTCUSDT': 0.0001}
+
+
+def test_hedge_info_of_a_pair_without_funding_rate():
+    info = BinanceAccountInfo._parse_hedge_info([position('BTCUSDT', '-0.1'), position('GMXUSDT', '0')],
+                                                ('BTCUSDT', 'GMXUSDT'), {'BTCUSDT': 0.0001})
+
+    assert info['funding_rate'] == {'BTCUSDT': 0.0001, 'GMXUSDT': 0.0}
+    assert info['leverage'] == {'BTCUSDT': 5.0, 'GMXUSDT': 0}
+    assert info['base'] == {'BTCUSDT': 'BTC', 'GMXUSDT': 'GMX'}
@@ -0,0 +1,88 @@
+import datetime
+import random
+import pandas as pd
+from changeFilter import ChangeFilter, densify
+
+START = datetime.datetime(2023, 1, 1)
+
+
+def snapshots(cycles=144 * 7, seed=7):
+    """
+    A week of 10 minute snapshots: ETH and BTC prices on a random walk of about 0.3% per cycle, a flat stable
+    balance, and amounts that only change on a few rebalances
+    """
+    rng = random.Random(seed)
+    prices = {'WETH': 1500.0, 'WBTC': 20000.0}
+    amounts = {'WETH': 2.0, 'WBTC': 0.1, 'USDC': 5000.0, 'DAI': 0.0}
+    for cycle in range(cycles):
+        created = START + datetime.timedelta(minutes=10 * cycle)
+        for token in prices:
+            prices[token] *= 1 + rng.gauss(0, 0.003)
+        if cycle % 288 == 100:
+            amounts['WETH'] += 0.5
+        yield {'metamask_account': [[created, created, amount, amount * prices.get(token, 1.0), token, 'default']
+                                    for token, amount in amounts.items()],
+               'binance_hedge_account': [[created, created, -2.0, -2.0 * prices['WETH'], 0.0001, 'USDT', 'ETH',
+                                          -2.0 * (prices['WETH'] - 1500.0), 'default']]}
+
+
+def run(change_filter):
+    written = []
+    for rows in snapshots():
+        kept = change_filter.apply(rows)
+        change_filter.mark_written(kept)
+        written.append(kept)
+    return written
+
+
+def test_realistic_week_is_cut_by_an_order_of_magnitude():
+    change_filter = ChangeFilter()
+    run(change_filter)
+
+    total = change_filter.stats['kept'] + change_filter.stats['dropped']
+    assert change_filter.stats['kept'] * 10 < total
+
+
+def test_amount_changes_are_always_written():
+    written = run(ChangeFilter())
+
+    weth = [row[2] for kept in written for row in kept['metamask_account'] if row[4] == 'WETH']
+    assert sorted(set(weth)) == [2.0, 2.5, 3.0, 3.5, 4.0]
+
+
+def test_densified_notional_stays_within_the_price_tolerance():
+    change_filter = ChangeFilter(price_tolerance=0.01)
+    written = run(change_filter)
+    columns = ['created_date', 'updated_date', 'amount', 'notional', 'symbol', 'account']
+    sparse = pd.DataFrame([row for kept in written for row in kept['metamask_account']], columns=columns)
+    full = pd.DataFrame([row for rows in snapshots() for row in rows['metamask_account']], columns=columns)
+
+    dense = densify(sparse, ['symbol', 'account'], end=full['created_date'].max()) \
+        .merge(full, on=['created_date', 'symbol', 'account'])
+
+    assert len(dense) == len(full)
+    assert (dense['amount_x'] == dense['amount_y']).all()
+    error = (dense['notional_x'] - dense['notional_y']).abs() / dense['notional_y'].abs().clip(lower=1)
+    # a row is only dropped while within 1% of the last written one
+    assert error.max() <= 0.0101
+
+
+def test_unrealized_profit_around_zero_is_not_rewritten():
+    change_filter = ChangeFilter()
+    for cycle, profit in enumerate((0.5, -0.4, 0.3, -0.2)):
+        created = START + datetime.timedelta(minutes=10 * cycle)
+        change_filter.mark_written(change_filter.apply(
+            {'binance_hedge_account': [[created, created, -2.0, -3000.0 - profit, 0.0001, 'USDT', 'ETH', profit,
+                                        'default']]}))
+
+    assert change_filter.stats == {'kept': 1, 'dropped': 3}
+
+
+def test_heartbeat_rewrites_unchanged_rows():
+    change_filter = ChangeFilter(heartbeat=3600)
+    for cycle in range(13):
+        created = START + datetime.timedelta(minutes=10 * cycle)
+        change_filter.mark_written(change_filter.apply(
+            {'metamask_account': [[created, created, 0.0, 0.0, 'DAI', 'default']]}))
+
+    assert change_filter.stats == {'kept': 3, 'dropped': 10}
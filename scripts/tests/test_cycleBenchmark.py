@@ -0,0 +1,39 @@
+import base64
+import pytest
+import requests
+from cycleBenchmark import Cassette, CassetteMiss, CycleBenchmark
+
+RECORDED_URL = 'https://api.binance.com/api/v3/time'
+
+
+@pytest.fixture
+def urls():
+    return [RECORDED_URL]
+
+
+@pytest.fixture
+def benchmark(tmp_path, monkeypatch, urls):
+    cassette = Cassette(str(tmp_path / 'cassette.json'))
+    cassette.entries[Cassette.key('GET', RECORDED_URL, None)] = [
+        {'status': 200, 'headers': {'Content-Type': 'application/json'},
+         'content': base64.b64encode(b'{"serverTime": 1}').decode()}]
+    benchmark = CycleBenchmark(cassette)
+
+    def run_cycle():
+        # like the collectors, an error response is logged and the cycle carries on
+        statuses = [requests.get(url).status_code for url in urls]
+        return {'stage': {'seconds': 0.0, 'calls': len(statuses)}}
+
+    monkeypatch.setattr(benchmark, 'run_cycle', run_cycle)
+    return benchmark
+
+
+def test_replay_from_the_cassette(benchmark):
+    assert benchmark.replay(repeat=2) == {'stage': {'seconds': 0.0, 'calls': 1}}
+
+
+def test_replay_fails_on_a_cassette_miss(benchmark, urls):
+    urls.append('https://api.binance.com/api/v3/ping')
+
+    with pytest.raises(CassetteMiss, match='2 requests missing'):
+        benchmark.replay(repeat=2)
@@ -0,0 +1,24 @@
+import sys
+from cycleBenchmark import SqliteConnection
+from dataBaseInserter import DatabaseInserter
+from databaseWriter import DatabaseWriter
+
+ROWS = {'metamask_account': [['2023-01-01 00:00:00', '2023-01-01 00:00:00', 1.5, 3000.0, 'WETH', 'default'],
+                             ['2023-01-01 00:00:00', '2023-01-01 00:00:00', 100.0, 100.0, 'USDC', 'default']]}
+
+
+def test_mysqlclient_is_only_imported_to_connect():
+    assert 'MySQLdb' not in sys.modules
+
+
+def test_snapshot_is_written_once_per_key():
+    con = SqliteConnection()
+    writer = DatabaseWriter(pool_size=1, connect=lambda: con)
+    statements = DatabaseInserter.get_statements()
+
+    assert writer.write_snapshot(statements, ROWS, snapshot_key='a')['rows'] == 2
+    assert writer.write_snapshot(statements, ROWS, snapshot_key='a')['skipped_snapshots'] == 1
+
+    cur = con.cursor()
+    cur.execute('SELECT symbol FROM metamask_account ORDER BY id')
+    assert cur.fetchall() == [('WETH',), ('USDC',)]
@@ -0,0 +1,154 @@
+import json
+import time
+import pytest
+from hedgeDriftMonitor import HedgeDriftMonitor, JsonlAlertSink
+from priceBook import BinancePriceBook
+
+EXPOSURE = {'WBTC': 1.0, 'WETH': 10.0, 'USDC': 20000.0}
+PRICES = {'WBTC': 20000.0, 'WETH': 1500.0, 'USDC': 1.0}
+
+
+def summary(eth_amount=-9.0, margin_ratio=0.02):
+    return {'hedge': {'positionAmt': {'BTCUSDT': -1.0, 'ETHUSDT': eth_amount},
+                      'notional': {'BTCUSDT': -20000.0, 'ETHUSDT': eth_amount * 1500.0},
+                      'unrealizedProfit': {'BTCUSDT': 0.0, 'ETHUSDT': 0.0},
+                      'base': {'BTCUSDT': 'BTC', 'ETHUSDT': 'ETH'}},
+            'amount': {'USDT': 10000.0}, 'margin_ratio': margin_ratio}
+
+
+class FakeAccountInfo:
+    """
+    BinanceAccountInfo answering get_summary() from a fixed summary
+    """
+
+    def __init__(self, summary):
+        self.summary = summary
+        self.calls = 0
+
+    def get_summary(self):
+        self.calls += 1
+        return self.summary
+
+
+class RecordingSink:
+
+    def __init__(self):
+        self.alerts = []
+
+    def emit(self, alert):
+        self.alerts.append(alert)
+
+
+class FailingSink:
+
+    def emit(self, alert):
+        raise ConnectionError('sink down')
+
+
+def book_ticker(symbol, price):
+    return json.dumps({'data': {'s': symbol, 'b': str(price - 1), 'a': str(price + 1)}})
+
+
+@pytest.fixture
+def monitor():
+    monitor = HedgeDriftMonitor(sinks=[FailingSink(), RecordingSink()])
+    monitor._account_client = FakeAccountInfo(summary())
+    monitor.set_exposure(EXPOSURE, PRICES)
+    return monitor
+
+
+@pytest.fixture
+def book(monitor):
+    book = BinancePriceBook(target_tokens=('BTC', 'ETH'))
+    book.add_listener(monitor.on_price)
+    return book
+
+
+def test_nothing_is_computed_before_the_account(monitor):
+    assert monitor.recompute() is None
+
+
+def test_drift_and_margin_from_the_account(monitor):
+    monitor.refresh_account()
+    state = monitor.recompute()
+
+    assert state['tokens']['BTC'] == {'exposure_usd': 20000.0, 'hedge_units': -1.0, 'net_delta_usd': 0.0,
+                                      'drift': 0.0}
+    # 10 ETH in GLP, 9 hedged
+    assert state['tokens']['ETH']['net_delta_usd'] == pytest.approx(1500.0)
+    assert state['tokens']['ETH']['drift'] == pytest.approx(0.1)
+    assert state['margin_ratio'] == pytest.approx(0.02)
+    assert state['nav'] == pytest.approx(65000.0)
+
+    monitor.refresh_account()
+    # the ccxt client is built once and kept
+    assert monitor._account_client.calls == 2
+
+
+def test_price_book_updates_mark_the_hedge_to_market(monitor, book):
+    monitor.refresh_account()
+    book._on_message(book_ticker('BTCUSDT', 21000.0))
+    state = monitor.recompute()
+
+    # the short BTC loses 1000 USD, the GLP side gains it
+    assert state['tokens']['BTC']['exposure_usd'] == pytest.approx(21000.0)
+    assert state['tokens']['BTC']['net_delta_usd'] == pytest.approx(0.0)
+    assert state['nav'] == pytest.approx(65000.0)
+    # maintenance margin scales with the hedge notional, 33500 -> 34500, over a margin balance of 9000
+    assert state['margin_ratio'] == pytest.approx(200.0 * 34500.0 / 33500.0 / 9000.0)
+
+
+def test_alerts_are_emitted_once_then_cleared(monitor):
+    sink = monitor.sinks[1]
+    monitor.set_account(summary(margin_ratio=0.6))
+    monitor.recompute()
+    monitor.recompute()
+
+    assert sorted((alert['level'], alert['kind'], alert['subject']) for alert in sink.alerts) == \
+        [('warning', 'hedge_drift', 'ETH'), ('warning', 'margin_ratio', 'Binance')]
+
+    monitor.set_account(summary(eth_amount=-10.0))
+    monitor.recompute()
+
+    assert sorted((alert['level'], alert['kind']) for alert in sink.alerts[2:]) == \
+        [('info', 'hedge_drift'), ('info', 'margin_ratio')]
+
+
+def test_small_drift_is_not_alerted(monitor):
+    monitor.min_delta_usd = 2000
+    monitor.set_account(summary())
+    monitor.recompute()
+
+    assert monitor.sinks[1].alerts == []
+
+
+def test_jsonl_sink(monitor, tmp_path):
+    path = tmp_path / 'alerts.jsonl'
+    monitor.sinks = [JsonlAlertSink(str(path))]
+    monitor.set_account(summary())
+    monitor.recompute()
+
+    alerts = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(alert['kind'], alert['subject']) for alert in alerts] == [('hedge_drift', 'ETH')]
+
+
+def test_burst_of_ticks_is_coalesced(monitor, book):
+    monitor.min_interval = 0.2
+    monitor.set_account(summary())
+    recomputes = []
+    recompute = monitor.recompute
+    monitor.recompute = lambda: recomputes.append(recompute())
+
+    monitor.start(exposure_interval=None, account_interval=None)
+    try:
+        for step in range(50):
+            book._on_message(book_ticker('ETHUSDT', 1500.0 + step))
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and \
+                (monitor.last_state is None or monitor.last_state['tokens']['ETH']['exposure_usd'] != 15490.0):
+            time.sleep(0.05)
+    finally:
+        monitor.stop()
+
+    assert monitor.last_state['tokens']['ETH']['exposure_usd'] == pytest.approx(15490.0)
+    assert len(recomputes) <= 3
@@ -0,0 +1,31 @@
+import datetime
+import pytest
+from cycleBenchmark import SqliteConnection
+from databaseWriter import DatabaseWriter
+
+pytest.importorskip('ccxt')
+from historicalBackfill import HistoricalBackfiller  # noqa: E402
+
+
+def block_rows(block):
+    created = f'2023-01-01 00:{block:02d}:00'
+    return {'gmx_account': [], 'gmx_total': [],
+            'metamask_account': [[created, created, float(block), 1500.0 * block, 'WETH', 'default']]}
+
+
+def test_blocks_already_written_are_skipped_on_resume():
+    con = SqliteConnection()
+    backfiller = HistoricalBackfiller(start=datetime.datetime(2023, 1, 1), end=datetime.datetime(2023, 1, 2),
+                                      block_interval=1, infura_api_key='test',
+                                      writer=DatabaseWriter(pool_size=1, connect=lambda: con))
+
+    assert backfiller._write([1, 2], [block_rows(1), block_rows(2)])['rows'] == 2
+    # the checkpoint was lost after block 2 was committed
+    stats = backfiller._write([2, 3], [block_rows(2), block_rows(3)])
+    assert (stats['rows'], stats['skipped_snapshots']) == (1, 1)
+
+    cur = con.cursor()
+    cur.execute('SELECT amount FROM metamask_account ORDER BY id')
+    assert cur.fetchall() == [(1.0,), (2.0,), (3.0,)]
+    cur.execute('SELECT snapshot_key FROM snapshot_log ORDER BY snapshot_key')
+    assert cur.fetchall() == [('backfill:1',), ('backfill:2',), ('backfill:3',)]
@@ -0,0 +1,53 @@
+import pytest
+from eth_abi import encode_abi
+from web3 import Web3, HTTPProvider
+from incrementalChainState import IncrementalChainState, TRANSFER_TOPIC, ZERO_ADDRESS, _address_topic
+from util.contractInfoEnumType import ContractAddressEnumType
+from util.tokensInfoEnumType import TokenAddressEnumType
+
+WALLET = '0x0000000000000000000000000000000000000001'
+TRACKER = ContractAddressEnumType.StakedGmxTracker.value
+ES_GMX = TokenAddressEnumType.esGMX.value
+
+
+def transfer(tx, index, token, sender, receiver, amount):
+    return {'address': token, 'transactionHash': tx, 'logIndex': index, 'blockNumber': 1,
+            'topics': [TRANSFER_TOPIC, _address_topic(sender), _address_topic(receiver)],
+            'data': '0x' + encode_abi(['uint256'], [amount * 10 ** 18]).hex()}
+
+
+@pytest.fixture
+def chain_state():
+    chain_state = IncrementalChainState(wallet_adr=WALLET, gmx_index_assets=('WETH',),
+                                        metamask_tokens=('GMX', 'esGMX'),
+                                        conn=Web3(HTTPProvider('http://127.0.0.1:1')))
+    chain_state.state = {'tokens_info': {}, 'metamask_balance': {'GMX': 0.0, 'esGMX': 0.0},
+                         'staked_glp_amount': 0.0, 'staked_gmx_amount': 10.0, 'staked_esgmx_amount': 10.0}
+    return chain_state
+
+
+def test_claim_is_not_an_unstake(chain_state):
+    chain_state._apply([transfer('0x01', 0, ES_GMX, TRACKER, WALLET, 2)])
+
+    assert chain_state.state['staked_esgmx_amount'] == 10.0
+    assert chain_state.state['metamask_balance']['esGMX'] == 2.0
+
+
+def test_compound_stakes_the_claimed_rewards(chain_state):
+    chain_state._apply([transfer('0x02', 0, ES_GMX, TRACKER, WALLET, 2),
+                        transfer('0x02', 1, ES_GMX, WALLET, TRACKER, 2),
+                        transfer('0x02', 2, TRACKER, ZERO_ADDRESS, WALLET, 2)])
+
+    assert chain_state.state['staked_esgmx_amount'] == 12.0
+    assert chain_state.state['metamask_balance']['esGMX'] == 0.0
+
+
+def test_unstake_burns_sgmx(chain_state):
+    chain_state._apply([transfer('0x03', 0, TRACKER, WALLET, ZERO_ADDRESS, 3),
+                        transfer('0x03', 1, ES_GMX, TRACKER, WALLET, 3),
+                        transfer('0x04', 0, TRACKER, WALLET, ZERO_ADDRESS, 4),
+                        transfer('0x04', 1, TokenAddressEnumType.GMX.value, TRACKER, WALLET, 4)])
+
+    assert chain_state.state['staked_esgmx_amount'] == 7.0
+    assert chain_state.state['staked_gmx_amount'] == 6.0
+    assert chain_state.state['metamask_balance'] == {'GMX': 4.0, 'esGMX': 3.0}
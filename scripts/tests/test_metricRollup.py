@@ -0,0 +1,72 @@
+import datetime
+from databaseWriter import DatabaseWriter
+from metricRollup import MetricRollup
+
+NOW = datetime.datetime(2023, 1, 2, 10, 30)
+
+
+class RecordingConnection:
+    """
+    Answers every SELECT of a raw table with one row and records the statements
+    """
+
+    ROWS = {'summary_total_balance': [NOW, NOW, 'Binance', 1.0, 2.0, 0.1, 'default'],
+            'binance_hedge_account': [NOW, NOW, -1.0, -100.0, 0.0001, 'USDT', 'BTC', 5.0, 'default'],
+            'gmx_total': [NOW, NOW, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 'default']}
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=()):
+        self.statements.append((sql, list(params)))
+        self._result = [row for table, row in self.ROWS.items() if sql.startswith('SELECT') and f'FROM {table} ' in sql]
+
+    def fetchall(self):
+        return self._result
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def rebuild(change_filtered):
+    con = RecordingConnection()
+    MetricRollup.rebuild(DatabaseWriter(pool_size=1, connect=lambda: con), NOW, NOW + datetime.timedelta(hours=1),
+                         change_filtered=change_filtered)
+    return con.statements
+
+
+def test_hedge_series_are_pairs():
+    rows = {'binance_hedge_account': [RecordingConnection.ROWS['binance_hedge_account'],
+                                      [NOW, NOW, -0.5, -50.0, 0.0001, 'BUSD', 'BTC', 1.0, 'default']]}
+
+    series = {row[4] for row in MetricRollup.rollup_rows(rows)}
+
+    assert series == {'BTCUSDT', 'BTCBUSD'}
+
+
+def test_rebuild_leaves_change_filtered_buckets_alone():
+    statements = rebuild(change_filtered=True)
+
+    assert not any('FROM binance_hedge_account' in sql for sql, _ in statements)
+    deletes = [params for sql, params in statements if sql.startswith('DELETE')]
+    assert len(deletes) == len(MetricRollup.GRANULARITIES)
+    assert 'hedge_notional' not in deletes[0] and 'notional' in deletes[0]
+    inserted = [params for sql, params in statements if sql.startswith('INSERT')]
+    assert all('hedge_notional' not in params for params in inserted)
+
+
+def test_rebuild_everything_without_the_filter():
+    statements = rebuild(change_filtered=False)
+
+    deletes = [params for sql, params in statements if sql.startswith('DELETE')]
+    assert 'hedge_notional' in deletes[0]
+    assert any('FROM binance_hedge_account' in sql for sql, _ in statements)
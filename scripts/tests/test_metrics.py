@@ -0,0 +1,108 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from metrics import (MetricsRegistry, MetricsServer, async_web3_metrics_middleware, aiohttp_trace_config,
+                     instrument_async_exchange, call_site)
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    MetricsRegistry.reset()
+    yield
+    MetricsRegistry.reset()
+
+
+def histogram(name, **labels):
+    return [item for item in MetricsRegistry.to_json()['histograms']
+            if item['name'] == name and labels.items() <= item['labels'].items()]
+
+
+def counter(name, **labels):
+    return sum(item['value'] for item in MetricsRegistry.to_json()['counters']
+               if item['name'] == name and labels.items() <= item['labels'].items())
+
+
+def test_async_web3_middleware():
+    async def make_request(method, params):
+        return {'error': {'code': -32000, 'message': 'execution reverted'}} if params else {'result': '0x1'}
+
+    async def run():
+        middleware = await async_web3_metrics_middleware(make_request, None)
+        with call_site('Test.run'):
+            await middleware('eth_blockNumber', [])
+            await middleware('eth_call', [{}])
+
+    asyncio.run(run())
+
+    assert histogram('rpc_request_seconds', method='eth_blockNumber', call_site='Test.run')[0]['count'] == 1
+    assert counter('rpc_request_errors_total', method='eth_call', error='rpc_error') == 1
+
+
+class FakeAsyncExchange:
+    id = 'binance'
+    last_response_headers = None
+    last_http_response = None
+
+    async def fetch(self, url, method='GET', headers=None, body=None):
+        if 'fail' in url:
+            raise ConnectionError('down')
+        self.last_response_headers = {'X-MBX-USED-WEIGHT-1M': '42'}
+        self.last_http_response = '[]'
+        return []
+
+
+def test_async_exchange():
+    exchange = instrument_async_exchange(FakeAsyncExchange())
+
+    async def run():
+        await exchange.fetch('https://fapi.binance.com/fapi/v1/premiumIndex?symbol=BTCUSDT')
+        with pytest.raises(ConnectionError):
+            await exchange.fetch('https://fapi.binance.com/fapi/v1/fail')
+
+    asyncio.run(run())
+
+    assert histogram('ccxt_request_seconds', endpoint='fapi/v1/premiumIndex')[0]['count'] == 1
+    assert counter('ccxt_request_errors_total', endpoint='fapi/v1/fail', error='ConnectionError') == 1
+    assert counter('ccxt_response_bytes_total', exchange='binance') == 2
+    assert MetricsRegistry.to_json()['gauges'][0]['value'] == 42.0
+
+
+@pytest.fixture
+def http_server():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = b'{}'
+            self.send_response(200 if self.path == '/ok' else 429)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_aiohttp_trace_config(http_server):
+    aiohttp = pytest.importorskip('aiohttp')
+
+    async def run():
+        async with aiohttp.ClientSession(trace_configs=[aiohttp_trace_config()]) as session:
+            for path in ('/ok', '/throttled'):
+                async with session.get(http_server + path) as res:
+                    await res.read()
+
+    asyncio.run(run())
+
+    assert histogram('http_request_seconds', host='127.0.0.1')[0]['count'] == 2
+    assert counter('http_response_bytes_total', host='127.0.0.1') == 4
+    assert counter('http_request_errors_total', host='127.0.0.1', error='429') == 1
+
+
+def test_metrics_server_listens_on_localhost_by_default():
+    assert MetricsServer().host == '127.0.0.1'
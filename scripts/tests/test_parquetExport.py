@@ -0,0 +1,112 @@
+import datetime
+import decimal
+import os
+import pytest
+from cycleBenchmark import SqliteConnection
+from databaseWriter import DatabaseWriter
+
+pytest.importorskip('pyarrow')
+from parquetExport import ParquetExporter, ParquetHistory  # noqa: E402
+
+DAY = datetime.datetime(2023, 1, 1, 23, 40)
+INSERT = 'INSERT INTO metamask_account (id, created_date, updated_date, amount, notional, symbol, account) ' \
+         'VALUES (%s, %s, %s, %s, %s, %s, %s)'
+
+
+def insert(con, ids, account='default'):
+    cur = con.cursor()
+    for row_id in ids:
+        created = DAY + datetime.timedelta(minutes=10 * row_id)
+        cur.execute(INSERT, [row_id, created, created, float(row_id), 1500.0 * row_id, 'WETH', account])
+    con.commit()
+
+
+@pytest.fixture
+def con():
+    return SqliteConnection()
+
+
+@pytest.fixture
+def exporter(con, tmp_path):
+    return ParquetExporter(DatabaseWriter(pool_size=1, connect=lambda: con), root=str(tmp_path),
+                           tables=('metamask_account',), batch_size=2)
+
+
+def files(root):
+    return sorted(os.path.relpath(os.path.join(directory, name), root)
+                  for directory, _, names in os.walk(root) for name in names if name.endswith('.parquet'))
+
+
+def test_export_is_incremental_and_partitioned_by_day(exporter, con, tmp_path):
+    insert(con, range(1, 4))
+    assert exporter.export() == {'metamask_account': 3}
+    assert files(tmp_path) == ['metamask_account/date=2023-01-01/part-000000000001-000000000001.parquet',
+                               'metamask_account/date=2023-01-02/part-000000000002-000000000002.parquet',
+                               'metamask_account/date=2023-01-02/part-000000000003-000000000003.parquet']
+
+    insert(con, range(4, 6))
+    # a new exporter resumes from the saved state
+    exporter = ParquetExporter(exporter.writer, root=str(tmp_path), tables=('metamask_account',))
+    assert exporter.export() == {'metamask_account': 2}
+    assert exporter.export() == {'metamask_account': 0}
+
+    history = ParquetHistory(str(tmp_path)).read('metamask_account')
+    assert sorted(history['id']) == [1, 2, 3, 4, 5]
+    assert history['created_date'].dtype.kind == 'M'
+
+
+def test_rows_committed_late_are_exported(exporter, con):
+    insert(con, (1, 2, 4))
+    assert exporter.export() == {'metamask_account': 3}
+    assert exporter.gaps['metamask_account'].keys() == {'3'}
+
+    # id 3 was in flight in another transaction
+    insert(con, (3,))
+    assert exporter.export() == {'metamask_account': 1}
+    assert exporter.gaps['metamask_account'] == {}
+
+
+def test_gaps_expire(exporter, con):
+    exporter.gap_timeout = 0
+    insert(con, (1, 3))
+    exporter.export()
+
+    assert exporter.export() == {'metamask_account': 0}
+    assert exporter.gaps['metamask_account'] == {}
+
+
+def test_read_filters_and_deduplicates(exporter, con, tmp_path):
+    insert(con, range(1, 7))
+    insert(con, range(7, 9), account='other')
+    exporter.export()
+    # a run interrupted before its state was saved exports the same rows again
+    exporter.state['metamask_account'] = 4
+    exporter.export()
+
+    history = ParquetHistory(str(tmp_path))
+    assert sorted(history.read('metamask_account')['id']) == list(range(1, 9))
+    rows = history.read('metamask_account', columns=['amount'], start=DAY + datetime.timedelta(minutes=30),
+                        end=DAY + datetime.timedelta(minutes=70), accounts=['default'])
+    assert rows.columns.tolist() == ['amount']
+    assert sorted(rows['amount']) == [3.0, 4.0, 5.0, 6.0]
+
+
+def test_compact_merges_past_days(exporter, con, tmp_path):
+    insert(con, range(1, 8))
+    exporter.export()
+    exporter.state['metamask_account'] = 3
+    exporter.export()
+
+    assert exporter.compact('metamask_account', before=datetime.date(2023, 1, 2)) == 0
+    assert exporter.compact('metamask_account', before=datetime.date(2023, 1, 3)) == 1
+    assert [path for path in files(tmp_path) if '2023-01-02' in path] == \
+        ['metamask_account/date=2023-01-02/part-000000000002-000000000007.parquet']
+    assert sorted(ParquetHistory(str(tmp_path)).read('metamask_account')['id']) == list(range(1, 8))
+
+
+def test_decimal_columns_become_floats():
+    table = ParquetExporter.to_arrow(['id', 'notional', 'symbol'],
+                                     [(1, decimal.Decimal('1.5'), 'WETH'), (2, None, 'USDC')])
+
+    assert table.column('notional').to_pylist() == [1.5, None]
+    assert str(table.column('notional').type) == 'double'
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from aiohttp import web
+from priceBook import BinancePriceBook
+
+
+def book_ticker(symbol: str, bid: float, ask: float) -> str:
+    return json.dumps({'stream': f'{symbol.lower()}@bookTicker', 'data': {'s': symbol, 'b': str(bid), 'a': str(ask)}})
+
+
+class StubStream:
+    """
+    Local websocket server sending messages to every client, then keeping the connection open, or closing it when
+    close is set
+    """
+
+    def __init__(self, messages, close=False):
+        self.messages = messages
+        self.close = close
+        self.connections = 0
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    async def _handler(self, request):
+        self.connections += 1
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        for message in self.messages:
+            await ws.send_str(message)
+        if self.close:
+            await ws.close()
+        async for _ in ws:
+            pass
+        return ws
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_get('/stream', self._handler)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        self._loop.run_until_complete(site.start())
+        self.url = f'ws://127.0.0.1:{self._runner.addresses[0][1]}/stream'
+        self._started.set()
+        self._loop.run_forever()
+
+    def start(self):
+        self._thread.start()
+        self._started.wait(5)
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+
+MESSAGES = [book_ticker('BTCUSDT', 100, 102),
+            'not json',
+            json.dumps({'data': {'s': 'ETHUSDT', 'b': '10'}}),
+            json.dumps({'data': {'s': 'ETHUSDT', 'b': 'x', 'a': '11'}}),
+            json.dumps(['ETHUSDT']),
+            book_ticker('ETHUSDT', 10, 12)]
+
+
+def failing(token, price):
+    raise RuntimeError('listener bug')
+
+
+def test_malformed_messages_and_failing_listeners_are_skipped():
+    updates = []
+    book = BinancePriceBook(target_tokens=('BTC', 'ETH'))
+    book.add_listener(failing)
+    book.add_listener(lambda token, price: updates.append((token, price)))
+
+    for message in MESSAGES:
+        book._on_message(message)
+
+    assert book.get_prices(('BTC', 'ETH', 'USDT')) == {'BTC': 101.0, 'ETH': 11.0, 'USDT': 1}
+    assert updates == [('BTC', 101.0), ('ETH', 11.0)]
+
+
+@pytest.fixture
+def stream():
+    stream = StubStream(MESSAGES).start()
+    yield stream
+    stream.stop()
+
+
+def test_stream_survives_malformed_messages_and_failing_listeners(stream):
+    updates = []
+    book = BinancePriceBook(target_tokens=('BTC', 'ETH'), url=stream.url)
+    book.add_listener(failing)
+    book.add_listener(lambda token, price: updates.append((token, price)))
+    book.start()
+    try:
+        assert book.wait_ready(5)
+        assert book.get_prices(('BTC', 'ETH', 'USDT')) == {'BTC': 101.0, 'ETH': 11.0, 'USDT': 1}
+        assert updates == [('BTC', 101.0), ('ETH', 11.0)]
+        assert stream.connections == 1
+    finally:
+        book.stop()
+
+
+def test_stream_reconnects_when_closed():
+    stream = StubStream([book_ticker('BTCUSDT', 100, 102)], close=True).start()
+    book = BinancePriceBook(target_tokens=('BTC',), url=stream.url, reconnect_delay=0.05).start()
+    try:
+        deadline = time.time() + 5
+        while stream.connections < 2 and time.time() < deadline:
+            time.sleep(0.05)
+        assert stream.connections >= 2
+        assert book.get_prices(('BTC',)) == {'BTC': 101.0}
+    finally:
+        book.stop()
+        stream.stop()
+
+
+def test_stale_or_missing_prices():
+    book = BinancePriceBook(target_tokens=('BTC', 'ETH'))
+    book._on_message(book_ticker('BTCUSDT', 100, 102))
+
+    assert book.get_prices(('BTC', 'ETH')) is None
+    book._prices['BTC'] = (101.0, time.time() - 60)
+    assert book.get_prices(('BTC',), max_age=10) is None
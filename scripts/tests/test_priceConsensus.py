@@ -0,0 +1,110 @@
+import math
+import random
+import pytest
+from priceConsensus import PriceConsensus, METHODS
+
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture
+def consensus():
+    consensus = PriceConsensus()
+    consensus.update('binance', {'BTC': 20010.0, 'ETH': 1500.0, 'GMX': 40.0, 'USDT': 1.0}, timestamp=NOW)
+    consensus.update('coingecko', {'WBTC': 19990.0, 'WETH': 1502.0, 'GMX': 41.0, 'FRAX': 0.999, 'USDT': 1.001},
+                     timestamp=NOW)
+    consensus.update('gmx', {'WBTC': 20000.0, 'WETH': 1498.0, 'GMX': 90.0, 'FRAX': 1.0, 'USDT': 1.0},
+                     timestamp=NOW - 30)
+    return consensus
+
+
+def test_mean_over_the_sources_and_aliases(consensus):
+    prices = consensus.resolve(NOW)
+
+    assert prices['WBTC'] == pytest.approx(20000.0)
+    assert prices['WETH'] == pytest.approx(1500.0)
+    # only Binance prices ETH, through the alias
+    assert prices['ETH'] == 1500.0
+
+
+def test_token_policies(consensus):
+    prices = consensus.resolve(NOW)
+
+    # the GMX source is not used for the GMX token, nor Binance for USDT
+    assert prices['GMX'] == pytest.approx(40.5)
+    assert prices['USDT'] == pytest.approx(1.0005)
+    assert prices['FRAX'] == 0.999
+    assert consensus.unpriced(NOW) == ['LINK', 'UNI', 'USDC', 'DAI']
+
+
+def test_stale_prices_are_ignored(consensus):
+    consensus = PriceConsensus(default_policy={'max_age': 60})
+    consensus.update('binance', {'BTC': 20010.0}, timestamp=NOW - 120)
+    consensus.update('gmx', {'WBTC': 20000.0, 'LINK': 7.0}, timestamp=NOW - 30)
+
+    assert consensus.resolve(NOW) == {'WBTC': 20000.0, 'LINK': 7.0}
+    assert consensus.resolve(NOW + 60) == {}
+
+
+def test_outliers_are_rejected():
+    consensus = PriceConsensus(default_policy={'outlier_threshold': 0.05})
+    consensus.update('binance', {'BTC': 20010.0}, timestamp=NOW)
+    consensus.update('coingecko', {'WBTC': 19990.0}, timestamp=NOW)
+    consensus.update('gmx', {'WBTC': 25000.0}, timestamp=NOW)
+
+    assert consensus.resolve(NOW)['WBTC'] == pytest.approx(20000.0)
+
+
+def test_policy_overrides():
+    consensus = PriceConsensus(policies={'WBTC': {'method': 'max'}, 'GMX': {'sources': None, 'method': 'median'}})
+    consensus.update('binance', {'BTC': 20010.0, 'GMX': 40.0}, timestamp=NOW)
+    consensus.update('coingecko', {'WBTC': 19990.0, 'GMX': 41.0}, timestamp=NOW)
+    consensus.update('gmx', {'WBTC': 20000.0, 'GMX': 90.0}, timestamp=NOW)
+
+    assert consensus.resolve(NOW) == {'WBTC': 20010.0, 'GMX': 41.0}
+
+
+def reference(values, policy):
+    """
+    The policy of one token applied in plain Python, for the vectorized resolve() to match
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    middle = len(values) // 2
+    median = values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+    if policy['outlier_threshold'] is not None:
+        values = [value for value in values if abs(value - median) <= policy['outlier_threshold'] * abs(median)]
+        if not values:
+            return None
+    cut = math.floor(len(values) * policy['trim'])
+    middle = len(values) // 2
+    return {'mean': lambda: sum(values) / len(values),
+            'median': lambda: values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2,
+            'min': lambda: values[0],
+            'max': lambda: values[-1],
+            'trimmed_mean': lambda: sum(values[cut:len(values) - cut]) / (len(values) - 2 * cut)}[policy['method']]()
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_resolve_matches_the_per_token_policy(method):
+    rng = random.Random(method)
+    sources = ('a', 'b', 'c', 'd', 'e')
+    tokens = tuple(f'T{i}' for i in range(20))
+    consensus = PriceConsensus(default_policy={'method': method, 'max_age': 60, 'outlier_threshold': 0.1,
+                                               'trim': 0.2}, tokens=tokens, sources=sources)
+    for source in sources:
+        for token in tokens:
+            if rng.random() < 0.8:
+                consensus.set_price(source, token, rng.choice((100.0, 150.0)) * rng.uniform(0.95, 1.05),
+                                    timestamp=NOW - rng.uniform(0, 90))
+
+    prices = consensus.resolve(NOW)
+    for token in tokens:
+        column = consensus._token_index[token]
+        values = [consensus.prices[row, column] for row in range(len(sources))
+                  if NOW - consensus.timestamps[row, column] <= 60]
+        expected = reference(values, consensus.policies[token])
+        if expected is None:
+            assert token not in prices
+        else:
+            assert prices[token] == pytest.approx(expected)
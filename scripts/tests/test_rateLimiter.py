@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from rateLimiter import RateLimiter, throttle_async_exchange, PRIORITY_CRITICAL
+
+
+@pytest.fixture(autouse=True)
+def buckets():
+    RateLimiter.reset()
+    yield
+    RateLimiter.reset()
+
+
+class FakeAsyncExchange:
+    """
+    The request path of ccxt.async_support: fetch2 awaits throttle with the endpoint weight, then fetch
+    """
+    enableRateLimit = False
+    last_http_status = None
+
+    def __init__(self, used_weight):
+        self.used_weight = used_weight
+        self.last_response_headers = None
+        self.urls = []
+
+    async def throttle(self, cost=None):
+        pass
+
+    async def fetch(self, url, method='GET', headers=None, body=None):
+        await asyncio.sleep(0)
+        self.urls.append(url)
+        self.last_response_headers = {'X-MBX-USED-WEIGHT-1M': str(self.used_weight)} if self.used_weight else {}
+        return {}
+
+    async def fetch2(self, url, cost):
+        await self.throttle(cost)
+        return await self.fetch(url)
+
+
+def test_async_exchange_spends_the_shared_budgets():
+    exchange = throttle_async_exchange(FakeAsyncExchange(used_weight=100), PRIORITY_CRITICAL)
+
+    async def run():
+        await asyncio.gather(exchange.fetch2('https://fapi.binance.com/fapi/v1/premiumIndex', 10),
+                             exchange.fetch2('https://fapi.binance.com/fapi/v2/positionRisk', 5))
+
+    asyncio.run(run())
+
+    assert exchange.enableRateLimit
+    assert len(exchange.urls) == 2
+    futures = RateLimiter.stats()['binance_futures']
+    # the weight header replaces the local estimate
+    assert futures['tokens'] == pytest.approx(futures['capacity'] - 100, abs=1)
+    assert 'binance' not in RateLimiter.stats()
+
+
+def test_async_exchange_waits_for_the_bucket_off_the_event_loop(monkeypatch):
+    monkeypatch.setitem(RateLimiter.BUDGETS, 'binance', (10, 1))
+    exchange = throttle_async_exchange(FakeAsyncExchange(used_weight=None))
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0.05)
+
+    async def run():
+        task = asyncio.ensure_future(ticker())
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        for _ in range(2):
+            await exchange.fetch2('https://api.binance.com/api/v3/klines', 9)
+        task.cancel()
+        return loop.time() - start_time
+
+    # 9 of the 10 units are spendable, the second call waits for a refill of about a second
+    assert asyncio.run(run()) > 0.8
+    assert len(ticks) > 10
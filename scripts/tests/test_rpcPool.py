@@ -0,0 +1,81 @@
+import time
+import pytest
+import requests
+from web3 import Web3
+from rpcPool import RpcEndpointPool
+
+
+def test_fails_over_and_cools_down_a_failing_endpoint(rpc_stubs):
+    failing, healthy = rpc_stubs(fail=True, block_number=1), rpc_stubs(block_number=2)
+    pool = RpcEndpointPool([failing.url, healthy.url], max_failures=1, cooldown=60)
+    conn = Web3(pool)
+
+    assert conn.eth.block_number == 2
+    assert failing.requests == 1
+    assert [item['cooling_down'] for item in pool.stats()] == [True, False]
+
+    for _ in range(5):
+        assert conn.eth.block_number == 2
+    assert failing.requests == 1
+
+
+def test_routes_to_the_fastest_endpoint(rpc_stubs):
+    slow, fast = rpc_stubs(delay=0.1, block_number=1), rpc_stubs(delay=0, block_number=2)
+    conn = Web3(RpcEndpointPool([slow.url, fast.url]))
+
+    for _ in range(10):
+        conn.eth.block_number
+
+    # both are measured once, then every call goes to the faster one
+    assert slow.requests == 1
+    assert fast.requests == 9
+
+
+def test_hedges_a_slow_call_to_the_next_endpoint(rpc_stubs):
+    slow, fast = rpc_stubs(delay=0.5, block_number=1), rpc_stubs(delay=0, block_number=2)
+    conn = Web3(RpcEndpointPool([slow.url, fast.url], hedge_percentile=0.9, min_hedge_delay=0.05))
+
+    start_time = time.perf_counter()
+    assert conn.eth.block_number == 2
+    assert time.perf_counter() - start_time < 0.4
+    assert slow.requests == 1 and fast.requests == 1
+
+
+def test_call_errors_are_returned_without_failover(rpc_stubs):
+    reverting = rpc_stubs(error={'code': -32000, 'message': 'execution reverted'})
+    healthy = rpc_stubs(block_number=2)
+    pool = RpcEndpointPool([reverting.url, healthy.url], max_failures=1)
+    conn = Web3(pool)
+
+    with pytest.raises(ValueError):
+        conn.eth.block_number
+    assert healthy.requests == 0
+    assert pool.stats()[0]['error_rate'] == 0
+    assert not pool.stats()[0]['cooling_down']
+
+
+def test_rate_limited_endpoint_fails_over(rpc_stubs):
+    limited = rpc_stubs(error={'code': -32005, 'message': 'daily request count exceeded, request rate limited'})
+    healthy = rpc_stubs(block_number=2)
+    pool = RpcEndpointPool([limited.url, healthy.url])
+
+    assert Web3(pool).eth.block_number == 2
+    assert pool.stats()[0]['error_rate'] > 0
+
+
+def test_every_endpoint_rate_limited_raises_value_error(rpc_stubs):
+    error = {'code': 429, 'message': 'Too Many Requests'}
+    conn = Web3(RpcEndpointPool([rpc_stubs(error=error).url, rpc_stubs(error=error).url]))
+
+    with pytest.raises(ValueError):
+        conn.eth.block_number
+
+
+def test_transactions_are_never_retried(rpc_stubs):
+    failing, healthy = rpc_stubs(fail=True), rpc_stubs()
+    pool = RpcEndpointPool([failing.url, healthy.url], hedge_percentile=0.9)
+
+    with pytest.raises(requests.HTTPError):
+        pool.make_request('eth_sendRawTransaction', ['0x00'])
+    assert failing.requests == 1
+    assert healthy.requests == 0
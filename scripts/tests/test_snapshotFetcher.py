@@ -0,0 +1,116 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from eth_abi import decode_abi, encode_abi
+from web3 import Web3, HTTPProvider
+from cycleCache import CycleCache
+from snapshotFetcher import OnChainSnapshotFetcher
+from util.tokensInfoEnumType import TokenDecimalsEnumType
+from vaultState import VaultState
+
+TOKENS = ('WBTC', 'WETH', 'USDC')
+METAMASK_TOKENS = ('WETH', 'ETH', 'GMX', 'USDC')
+WALLET = '0x0000000000000000000000000000000000000001'
+BLOCK_NUMBER = 1234
+
+VALUES = {'vault_token_info': [10 ** 30] * (len(TOKENS) * len(VaultState.FIELDS)),
+          'glp_supply': 2 * 10 ** 18,
+          'aum_buy': 3 * 10 ** 30,
+          'aum_sell': 2 * 10 ** 30,
+          'staked_glp': 10 ** 18,
+          'staked_gmx': 2 * 10 ** 18,
+          'staked_esgmx': 3 * 10 ** 18,
+          'staking_info': [10 ** 18] * 20,
+          'block_timestamp': 1_700_000_000}
+VALUES.update({f'balance_{token}': 5 * 10 ** TokenDecimalsEnumType[token].value for token in METAMASK_TOKENS})
+
+
+class StubMulticallNode:
+    """
+    JSON-RPC endpoint answering the Multicall aggregate, each call is looked up by its target and call data in
+    answers
+    """
+
+    def __init__(self, answers):
+        self.calls = []
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                node.calls.append(request['method'])
+                if request['method'] == 'eth_call':
+                    data = bytes.fromhex(request['params'][0]['data'][2:])
+                    (aggregate,) = decode_abi(['(address,bytes)[]'], data[4:])
+                    result = '0x' + encode_abi(['uint256', 'bytes[]'],
+                                               [BLOCK_NUMBER, [answers[(Web3.toChecksumAddress(target), call_data)]
+                                                                 for target, call_data in aggregate]]).hex()
+                else:
+                    result = hex(42161)
+                body = json.dumps({'jsonrpc': '2.0', 'id': request['id'], 'result': result}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self._server.server_address[1]}'
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def answers(fetcher):
+    return {(target, call_data): encode_abi(output_types, [VALUES[key]])
+            for key, target, call_data, output_types in fetcher._get_calls()}
+
+
+@pytest.fixture
+def node():
+    fetcher = OnChainSnapshotFetcher(wallet_adr=WALLET, gmx_index_assets=TOKENS, metamask_tokens=METAMASK_TOKENS,
+                                     conn=Web3(HTTPProvider('http://127.0.0.1:1')))
+    node = StubMulticallNode(answers(fetcher))
+    CycleCache.new_cycle()
+    yield node
+    node.stop()
+    CycleCache.new_cycle()
+
+
+def check(snapshot):
+    assert snapshot['block_number'] == BLOCK_NUMBER
+    assert snapshot['block_timestamp'] == 1_700_000_000
+    assert snapshot['gmx_price']['WETH'] == 1.0
+    assert snapshot['glp_supply'] == 2.0
+    assert snapshot['glp_price'] == {'buy': 1.5, 'sell': 1.0}
+    assert (snapshot['staked_glp_amount'], snapshot['staked_gmx_amount'], snapshot['staked_esgmx_amount']) == \
+        (1.0, 2.0, 3.0)
+    assert snapshot['claimable_info']['weth_claimable'] == 2.0
+    assert snapshot['metamask_balance'] == {token: 5.0 for token in METAMASK_TOKENS}
+
+
+def test_snapshot_is_one_eth_call(node):
+    fetcher = OnChainSnapshotFetcher(wallet_adr=WALLET, gmx_index_assets=TOKENS, metamask_tokens=METAMASK_TOKENS,
+                                     conn=Web3(HTTPProvider(node.url)))
+
+    check(fetcher.get_snapshot())
+    assert node.calls.count('eth_call') == 1
+
+    # served from the cycle cache
+    fetcher.get_snapshot()
+    assert node.calls.count('eth_call') == 1
+
+
+def test_aggregate_request_for_an_external_provider(node):
+    fetcher = OnChainSnapshotFetcher(wallet_adr=WALLET, gmx_index_assets=TOKENS, metamask_tokens=METAMASK_TOKENS,
+                                     conn=Web3(HTTPProvider(node.url)))
+
+    response = Web3(HTTPProvider(node.url)).eth.call(fetcher.get_aggregate_request())
+
+    check(fetcher.decode_aggregate_response(bytes(response)))
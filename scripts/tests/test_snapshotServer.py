@@ -0,0 +1,49 @@
+import datetime
+import urllib.error
+import urllib.request
+import pytest
+from snapshotServer import SnapshotServer, SnapshotStore
+
+TABLE_COLUMNS = {'summary_total_balance': 'created_date, updated_date, exchange_name, notional, wallet_balance, '
+                                          'margin_ratio, account',
+                 'binance_hedge_account': 'created_date, updated_date, position_amount, notional, funding_rate, '
+                                          'quote, base, unrealized_profit, account'}
+NOW = datetime.datetime(2023, 1, 1)
+ROWS = {'summary_total_balance': [[NOW, NOW, 'Binance', -30000.0, 10000.0, 0.02, 'default'],
+                                  [NOW, NOW, 'GMX', 35000.0, 0, 0, 'default']],
+        'binance_hedge_account': [[NOW, NOW, -1.0, -20000.0, 0.0001, 'USDT', 'BTC', 150.0, 'default'],
+                                  [NOW, NOW, -0.5, -10000.0, 0.0001, 'BUSD', 'BTC', 50.0, 'default']]}
+
+
+def test_summary_keeps_every_pair_in_the_nav():
+    summary = SnapshotStore.build(ROWS, TABLE_COLUMNS)['accounts']['default']['summary']
+
+    assert set(summary['hedge']) == {'BTCUSDT', 'BTCBUSD'}
+    assert summary['nav'] == 35000.0 + 10000.0 + 150.0 + 50.0
+
+
+@pytest.fixture
+def server():
+    server = SnapshotServer(port=0).start()
+    yield f'http://127.0.0.1:{server._server.server_address[1]}'
+    server.stop()
+    SnapshotStore.reset()
+
+
+def test_serves_the_published_snapshot_with_etag(server):
+    with pytest.raises(urllib.error.HTTPError) as not_found:
+        urllib.request.urlopen(server + '/snapshot')
+    assert not_found.value.code == 404
+
+    SnapshotStore.publish(ROWS, TABLE_COLUMNS, 'first')
+    with urllib.request.urlopen(server + '/snapshot/default') as res:
+        etag = res.headers['ETag']
+        assert res.status == 200
+
+    with pytest.raises(urllib.error.HTTPError) as not_modified:
+        urllib.request.urlopen(urllib.request.Request(server + '/snapshot/default', headers={'If-None-Match': etag}))
+    assert not_modified.value.code == 304
+
+    SnapshotStore.publish(ROWS, TABLE_COLUMNS, 'second')
+    with urllib.request.urlopen(server + '/snapshot/history') as res:
+        assert res.read().count(b'"snapshot_key"') == 2
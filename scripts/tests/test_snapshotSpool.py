@@ -0,0 +1,90 @@
+import datetime
+import os
+import pytest
+from cycleBenchmark import SqliteConnection
+from dataBaseInserter import DatabaseInserter
+from databaseWriter import DatabaseWriter
+from snapshotSpool import SnapshotSpool, SpoolReplayer
+
+CREATED = datetime.datetime(2023, 1, 1, 0, 10)
+STATEMENTS = {'metamask_account': DatabaseInserter.insert_sql('metamask_account')}
+
+
+def rows(amount):
+    return {'metamask_account': [[CREATED, CREATED, amount, 1500.0 * amount, 'WETH', 'default']]}
+
+
+def unreachable():
+    raise ConnectionError('MySQL is down')
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return SnapshotSpool(directory=str(tmp_path / 'spool'))
+
+
+def test_segment_round_trip(spool):
+    spool.append('a', STATEMENTS, rows(1.0))
+    spool.append('b', STATEMENTS, rows(2.0))
+    (path,) = spool.take_sealed()
+
+    assert path.endswith('segment-00000000.sealed')
+    assert spool.read_segment(path) == [('a', STATEMENTS, rows(1.0)), ('b', STATEMENTS, rows(2.0))]
+
+
+def test_truncated_last_line_is_dropped(spool):
+    spool.append('a', STATEMENTS, rows(1.0))
+    (path,) = spool.take_sealed()
+    with open(path, 'a') as f:
+        f.write('{"key": "b", "statem')
+
+    assert [key for key, _, _ in spool.read_segment(path)] == ['a']
+
+
+def test_segments_roll_over_and_crashed_segments_are_taken(spool):
+    spool.segment_max_bytes = 1
+    spool.append('a', STATEMENTS, rows(1.0))
+    spool.append('b', STATEMENTS, rows(2.0))
+    # left open by a process that crashed
+    SnapshotSpool(directory=spool.directory).append('c', STATEMENTS, rows(3.0))
+
+    assert spool.pending() == 3
+    assert [os.path.basename(path) for path in spool.take_sealed()] == \
+        ['segment-00000000.sealed', 'segment-00000001.sealed', 'segment-00000002.sealed']
+
+
+def test_replay_writes_each_snapshot_once(spool):
+    con = SqliteConnection()
+    replayer = SpoolReplayer(spool, DatabaseWriter(pool_size=1, connect=lambda: con), batch_size=2)
+    for key, amount in (('a', 1.0), ('b', 2.0), ('c', 3.0)):
+        spool.append(key, STATEMENTS, rows(amount))
+
+    assert replayer.replay_once() == 3
+    assert spool.pending() == 0
+    # replaying a segment the database already has
+    spool.append('c', STATEMENTS, rows(3.0))
+    assert replayer.replay_once() == 0
+
+    cur = con.cursor()
+    cur.execute('SELECT amount FROM metamask_account ORDER BY id')
+    assert cur.fetchall() == [(1.0,), (2.0,), (3.0,)]
+
+
+def test_segment_is_kept_until_written(spool):
+    spool.append('a', STATEMENTS, rows(1.0))
+
+    with pytest.raises(ConnectionError):
+        SpoolReplayer(spool, DatabaseWriter(pool_size=1, connect=unreachable)).replay_once()
+    assert spool.pending() == 1
+
+
+def test_failed_write_is_spooled_then_replayed(spool):
+    stats = DatabaseInserter.write_rows(DatabaseWriter(pool_size=1, connect=unreachable), rows(1.0),
+                                        'cycle:1', spool=spool)
+    assert stats['spooled_rows'] == 1
+
+    con = SqliteConnection()
+    assert SpoolReplayer(spool, DatabaseWriter(pool_size=1, connect=lambda: con)).replay_once() == 1
+    cur = con.cursor()
+    cur.execute('SELECT snapshot_key FROM snapshot_log')
+    assert cur.fetchall() == [('cycle:1',)]
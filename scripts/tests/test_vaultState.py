@@ -0,0 +1,48 @@
+import pytest
+from util.tokensInfoEnumType import TokenDecimalsEnumType
+from vaultState import VaultState
+
+TOKENS = ('WBTC', 'WETH', 'USDC')
+PRICES = {'WBTC': 20000, 'WETH': 1500, 'USDC': 1}
+
+
+def token_info(token):
+    """
+    getVaultTokenInfoV2 fields of one token as the Reader returns them, in raw uint256
+    """
+    unit = 10 ** TokenDecimalsEnumType[token].value
+    price = PRICES[token] * 10 ** 30
+    return [1000 * unit, 250 * unit, 5 * 10 ** 24, 3 * unit, 25000, 10 * unit, 6 * 10 ** 24,
+            7 * 10 ** 36, 8 * 10 ** 36, price - 10 ** 28, price + 10 ** 28, 9 * 10 ** 35, price, price + 10 ** 28]
+
+
+@pytest.fixture
+def state():
+    return VaultState.decode([value for token in TOKENS for value in token_info(token)], TOKENS)
+
+
+def test_decode_matches_the_field_scales(state):
+    for token in TOKENS:
+        decimals = 10 ** TokenDecimalsEnumType[token].value
+        expected = [raw / (decimals if scale is None else scale)
+                    for raw, scale in zip(token_info(token), VaultState.SCALES)]
+        assert list(state.row(token).values()) == pytest.approx(expected)
+
+
+def test_values_above_int64(state):
+    assert state.row('WETH')['global_short_size'] == pytest.approx(7e6)
+    assert state.row('WETH')['usdg_amount'] == pytest.approx(5e6)
+    assert state.row('WBTC')['pool_amount'] == 1000.0
+
+
+def test_views(state):
+    assert state.prices() == pytest.approx(PRICES)
+    assert state.tokens_info()['USDC'] == pytest.approx({'pool_amount': 1000.0, 'reserved_amount': 250.0,
+                                                         'price_not_maximised': 1.0})
+    assert state.column('token_weight').tolist() == [25000.0] * 3
+    assert state.as_dict('max_price')['WBTC'] == pytest.approx(20000.01)
+
+
+def test_response_of_the_wrong_length():
+    with pytest.raises(ValueError):
+        VaultState.decode([1] * len(VaultState.FIELDS), TOKENS)
@@ -0,0 +1,200 @@
+import numpy as np
+import datetime
+from web3 import Web3
+from typing import Optional, List, Dict, Tuple, Iterable
+from dotenv import load_dotenv
+import os
+import time
+from util.tokensInfoEnumType import TokenAddressEnumType
+from util.contractInfoEnumType import ContractAddressEnumType, ContractAbiEnumType
+from web3.types import ChecksumAddress, BlockIdentifier
+from snapshotFetcher import OnChainSnapshotFetcher
+from web3Registry import Web3Registry
+from cycleCache import cached
+
+load_dotenv()
+
+# collateral of GMX shorts, longs are always collateralised with their index token
+STABLE_TOKENS: Tuple[str, ...] = ('USDC', 'USDT', 'DAI', 'FRAX')
+
+
+class TraderPositions:
+    """
+    Columnar view of Reader.getPositions for many accounts: one row per (account, collateral, index, side), one
+    column per field, USD values scaled from 30 decimals, profits and losses signed
+    """
+
+    FIELDS: Tuple[str, ...] = ('size', 'collateral', 'average_price', 'entry_funding_rate', 'realised_pnl',
+                               'last_increased_time', 'unrealised_pnl')
+    # Reader.POSITION_PROPS_LENGTH
+    PROPS_LENGTH: int = 9
+
+    TABLE: str = 'gmx_trader_position'
+    COLUMNS: str = ('created_date, updated_date, account, collateral_token, index_token, is_long, size, collateral, '
+                    'average_price, leverage, entry_funding_rate, realised_pnl, unrealised_pnl, last_increased_time')
+
+    def __init__(self, keys: List[Tuple[str, str, str, bool]], values: np.ndarray):
+        self.keys = keys
+        self.values = values
+
+    @classmethod
+    def decode(cls, response: List[int], keys: List[Tuple[str, str, str, bool]]) -> 'TraderPositions':
+        """
+        response: the flat getPositions arrays of keys, concatenated in the same order.
+        Per position: size, collateral, averagePrice, entryFundingRate, hasRealisedProfit, realisedPnl,
+        lastIncreasedTime, hasProfit, delta
+        """
+        raw = np.array(response, dtype=object).reshape(len(keys), cls.PROPS_LENGTH).astype(np.float64)
+        realised_sign = np.where(raw[:, 4] == 1, 1.0, -1.0)
+        delta_sign = np.where(raw[:, 7] == 1, 1.0, -1.0)
+        # entry funding rates are cumulative rates with FUNDING_RATE_PRECISION 1e6
+        values = np.column_stack([raw[:, 0] / 1e30, raw[:, 1] / 1e30, raw[:, 2] / 1e30, raw[:, 3] / 1e6,
+                                  realised_sign * raw[:, 5] / 1e30, raw[:, 6], delta_sign * raw[:, 8] / 1e30])
+
+        return cls(list(keys), values)
+
+    def column(self, field: str) -> np.ndarray:
+        return self.values[:, self.FIELDS.index(field)]
+
+    def open(self) -> 'TraderPositions':
+        is_open = self.column('size') > 0
+        return TraderPositions([key for key, kept in zip(self.keys, is_open.tolist()) if kept], self.values[is_open])
+
+    def exposure(self) -> Dict[str, Dict[str, float]]:
+        """
+        Open size per index token and side, in USD, the direct version of GLPDataFetcher.get_long_short
+        """
+        exposure: Dict[str, Dict[str, float]] = {}
+        for (_, _, index_token, is_long), size in zip(self.keys, self.column('size').tolist()):
+            side = exposure.setdefault(index_token, {'long': 0.0, 'short': 0.0})
+            side['long' if is_long else 'short'] += size
+
+        return exposure
+
+    @classmethod
+    def insert_sql(cls) -> str:
+        insert_string = ', '.join(['%s'] * len(cls.COLUMNS.split(',')))
+        return f'INSERT INTO {cls.TABLE} ({cls.COLUMNS}) VALUES ({insert_string})'
+
+    def rows(self, created_time: Optional[datetime.datetime] = None) -> List[List]:
+        """
+        Rows of the open positions for gmx_trader_position
+        """
+        created_time = created_time if created_time is not None else datetime.datetime.now()
+        positions = self.open()
+        rows: List[List] = []
+
+        for key, values in zip(positions.keys, positions.values.tolist()):
+            account, collateral_token, index_token, is_long = key
+            size, collateral, average_price, entry_funding_rate, realised_pnl, last_increased_time, unrealised_pnl = \
+                values
+            rows.append([created_time, created_time, account, collateral_token, index_token, is_long, size,
+                         collateral, average_price, size / collateral if collateral > 0 else 0, entry_funding_rate,
+                         realised_pnl, unrealised_pnl, datetime.datetime.fromtimestamp(last_increased_time)])
+
+        return rows
+
+
+class TraderPositionFetcher:
+
+    def __init__(self, accounts: Iterable[str],
+                 infura_api_key: Optional[str] = os.getenv('INFURA_API_KEY'),
+                 index_tokens: Tuple[str, ...] = ('WBTC', 'WETH', 'LINK', 'UNI'),
+                 stable_tokens: Tuple[str, ...] = STABLE_TOKENS,
+                 conn: Optional[Web3] = None,
+                 multicall_adr: ChecksumAddress = ContractAddressEnumType.Multicall.value,
+                 block_identifier: BlockIdentifier = 'latest',
+                 gas_limit: int = 30_000_000,
+                 gas_per_position: int = 30_000):
+        """
+        Reads every GMX position of the accounts, longs on each index token and shorts on each index token with
+        each stable collateral. getPositions calls of several accounts share one Multicall aggregate, as many
+        positions per aggregate as gas_limit / gas_per_position allows (getPosition and getDelta cost about
+        gas_per_position each); an aggregate the node still rejects is split in two
+        """
+        if conn is None:
+            conn = Web3Registry.get_connection(Web3Registry.infura_url(infura_api_key))
+
+        self.conn = conn
+        self.accounts: Tuple[ChecksumAddress, ...] = tuple(Web3.toChecksumAddress(account) for account in accounts)
+        self.block_identifier = block_identifier
+        self.positions_per_call = max(1, gas_limit // gas_per_position)
+        self.combinations: List[Tuple[str, str, bool]] = \
+            [(token, token, True) for token in index_tokens] + \
+            [(stable, token, False) for token in index_tokens for stable in stable_tokens]
+        self._cache_key = (self.accounts, tuple(self.combinations), multicall_adr, id(conn), block_identifier)
+        self.multicall = Web3Registry.get_contract(self.conn, multicall_adr, ContractAbiEnumType.Multicall)
+
+    def _build_calls(self) -> List[Tuple[List[Tuple[str, str, str, bool]],
+                                         Tuple[str, ChecksumAddress, bytes, List[str]]]]:
+        """
+        (position keys, call) pairs, one getPositions call per account, or several when an account alone has more
+        combinations than fit in one aggregate
+        """
+        calls = []
+        reader = (ContractAddressEnumType.Reader.value, ContractAbiEnumType.Reader)
+        step = min(len(self.combinations), self.positions_per_call)
+
+        for account in self.accounts:
+            for offset in range(0, len(self.combinations), step):
+                combinations = self.combinations[offset:offset + step]
+                args = [ContractAddressEnumType.vault.value, account,
+                        [TokenAddressEnumType[collateral].value for collateral, _, _ in combinations],
+                        [TokenAddressEnumType[index].value for _, index, _ in combinations],
+                        [is_long for _, _, is_long in combinations]]
+                keys = [(account, collateral, index, is_long) for collateral, index, is_long in combinations]
+                calls.append((keys, (f'{account}:{offset}',
+                                     *OnChainSnapshotFetcher._encode(*reader, 'getPositions', args))))
+
+        return calls
+
+    def _chunks(self, calls: List) -> List[List]:
+        chunks: List[List] = [[]]
+        positions = 0
+        for keys, call in calls:
+            if chunks[-1] and positions + len(keys) > self.positions_per_call:
+                chunks.append([])
+                positions = 0
+            chunks[-1].append((keys, call))
+            positions += len(keys)
+
+        return chunks
+
+    def _aggregate(self, chunk: List, block_identifier: BlockIdentifier) -> List[int]:
+        try:
+            _, return_data = self.multicall.functions.aggregate(
+                [(target, call_data) for _, (_, target, call_data, _) in chunk]).call(block_identifier=block_identifier)
+        except ValueError:
+            if len(chunk) == 1:
+                raise
+            middle = len(chunk) // 2
+            return self._aggregate(chunk[:middle], block_identifier) + self._aggregate(chunk[middle:],
+                                                                                       block_identifier)
+
+        raw = OnChainSnapshotFetcher._decode([call for _, call in chunk], return_data)
+        return [value for _, (key, _, _, _) in chunk for value in raw[key]]
+
+    @cached('infura')
+    def get_positions(self) -> TraderPositions:
+        calls = self._build_calls()
+        # the chunks must not straddle two blocks
+        block_identifier = self.block_identifier
+        if block_identifier == 'latest':
+            block_identifier = self.conn.eth.block_number
+
+        response: List[int] = []
+        keys: List[Tuple[str, str, str, bool]] = []
+        for chunk in self._chunks(calls):
+            response.extend(self._aggregate(chunk, block_identifier))
+            keys.extend(key for chunk_keys, _ in chunk for key in chunk_keys)
+
+        return TraderPositions.decode(response, keys)
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    test = TraderPositionFetcher(accounts=os.getenv('GMX_TRADER_ACCOUNTS', os.getenv('WALLET_ADDRESS')).split(','))
+    positions = test.get_positions()
+    print(positions.exposure())
+    print(positions.rows())
+    print(f'process time is: {time.time() - start_time}')
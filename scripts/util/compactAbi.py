@@ -0,0 +1,383 @@
+# Generated by buildAbis.py from contractInfoEnumType.py and tokensInfoEnumType.py, do not edit.
+# Only the fragments the scripts use are kept, rerun buildAbis.py after calling a new function
+from typing import Dict, List, Tuple
+
+ABIS: Dict[str, List[Dict]] = {'ContractAbiEnumType.GLPManager': [{'inputs': [{'name': 'maximise', 'type': 'bool'}],
+                                     'name': 'getAum',
+                                     'outputs': [{'name': '', 'type': 'uint256'}],
+                                     'stateMutability': 'view',
+                                     'type': 'function'}],
+ 'ContractAbiEnumType.vault': [{'anonymous': False,
+                                'inputs': [{'indexed': False, 'name': 'token', 'type': 'address'},
+                                           {'indexed': False, 'name': 'amount', 'type': 'uint256'}],
+                                'name': 'DecreasePoolAmount',
+                                'type': 'event'},
+                               {'anonymous': False,
+                                'inputs': [{'indexed': False, 'name': 'token', 'type': 'address'},
+                                           {'indexed': False, 'name': 'amount', 'type': 'uint256'}],
+                                'name': 'DecreaseReservedAmount',
+                                'type': 'event'},
+                               {'anonymous': False,
+                                'inputs': [{'indexed': False, 'name': 'token', 'type': 'address'},
+                                           {'indexed': False, 'name': 'amount', 'type': 'uint256'}],
+                                'name': 'IncreasePoolAmount',
+                                'type': 'event'},
+                               {'anonymous': False,
+                                'inputs': [{'indexed': False, 'name': 'token', 'type': 'address'},
+                                           {'indexed': False, 'name': 'amount', 'type': 'uint256'}],
+                                'name': 'IncreaseReservedAmount',
+                                'type': 'event'},
+                               {'inputs': [{'name': '_token', 'type': 'address'}],
+                                'name': 'getMinPrice',
+                                'outputs': [{'name': '', 'type': 'uint256'}],
+                                'stateMutability': 'view',
+                                'type': 'function'}],
+ 'ContractAbiEnumType.StakedGmxTracker': [{'anonymous': False,
+                                           'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+                                                      {'indexed': True, 'name': 'to', 'type': 'address'},
+                                                      {'indexed': False, 'name': 'value', 'type': 'uint256'}],
+                                           'name': 'Transfer',
+                                           'type': 'event'},
+                                          {'inputs': [{'name': '', 'type': 'address'}, {'name': '', 'type': 'address'}],
+                                           'name': 'depositBalances',
+                                           'outputs': [{'name': '', 'type': 'uint256'}],
+                                           'stateMutability': 'view',
+                                           'type': 'function'},
+                                          {'inputs': [{'name': '', 'type': 'address'}],
+                                           'name': 'stakedAmounts',
+                                           'outputs': [{'name': '', 'type': 'uint256'}],
+                                           'stateMutability': 'view',
+                                           'type': 'function'}],
+ 'ContractAbiEnumType.FeeGlpTracker': [{'anonymous': False,
+                                        'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+                                                   {'indexed': True, 'name': 'to', 'type': 'address'},
+                                                   {'indexed': False, 'name': 'value', 'type': 'uint256'}],
+                                        'name': 'Transfer',
+                                        'type': 'event'},
+                                       {'inputs': [{'name': '_account', 'type': 'address'}],
+                                        'name': 'claimable',
+                                        'outputs': [{'name': '', 'type': 'uint256'}],
+                                        'stateMutability': 'view',
+                                        'type': 'function'},
+                                       {'inputs': [{'name': '', 'type': 'address'}, {'name': '', 'type': 'address'}],
+                                        'name': 'depositBalances',
+                                        'outputs': [{'name': '', 'type': 'uint256'}],
+                                        'stateMutability': 'view',
+                                        'type': 'function'},
+                                       {'inputs': [{'name': '', 'type': 'address'}],
+                                        'name': 'stakedAmounts',
+                                        'outputs': [{'name': '', 'type': 'uint256'}],
+                                        'stateMutability': 'view',
+                                        'type': 'function'}],
+ 'ContractAbiEnumType.Reader': [{'inputs': [{'name': '_vault', 'type': 'address'},
+                                            {'name': '_account', 'type': 'address'},
+                                            {'name': '_collateralTokens', 'type': 'address[]'},
+                                            {'name': '_indexTokens', 'type': 'address[]'},
+                                            {'name': '_isLong', 'type': 'bool[]'}],
+                                 'name': 'getPositions',
+                                 'outputs': [{'name': '', 'type': 'uint256[]'}],
+                                 'stateMutability': 'view',
+                                 'type': 'function'},
+                                {'inputs': [{'name': '_account', 'type': 'address'},
+                                            {'name': '_tokens', 'type': 'address[]'}],
+                                 'name': 'getTokenBalances',
+                                 'outputs': [{'name': '', 'type': 'uint256[]'}],
+                                 'stateMutability': 'view',
+                                 'type': 'function'},
+                                {'inputs': [{'name': '_vault', 'type': 'address'},
+                                            {'name': '_weth', 'type': 'address'},
+                                            {'name': '_usdgAmount', 'type': 'uint256'},
+                                            {'name': '_tokens', 'type': 'address[]'}],
+                                 'name': 'getVaultTokenInfoV2',
+                                 'outputs': [{'name': '', 'type': 'uint256[]'}],
+                                 'stateMutability': 'view',
+                                 'type': 'function'}],
+ 'ContractAbiEnumType.RewardReader': [{'inputs': [{'name': '_account', 'type': 'address'},
+                                                  {'name': '_depositTokens', 'type': 'address[]'},
+                                                  {'name': '_rewardTrackers', 'type': 'address[]'}],
+                                       'name': 'getDepositBalances',
+                                       'outputs': [{'name': '', 'type': 'uint256[]'}],
+                                       'stateMutability': 'view',
+                                       'type': 'function'},
+                                      {'inputs': [{'name': '_account', 'type': 'address'},
+                                                  {'name': '_rewardTrackers', 'type': 'address[]'}],
+                                       'name': 'getStakingInfo',
+                                       'outputs': [{'name': '', 'type': 'uint256[]'}],
+                                       'stateMutability': 'view',
+                                       'type': 'function'}],
+ 'ContractAbiEnumType.Multicall': [{'inputs': [{'components': [{'name': 'target', 'type': 'address'},
+                                                               {'name': 'callData', 'type': 'bytes'}],
+                                                'name': 'calls',
+                                                'type': 'tuple[]'}],
+                                    'name': 'aggregate',
+                                    'outputs': [{'name': 'blockNumber', 'type': 'uint256'},
+                                                {'name': 'returnData', 'type': 'bytes[]'}],
+                                    'stateMutability': 'payable',
+                                    'type': 'function'},
+                                   {'inputs': [],
+                                    'name': 'getBlockNumber',
+                                    'outputs': [{'name': 'blockNumber', 'type': 'uint256'}],
+                                    'stateMutability': 'view',
+                                    'type': 'function'},
+                                   {'inputs': [],
+                                    'name': 'getCurrentBlockTimestamp',
+                                    'outputs': [{'name': 'timestamp', 'type': 'uint256'}],
+                                    'stateMutability': 'view',
+                                    'type': 'function'},
+                                   {'inputs': [{'name': 'addr', 'type': 'address'}],
+                                    'name': 'getEthBalance',
+                                    'outputs': [{'name': 'balance', 'type': 'uint256'}],
+                                    'stateMutability': 'view',
+                                    'type': 'function'}],
+ 'TokenAbiEnumType.WBTC': [{'anonymous': False,
+                            'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+                                       {'indexed': True, 'name': 'to', 'type': 'address'},
+                                       {'indexed': False, 'name': 'value', 'type': 'uint256'},
+                                       {'indexed': False, 'name': 'data', 'type': 'bytes'}],
+                            'name': 'Transfer',
+                            'type': 'event'},
+                           {'anonymous': False,
+                            'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+                                       {'indexed': True, 'name': 'to', 'type': 'address'},
+                                       {'indexed': False, 'name': 'value', 'type': 'uint256'}],
+                            'name': 'Transfer',
+                            'type': 'event'},
+                           {'inputs': [{'name': 'account', 'type': 'address'}],
+                            'name': 'balanceOf',
+                            'outputs': [{'name': '', 'type': 'uint256'}],
+                            'stateMutability': 'view',
+                            'type': 'function'},
+                           {'inputs': [],
+                            'name': 'decimals',
+                            'outputs': [{'name': '', 'type': 'uint8'}],
+                            'stateMutability': 'view',
+                            'type': 'function'},
+                           {'inputs': [],
+                            'name': 'totalSupply',
+                            'outputs': [{'name': '', 'type': 'uint256'}],
+                            'stateMutability': 'view',
+                            'type': 'function'}],
+ 'TokenAbiEnumType.FRAX': [{'anonymous': False,
+                            'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+                                       {'indexed': True, 'name': 'to', 'type': 'address'},
+                                       {'indexed': False, 'name': 'value', 'type': 'uint256'}],
+                            'name': 'Transfer',
+                            'type': 'event'},
+                           {'inputs': [{'name': 'account', 'type': 'address'}],
+                            'name': 'balanceOf',
+                            'outputs': [{'name': '', 'type': 'uint256'}],
+                            'stateMutability': 'view',
+                            'type': 'function'},
+                           {'inputs': [],
+                            'name': 'decimals',
+                            'outputs': [{'name': '', 'type': 'uint8'}],
+                            'stateMutability': 'view',
+                            'type': 'function'},
+                           {'inputs': [],
+                            'name': 'totalSupply',
+                            'outputs': [{'name': '', 'type': 'uint256'}],
+                            'stateMutability': 'view',
+                            'type': 'function'}],
+ 'TokenAbiEnumType.WETH': [{'anonymous': False,
+                            'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+                                       {'indexed': True, 'name': 'to', 'type': 'address'},
+                                       {'indexed': False, 'name': 'value', 'type': 'uint256'},
+                                       {'indexed': False, 'name': 'data', 'type': 'bytes'}],
+                            'name': 'Transfer',
+                            'type': 'event'},
+                           {'anonymous': False,
+                            'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+                                       {'indexed': True, 'name': 'to', 'type': 'address'},
+                                       {'indexed': False, 'name': 'value', 'type': 'uint256'}],
+                            'name': 'Transfer',
+                            'type': 'event'},
+                           {'inputs': [{'name': 'account', 'type': 'address'}],
+                            'name': 'balanceOf',
+                            'outputs': [{'name': '', 'type': 'uint256'}],
+                            'stateMutability': 'view',
+                            'type': 'function'},
+                           {'inputs': [],
+                            'name': 'decimals',
+                            'outputs': [{'name': '', 'type': 'uint8'}],
+                            'stateMutability': 'view',
+                            'type': 'function'},
+                           {'inputs': [],
+                            'name': 'totalSupply',
+                            'outputs': [{'name': '', 'type': 'uint256'}],
+                            'stateMutability': 'view',
+                            'type': 'function'}],
+ 'TokenAbiEnumType.DAI': [{'anonymous': False,
+                           'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+                                      {'indexed': True, 'name': 'to', 'type': 'address'},
+                                      {'indexed': False, 'name': 'value', 'type': 'uint256'}],
+                           'name': 'Transfer',
+                           'type': 'event'},
+                          {'inputs': [{'name': '', 'type': 'address'}],
+                           'name': 'balanceOf',
+                           'outputs': [{'name': '', 'type': 'uint256'}],
+                           'stateMutability': 'view',
+                           'type': 'function'},
+                          {'inputs': [],
+                           'name': 'decimals',
+                           'outputs': [{'name': '', 'type': 'uint8'}],
+                           'stateMutability': 'view',
+                           'type': 'function'},
+                          {'inputs': [],
+                           'name': 'totalSupply',
+                           'outputs': [{'name': '', 'type': 'uint256'}],
+                           'stateMutability': 'view',
+                           'type': 'function'}],
+ 'TokenAbiEnumType.USDC': [{'anonymous': False,
+                            'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+                                       {'indexed': True, 'name': 'to', 'type': 'address'},
+                                       {'indexed': False, 'name': 'value', 'type': 'uint256'},
+                                       {'indexed': False, 'name': 'data', 'type': 'bytes'}],
+                            'name': 'Transfer',
+                            'type': 'event'},
+                           {'anonymous': False,
+                            'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+                                       {'indexed': True, 'name': 'to', 'type': 'address'},
+                                       {'indexed': False, 'name': 'value', 'type': 'uint256'}],
+                            'name': 'Transfer',
+                            'type': 'event'},
+                           {'inputs': [{'name': 'account', 'type': 'address'}],
+                            'name': 'balanceOf',
+                            'outputs': [{'name': '', 'type': 'uint256'}],
+                            'stateMutability': 'view',
+                            'type': 'function'},
+                           {'inputs': [],
+                            'name': 'decimals',
+                            'outputs': [{'name': '', 'type': 'uint8'}],
+                            'stateMutability': 'view',
+                            'type': 'function'},
+                           {'inputs': [],
+                            'name': 'totalSupply',
+                            'outputs': [{'name': '', 'type': 'uint256'}],
+                            'stateMutability': 'view',
+                            'type': 'function'}],
+ 'TokenAbiEnumType.USDT': [{'anonymous': False,
+                            'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+                                       {'indexed': True, 'name': 'to', 'type': 'address'},
+                                       {'indexed': False, 'name': 'value', 'type': 'uint256'}],
+                            'name': 'Transfer',
+                            'type': 'event'},
+                           {'inputs': [{'name': 'account', 'type': 'address'}],
+                            'name': 'balanceOf',
+                            'outputs': [{'name': '', 'type': 'uint256'}],
+                            'stateMutability': 'view',
+                            'type': 'function'},
+                           {'inputs': [],
+                            'name': 'decimals',
+                            'outputs': [{'name': '', 'type': 'uint8'}],
+                            'stateMutability': 'view',
+                            'type': 'function'},
+                           {'inputs': [],
+                            'name': 'totalSupply',
+                            'outputs': [{'name': '', 'type': 'uint256'}],
+                            'stateMutability': 'view',
+                            'type': 'function'}],
+ 'TokenAbiEnumType.GMX': [{'anonymous': False,
+                           'inputs': [{'indexed': True, 'name': 'from', 'type': 'address'},
+                                      {'indexed': True, 'name': 'to', 'type': 'address'},
+                                      {'indexed': False, 'name': 'value', 'type': 'uint256'}],
+                           'name': 'Transfer',
+                           'type': 'event'},
+                          {'inputs': [{'name': '_account', 'type': 'address'}],
+                           'name': 'balanceOf',
+                           'outputs': [{'name': '', 'type': 'uint256'}],
+                           'stateMutability': 'view',
+                           'type': 'function'},
+                          {'inputs': [],
+                           'name': 'decimals',
+                           'outputs': [{'name': '', 'type': 'uint8'}],
+                           'stateMutability': 'view',
+                           'type': 'function'},
+                          {'inputs': [],
+                           'name': 'totalSupply',
+                           'outputs': [{'name': '', 'type': 'uint256'}],
+                           'stateMutability': 'view',
+                           'type': 'function'}]}
+
+# abi key -> function or event name -> (selector or topic, input types, output types)
+SELECTORS: Dict[str, Dict[str, Tuple]] = {'ContractAbiEnumType.FeeGlpTracker': {'Transfer': ('0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+                                                    ('address', 'address', 'uint256'),
+                                                    ()),
+                                       'claimable': ('0x402914f5', ('address',), ('uint256',)),
+                                       'depositBalances': ('0xf5d9d63e', ('address', 'address'), ('uint256',)),
+                                       'stakedAmounts': ('0x10c1c103', ('address',), ('uint256',))},
+ 'ContractAbiEnumType.GLPManager': {'getAum': ('0x03391476', ('bool',), ('uint256',))},
+ 'ContractAbiEnumType.Multicall': {'aggregate': ('0x252dba42', ('(address,bytes)[]',), ('uint256', 'bytes[]')),
+                                   'getBlockNumber': ('0x42cbb15c', (), ('uint256',)),
+                                   'getCurrentBlockTimestamp': ('0x0f28c97d', (), ('uint256',)),
+                                   'getEthBalance': ('0x4d2301cc', ('address',), ('uint256',))},
+ 'ContractAbiEnumType.Reader': {'getPositions': ('0xdc383cab',
+                                                 ('address', 'address', 'address[]', 'address[]', 'bool[]'),
+                                                 ('uint256[]',)),
+                                'getTokenBalances': ('0xd802178e', ('address', 'address[]'), ('uint256[]',)),
+                                'getVaultTokenInfoV2': ('0x8e83ca32',
+                                                        ('address', 'address', 'uint256', 'address[]'),
+                                                        ('uint256[]',))},
+ 'ContractAbiEnumType.RewardReader': {'getDepositBalances': ('0x575157e4',
+                                                             ('address', 'address[]', 'address[]'),
+                                                             ('uint256[]',)),
+                                      'getStakingInfo': ('0x937a0be8', ('address', 'address[]'), ('uint256[]',))},
+ 'ContractAbiEnumType.StakedGmxTracker': {'Transfer': ('0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+                                                       ('address', 'address', 'uint256'),
+                                                       ()),
+                                          'depositBalances': ('0xf5d9d63e', ('address', 'address'), ('uint256',)),
+                                          'stakedAmounts': ('0x10c1c103', ('address',), ('uint256',))},
+ 'ContractAbiEnumType.vault': {'DecreasePoolAmount': ('0x112726233fbeaeed0f5b1dba5cb0b2b81883dee49fb35ff99fd98ed9f6d31eb0',
+                                                      ('address', 'uint256'),
+                                                      ()),
+                               'DecreaseReservedAmount': ('0x533cb5ed32be6a90284e96b5747a1bfc2d38fdb5768a6b5f67ff7d62144ed67b',
+                                                          ('address', 'uint256'),
+                                                          ()),
+                               'IncreasePoolAmount': ('0x976177fbe09a15e5e43f848844963a42b41ef919ef17ff21a17a5421de8f4737',
+                                                      ('address', 'uint256'),
+                                                      ()),
+                               'IncreaseReservedAmount': ('0xaa5649d82f5462be9d19b0f2b31a59b2259950a6076550bac9f3a1c07db9f66d',
+                                                          ('address', 'uint256'),
+                                                          ()),
+                               'getMinPrice': ('0x81a612d6', ('address',), ('uint256',))},
+ 'TokenAbiEnumType.DAI': {'Transfer': ('0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+                                       ('address', 'address', 'uint256'),
+                                       ()),
+                          'balanceOf': ('0x70a08231', ('address',), ('uint256',)),
+                          'decimals': ('0x313ce567', (), ('uint8',)),
+                          'totalSupply': ('0x18160ddd', (), ('uint256',))},
+ 'TokenAbiEnumType.FRAX': {'Transfer': ('0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+                                        ('address', 'address', 'uint256'),
+                                        ()),
+                           'balanceOf': ('0x70a08231', ('address',), ('uint256',)),
+                           'decimals': ('0x313ce567', (), ('uint8',)),
+                           'totalSupply': ('0x18160ddd', (), ('uint256',))},
+ 'TokenAbiEnumType.GMX': {'Transfer': ('0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+                                       ('address', 'address', 'uint256'),
+                                       ()),
+                          'balanceOf': ('0x70a08231', ('address',), ('uint256',)),
+                          'decimals': ('0x313ce567', (), ('uint8',)),
+                          'totalSupply': ('0x18160ddd', (), ('uint256',))},
+ 'TokenAbiEnumType.USDC': {'Transfer': ('0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+                                        ('address', 'address', 'uint256'),
+                                        ()),
+                           'balanceOf': ('0x70a08231', ('address',), ('uint256',)),
+                           'decimals': ('0x313ce567', (), ('uint8',)),
+                           'totalSupply': ('0x18160ddd', (), ('uint256',))},
+ 'TokenAbiEnumType.USDT': {'Transfer': ('0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+                                        ('address', 'address', 'uint256'),
+                                        ()),
+                           'balanceOf': ('0x70a08231', ('address',), ('uint256',)),
+                           'decimals': ('0x313ce567', (), ('uint8',)),
+                           'totalSupply': ('0x18160ddd', (), ('uint256',))},
+ 'TokenAbiEnumType.WBTC': {'Transfer': ('0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+                                        ('address', 'address', 'uint256'),
+                                        ()),
+                           'balanceOf': ('0x70a08231', ('address',), ('uint256',)),
+                           'decimals': ('0x313ce567', (), ('uint8',)),
+                           'totalSupply': ('0x18160ddd', (), ('uint256',))},
+ 'TokenAbiEnumType.WETH': {'Transfer': ('0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+                                        ('address', 'address', 'uint256'),
+                                        ()),
+                           'balanceOf': ('0x70a08231', ('address',), ('uint256',)),
+                           'decimals': ('0x313ce567', (), ('uint8',)),
+                           'totalSupply': ('0x18160ddd', (), ('uint256',))}}
@@ -0,0 +1,90 @@
+import numpy as np
+from typing import Dict, Iterable, List, Tuple
+from web3 import Web3
+from web3.types import BlockIdentifier
+import time
+from util.tokensInfoEnumType import TokenAddressEnumType, TokenDecimalsEnumType
+from util.contractInfoEnumType import ContractAddressEnumType, ContractAbiEnumType
+from web3Registry import Web3Registry
+from cycleCache import cached
+
+
+class VaultState:
+    """
+    Columnar view of Reader.getVaultTokenInfoV2: one row per token, one column per field, already scaled to
+    token units (token decimals), USDG (18 decimals) or USD (30 decimals)
+    """
+
+    FIELDS: Tuple[str, ...] = ('pool_amount', 'reserved_amount', 'usdg_amount', 'redemption_amount', 'token_weight',
+                               'buffer_amount', 'max_usdg_amount', 'global_short_size', 'max_global_short_size',
+                               'min_price', 'max_price', 'guaranteed_usd', 'price_not_maximised', 'price_maximised')
+    # None marks columns in token decimals
+    SCALES: Tuple = (None, None, 1e18, None, 1, None, 1e18, 1e30, 1e30, 1e30, 1e30, 1e30, 1e30, 1e30)
+
+    _TOKEN_COLUMNS = np.array([scale is None for scale in SCALES])
+    _FIXED_SCALES = np.array([1 if scale is None else scale for scale in SCALES], dtype=np.float64)
+
+    def __init__(self, tokens: Tuple[str, ...], values: np.ndarray):
+        self.tokens = tokens
+        self.values = values
+        self._index: Dict[str, int] = {token: i for i, token in enumerate(tokens)}
+
+    @classmethod
+    def decode(cls, response: List[int], tokens: Iterable[str]) -> 'VaultState':
+        tokens = tuple(tokens)
+        # uint256 values overflow int64, go through Python ints once then scale everything in one step
+        raw = np.array(response, dtype=object).reshape(len(tokens), len(cls.FIELDS)).astype(np.float64)
+        token_scales = np.array([10.0 ** TokenDecimalsEnumType[token].value for token in tokens])
+        scales = np.where(cls._TOKEN_COLUMNS[None, :], token_scales[:, None], cls._FIXED_SCALES[None, :])
+
+        return cls(tokens, raw / scales)
+
+    @classmethod
+    @cached('infura')
+    def fetch(cls, conn: Web3, tokens: Tuple[str, ...],
+              block_identifier: BlockIdentifier = 'latest') -> 'VaultState':
+        reader = Web3Registry.get_contract(conn, ContractAddressEnumType.Reader.value, ContractAbiEnumType.Reader)
+        token_adr: List[str] = [TokenAddressEnumType[token].value for token in tokens]
+        # usdg amount 0 is only used by vault.getRedemptionAmount(token, _usdgAmount)
+        response = reader.functions.getVaultTokenInfoV2(ContractAddressEnumType.vault.value,
+                                                        TokenAddressEnumType.WETH.value, 0, token_adr).call(
+            block_identifier=block_identifier)
+
+        return cls.decode(response, tokens)
+
+    def column(self, field: str) -> np.ndarray:
+        return self.values[:, self.FIELDS.index(field)]
+
+    def as_dict(self, field: str) -> Dict[str, float]:
+        return dict(zip(self.tokens, self.column(field).tolist()))
+
+    def row(self, token: str) -> Dict[str, float]:
+        return dict(zip(self.FIELDS, self.values[self._index[token]].tolist()))
+
+    def tokens_info(self) -> Dict[str, Dict[str, float]]:
+        """
+        Same shape as GLPDataFetcher.tokens_info
+        """
+        columns = self.values[:, [0, 1, 12]].tolist()
+        return {token: {'pool_amount': pool_amount, 'reserved_amount': reserved_amount,
+                        'price_not_maximised': price_not_maximised}
+                for token, (pool_amount, reserved_amount, price_not_maximised) in zip(self.tokens, columns)}
+
+    def prices(self) -> Dict[str, float]:
+        """
+        Same shape as PriceFetcher.get_assets_price_gmx
+        """
+        return self.as_dict('price_not_maximised')
+
+
+if __name__ == '__main__':
+    import os
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    start_time = time.time()
+    state = VaultState.fetch(Web3Registry.get_connection(Web3Registry.infura_url(os.getenv('INFURA_API_KEY'))),
+                             ('WBTC', 'WETH', 'LINK', 'UNI', 'FRAX', 'USDT', 'USDC', 'DAI'))
+    print(state.tokens_info())
+    print(state.row('WETH'))
+    print(f'process time is: {time.time() - start_time}')
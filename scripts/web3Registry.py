@@ -0,0 +1,94 @@
+from web3 import HTTPProvider, Web3
+from web3.contract import Contract
+from web3.types import ChecksumAddress
+from enum import Enum
+from typing import Dict, List, Tuple, Optional
+import threading
+import json
+import time
+import os
+from util.contractInfoEnumType import ContractAddressEnumType, ContractAbiEnumType
+from util.compactAbi import ABIS
+from metrics import web3_metrics_middleware
+from rpcPool import RpcEndpointPool, pooled_session
+
+
+class Web3Registry:
+    """
+    Process-wide registry of Web3 connections and contract objects. Every RPC endpoint gets one pooled keep-alive
+    HTTP session and every (connection, address, abi) contract is built once. A comma-separated endpoint, e.g. the
+    RPC_URLS environment variable, gets an RpcEndpointPool failing over between its URLs. Contracts are built from the compact
+    ABIs of util/compactAbi.py (see buildAbis.py), the full ABI strings in util/ are only parsed as a fallback
+    """
+
+    INFURA_ARBITRUM_URL: str = 'https://arbitrum-mainnet.infura.io/v3/'
+
+    _connections: Dict[str, Web3] = {}
+    _abis: Dict[str, List] = {}
+    _contracts: Dict[Tuple[Web3, ChecksumAddress, str], Contract] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def infura_url(cls, infura_api_key: Optional[str]) -> str:
+        rpc_urls = os.getenv('RPC_URLS')
+        if rpc_urls:
+            return rpc_urls
+        return cls.INFURA_ARBITRUM_URL + infura_api_key  # type: ignore
+
+    @classmethod
+    def get_connection(cls, endpoint_uri: str, pool_maxsize: int = 16) -> Web3:
+        with cls._lock:
+            if endpoint_uri not in cls._connections:
+                if ',' in endpoint_uri:
+                    provider = RpcEndpointPool([uri.strip() for uri in endpoint_uri.split(',') if uri.strip()],
+                                               pool_maxsize=pool_maxsize)
+                else:
+                    provider = HTTPProvider(endpoint_uri, session=pooled_session(pool_maxsize))
+                conn = Web3(provider)
+                conn.middleware_onion.add(web3_metrics_middleware, 'metrics')
+                cls._connections[endpoint_uri] = conn
+
+            return cls._connections[endpoint_uri]
+
+    @classmethod
+    def get_abi(cls, abi: Enum) -> List:
+        abi_key = f'{abi.__class__.__name__}.{abi.name}'
+        if abi_key not in cls._abis:
+            cls._abis[abi_key] = ABIS[abi_key] if abi_key in ABIS else json.loads(abi.value)
+
+        return cls._abis[abi_key]
+
+    @classmethod
+    def get_contract(cls, conn: Web3, address: ChecksumAddress, abi: Enum) -> Contract:
+        """
+        abi: member of TokenAbiEnumType / ContractAbiEnumType
+        """
+        key = (conn, address, f'{abi.__class__.__name__}.{abi.name}')
+        contract = cls._contracts.get(key)
+
+        if contract is None:
+            with cls._lock:
+                contract = conn.eth.contract(address=address, abi=cls.get_abi(abi))
+                cls._contracts[key] = contract
+
+        return contract
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._connections.clear()
+            cls._abis.clear()
+            cls._contracts.clear()
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    conn = Web3Registry.get_connection(Web3Registry.infura_url(os.getenv('INFURA_API_KEY')))
+    start_time = time.time()
+    Web3Registry.get_contract(conn, ContractAddressEnumType.Reader.value, ContractAbiEnumType.Reader)
+    print(f'first build: {time.time() - start_time}')
+    start_time = time.time()
+    Web3Registry.get_contract(conn, ContractAddressEnumType.Reader.value, ContractAbiEnumType.Reader)
+    print(f'cached: {time.time() - start_time}')